@@ -1,12 +1,27 @@
 import os
+import sys
 import time
 import json
+import uuid
 import requests
 import google.generativeai as genai
 from google.cloud import pubsub_v1
 from google.cloud import firestore
 from dotenv import load_dotenv
 
+import metrics
+import telegram_webhook
+import chat_dispatcher
+import conversation_store
+import intent_fastpath
+import telegram_client
+import digest
+import bulk_actions
+import quota
+import message_debouncer
+import tombstones
+import database
+
 # --- Configuração Inicial ---
 load_dotenv()
 print("\n🔥 --- AGENTE 0: O PORTEIRO (V5.2 - Híbrido Estável) ---")
@@ -18,17 +33,21 @@ PROJECT_ID = os.getenv("GCP_PROJECT_ID")
 
 # Tópicos
 TOPIC_AGENT_1 = "topic-discovery-input"   # Busca Original (Texto)
-TOPIC_AGENT_3 = "topic-enricher"          # NOVO: Para mandar o comando do botão
+TOPIC_AGENT_3 = "topic-enricher-priority" # Faixa prioritária do Agente 3 (comando do botão)
+TOPIC_AGENT_4 = "topic-copy-generator"    # Copies (botão "Gerar Copies" e ações em lote)
 
 # Carrega lista de usuários permitidos
 ALLOWED_USERS_RAW = os.getenv("ALLOWED_USERS", "")
 ALLOWED_USERS = [id.strip() for id in ALLOWED_USERS_RAW.split(",") if id.strip()]
 
+# Modo de recebimento: "polling" (padrão) ou "webhook" (ver telegram_webhook.py)
+ROUTER_MODE = os.getenv("ROUTER_MODE", "polling").lower()
+POLL_TIMEOUT = int(os.getenv("ROUTER_POLL_TIMEOUT", "25"))  # Long-poll do getUpdates (s)
+
 # Modelo mantido
 MODELO_PREFERIDO = "gemini-2.5-flash" 
 
-# --- MEMÓRIA VOLÁTIL ---
-user_histories = {}
+# --- MEMÓRIA DE CONVERSA (ver conversation_store.py) ---
 HISTORY_LIMIT = 6
 
 # --- SEU TEMPLATE DE BUSCA ORIGINAL (Restaurado) ---
@@ -65,14 +84,17 @@ if not GEMINI_API_KEY:
 if not ALLOWED_USERS:
     print("⚠️ AVISO: Nenhuma lista de ALLOWED_USERS configurada.")
 
+db = None
 try:
     genai.configure(api_key=GEMINI_API_KEY)
     publisher = pubsub_v1.PublisherClient()
     
     # Tópico 1 (Busca)
     topic_path_1 = publisher.topic_path(PROJECT_ID, TOPIC_AGENT_1)
-    # Tópico 3 (Enriquecimento via Botão)
+    # Tópico 3 (Enriquecimento via Botão - fila prioritária, não espera o lote da Parte 1)
     topic_path_3 = publisher.topic_path(PROJECT_ID, TOPIC_AGENT_3)
+    # Tópico 4 (Copies)
+    topic_path_4 = publisher.topic_path(PROJECT_ID, TOPIC_AGENT_4)
     
     # Firestore (Para descartar leads direto no banco)
     db = firestore.Client(project=PROJECT_ID)
@@ -81,62 +103,64 @@ try:
 except Exception as e:
     print(f"❌ Erro config: {e}")
 
+# LRU + TTL por chat; persistente/compartilhada se CONVERSATION_BACKEND=sqlite|firestore
+conversations = conversation_store.from_env(db, HISTORY_LIMIT)
+
 last_update_id = 0
 
 # --- FUNÇÕES TELEGRAM ---
 
+# getUpdates com webhook registrado: 409 em toda chamada, retry não resolve
+WEBHOOK_CONFLICT = "webhook_conflict"
+
 def get_telegram_updates(offset=None):
+    """
+    Long-poll: o Telegram segura a conexão até chegar update.
+    None = erro de rede/API (vale retry); WEBHOOK_CONFLICT = há webhook ativo no bot.
+    """
     url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/getUpdates"
-    params = {"timeout": 10, "offset": offset}
+    params = {"timeout": POLL_TIMEOUT, "offset": offset, "allowed_updates": json.dumps(telegram_webhook.ALLOWED_UPDATES)}
     try:
-        response = requests.get(url, params=params)
-        return response.json()
+        response = requests.get(url, params=params, timeout=POLL_TIMEOUT + 10)
+        data = response.json()
+        if data.get("error_code") == 409:
+            print(f"❌ getUpdates recusado: {data.get('description')}")
+            return WEBHOOK_CONFLICT
+        return data if data.get("ok") else None
     except:
-        return {}
+        return None
 
 def send_telegram_message(chat_id, text):
-    try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-        payload = {"chat_id": chat_id, "text": str(text)}
-        requests.post(url, json=payload)
-    except: pass
+    # Texto puro, pela fila do cliente compartilhado (não segura o worker do chat)
+    telegram_client.send_message(chat_id, text, parse_mode=None, wait=False)
 
 def answer_callback(callback_query_id, text):
     """Responde ao clique do botão para parar o loading visual"""
-    try:
-        requests.post(f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/answerCallbackQuery", 
-                      json={"callback_query_id": callback_query_id, "text": text})
-    except: pass
+    telegram_client.answer_callback(callback_query_id, text)
 
 def edit_message_text(chat_id, message_id, text):
     """Edita a mensagem original para mostrar que foi processado"""
-    try:
-        requests.post(f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/editMessageText", 
-                      json={
-                          "chat_id": chat_id, 
-                          "message_id": message_id, 
-                          "text": text, 
-                          "parse_mode": "Markdown",
-                          "disable_web_page_preview": True
-                      })
-    except: pass
+    telegram_client.edit_message(chat_id, message_id, text, wait=False)
 
 # --- INTELIGÊNCIA (Idêntica ao Original) ---
 
 def update_history(chat_id, role, message):
-    if chat_id not in user_histories:
-        user_histories[chat_id] = []
-    user_histories[chat_id].append(f"{role}: {message}")
-    if len(user_histories[chat_id]) > HISTORY_LIMIT:
-        user_histories[chat_id] = user_histories[chat_id][-HISTORY_LIMIT:]
+    conversations.append(chat_id, role, message)
 
 def classify_intent_with_history(chat_id, current_text):
+    history = conversations.get(chat_id)
+
+    # Casos óbvios (saudação, agradecimento, pedido completo) e decisões já vistas
+    fast = intent_fastpath.classify(history, current_text)
+    if fast:
+        return fast
+
     try:
         model = genai.GenerativeModel(MODELO_PREFERIDO)
     except:
         model = genai.GenerativeModel('gemini-1.5-flash')
 
-    history_block = "\n".join(user_histories.get(chat_id, []))
+    history_block = "\n".join(history)
     
     prompt = f"""
     Você é um gerente de vendas experiente. Analise o histórico de conversa e a mensagem atual.
@@ -167,9 +191,12 @@ def classify_intent_with_history(chat_id, current_text):
     """
     
     try:
-        response = model.generate_content(prompt)
+        started = time.monotonic()
+        with metrics.timer("llm_call_seconds", provider="gemini", agent="agent_0"):
+            response = model.generate_content(prompt)
         text = response.text.replace('```json', '').replace('```', '').strip()
         data = json.loads(text)
+        intent_fastpath.remember(history, current_text, data, time.monotonic() - started)
         return data
     except Exception as e:
         print(f"⚠️ Erro IA: {e}")
@@ -183,7 +210,7 @@ def handle_callback_query(callback):
     chat_id = callback['message']['chat']['id']
     msg_id = callback['message']['message_id']
     data = callback['data'] # Ex: ENRICH:dominio.com
-    original_text = callback['message']['text']
+    original_text = callback['message'].get('text', '')
     
     if str(chat_id) not in ALLOWED_USERS:
         answer_callback(c_id, "⛔ Acesso Negado.")
@@ -192,17 +219,79 @@ def handle_callback_query(callback):
     print(f"🖱️ Clique: {data}")
 
     try:
+        if data.startswith("BULK_"):
+            handle_bulk_action(c_id, chat_id, data)
+            return
+
         action, domain = data.split(":", 1)
         doc_ref = db.collection("leads_b2b").document(domain)
 
+        # Orçamento diário de enriquecimentos do chat (cada um dispara ~10 chamadas pagas)
+        if action in ("ENRICH", "ENRICH_D") and not quota.allow_chat(chat_id, "enrich"):
+            answer_callback(c_id, "⛔ Limite diário de enriquecimentos atingido.")
+            return
+
         # 1. DESCARTAR (Resolve Localmente)
         if action == "DISCARD":
-            doc_ref.update({"status": "DISCARDED_BY_USER"})
+            with metrics.timer("firestore_op_seconds", op="update", collection="leads_b2b"):
+                doc_ref.update({"status": "DISCARDED_BY_USER"})
             answer_callback(c_id, "🗑 Descartado.")
             # Atualiza texto visualmente
             new_text = original_text + "\n\n❌ *DESCARTADO*"
             edit_message_text(chat_id, msg_id, new_text)
 
+        # 3. Botões do DIGEST (não edita a página: só o status do lead nela)
+        elif action in ("DISCARD_D", "ENRICH_D"):
+            with metrics.timer("firestore_op_seconds", op="get", collection="leads_b2b"):
+                snap = doc_ref.get()
+            search_id = (snap.to_dict() or {}).get("search_id") if snap.exists else None
+
+            if action == "DISCARD_D":
+                with metrics.timer("firestore_op_seconds", op="update", collection="leads_b2b"):
+                    doc_ref.update({"status": "DISCARDED_BY_USER"})
+                answer_callback(c_id, "🗑 Descartado.")
+                digest.mark_lead(search_id, domain, "discarded", immediate=True)
+            else:
+                answer_callback(c_id, "🚀 Enviando para Agente 3...")
+                payload = {
+                    "command": "FETCH_PEOPLE",
+                    "domain": domain,
+                    "chat_id": chat_id,
+                    "message_id": None,     # Resultado vem em mensagem nova (a página do digest fica)
+                    "search_id": search_id,
+                }
+                publisher.publish(topic_path_3, json.dumps(payload).encode("utf-8"))
+                # Status evita que o "Enriquecer top N" peça o mesmo lead de novo
+                with metrics.timer("firestore_op_seconds", op="update", collection="leads_b2b"):
+                    doc_ref.update({"status": "ENRICH_REQUESTED"})
+                digest.mark_lead(search_id, domain, "enriching", immediate=True)
+
+        # 4. GERAR COPIES (Manda para Agent 4)
+        elif action == "COPIES":
+            with metrics.timer("firestore_op_seconds", op="get", collection="leads_b2b"):
+                snap = doc_ref.get()
+            if not snap.exists:
+                answer_callback(c_id, "❌ Lead não encontrado.")
+                return
+            payload = bulk_actions.copy_payload(snap.to_dict(), chat_id)
+            publisher.publish(topic_path_4, json.dumps(payload).encode("utf-8"))
+            answer_callback(c_id, "✍️ Gerando copies...")
+
+        # 5. RESUMO DO LEAD (o Closer publica no HubSpot a partir do topic-closer-hubspot)
+        elif action == "HUBSPOT":
+            with metrics.timer("firestore_op_seconds", op="get", collection="leads_b2b"):
+                snap = doc_ref.get()
+            lead = snap.to_dict() if snap.exists else {}
+            answer_callback(c_id, "📋 Consultando...")
+            if lead.get("hubspot_url"):
+                send_telegram_message(chat_id, f"📋 {domain} no HubSpot: {lead['hubspot_url']}")
+            else:
+                send_telegram_message(
+                    chat_id,
+                    f"📋 {domain}: status {lead.get('status', 'N/D')} | score {lead.get('final_score', 'N/D')} | "
+                    f"{lead.get('contacts_found', 0)} contatos enviados ao Closer (HubSpot)."
+                )
+
         # 2. ENRIQUECER (Manda para Agent 3)
         elif action == "ENRICH":
             answer_callback(c_id, "🚀 Enviando para Agente 3...")
@@ -216,8 +305,10 @@ def handle_callback_query(callback):
                 "original_text_context": original_text
             }
             
-            # Publica no Tópico do Agente 3 (topic-enricher)
+            # Publica na faixa prioritária do Agente 3 (topic-enricher-priority)
             publisher.publish(topic_path_3, json.dumps(payload).encode("utf-8"))
+            with metrics.timer("firestore_op_seconds", op="update", collection="leads_b2b"):
+                doc_ref.update({"status": "ENRICH_REQUESTED"})
             
             # Feedback Visual
             new_text = original_text + "\n\n⏳ *Solicitando enriquecimento...*"
@@ -227,67 +318,228 @@ def handle_callback_query(callback):
         print(f"⚠️ Erro Callback: {e}")
         answer_callback(c_id, "Erro ao processar.")
 
+def handle_bulk_action(c_id, chat_id, data):
+    """BULK_ENRICH:<search_id>:<N> | BULK_DISCARD:<search_id> | BULK_COPIES:<search_id>"""
+    parts = data.split(":")
+    action, search_id = parts[0], parts[1]
+    print(f"📦 Ação em lote: {action} na busca {search_id}")
+
+    if action == "BULK_ENRICH":
+        top_n = int(parts[2]) if len(parts) > 2 else bulk_actions.BULK_ENRICH_TOP_N
+        # Conta os candidatos antes de gastar a cota: só paga pelo que vai de fato
+        domains = bulk_actions.top_pending(search_id, top_n)
+        if not domains:
+            answer_callback(c_id, "⚠️ Nada pendente.")
+            send_telegram_message(chat_id, "⚠️ Nenhum lead aguardando decisão nesta busca.")
+            return
+        granted = quota.grant_chat(chat_id, "enrich", len(domains))
+        if not granted:
+            answer_callback(c_id, "⛔ Limite diário de enriquecimentos atingido.")
+            return
+        answer_callback(c_id, f"🚀 Enriquecendo top {granted}...")
+        count = bulk_actions.enrich_top(publisher, topic_path_3, search_id, chat_id, granted, domains=domains)
+        quota.refund_chat(chat_id, "enrich", granted - count)
+        send_telegram_message(chat_id, f"🚀 {count} lead(s) enviados para enriquecimento." if count else "⚠️ Nenhum lead enviado para enriquecimento (falha ao publicar).")
+    elif action == "BULK_DISCARD":
+        answer_callback(c_id, "🗑 Descartando...")
+        count = bulk_actions.discard_rest(search_id)
+        send_telegram_message(chat_id, f"🗑 {count} lead(s) descartados." if count else "⚠️ Nada para descartar nesta busca.")
+    elif action == "BULK_COPIES":
+        answer_callback(c_id, "✍️ Gerando copies...")
+        count = bulk_actions.copies_for_enriched(publisher, topic_path_4, search_id, chat_id)
+        send_telegram_message(chat_id, f"✍️ Copies solicitadas para {count} lead(s)." if count else "⚠️ Nenhum lead enriquecido nesta busca ainda.")
+    else:
+        answer_callback(c_id, "Ação desconhecida.")
+
+def handle_cancel_command(message):
+    """/cancel [search_id]: lápide na busca (sem argumento = última busca do chat)"""
+    chat_id = message["chat"]["id"]
+    parts = message["text"].split()
+    if len(parts) > 1:
+        search_id, query = parts[1], None
+        # Só o chat dono cancela (search_id de outro chat não pode ser derrubado daqui)
+        if not tombstones.owned_by(search_id, chat_id):
+            send_telegram_message(chat_id, "⛔ Essa busca não pertence a este chat.")
+            return
+    else:
+        search_id, query = database.get_chat_last_search(chat_id)
+    if not search_id:
+        send_telegram_message(chat_id, "🤷 Nenhuma busca para cancelar.")
+        return
+    label = query or search_id
+    print(f"🛑 Cancelando busca {search_id} ({label})")
+
+    result = tombstones.cancel(search_id, chat_id)
+    if result == tombstones.CANCEL_FAILED:
+        send_telegram_message(chat_id, f"⚠️ Não consegui cancelar a busca “{label}” (erro no banco). Tente /cancel de novo.")
+        return
+    if result == tombstones.ALREADY_CANCELLED:
+        send_telegram_message(chat_id, f"🛑 A busca “{label}” já estava cancelada.\n{tombstones.avoided_report(search_id)}")
+        return
+
+    # O que ainda nem entrou na esteira (fila de espera) ou aguarda decisão sai agora
+    pending = [l["domain"] for l in database.get_leads_by_search(search_id, bulk_actions.DISCARDABLE) if l.get("domain")]
+    if pending:
+        database.bulk_update_status(pending, "CANCELLED")
+        tombstones.record_avoided(search_id, "pending_leads", len(pending))
+        digest.mark_leads(search_id, {d: "discarded" for d in pending}, immediate=True)
+    send_telegram_message(
+        chat_id,
+        f"🛑 Busca “{label}” cancelada.\n"
+        f"{len(pending)} lead(s) pendentes descartados; etapas em andamento serão interrompidas.\n"
+        "Envie /cancel de novo para ver o trabalho evitado."
+    )
+
+# --- PROCESSAMENTO DE UPDATES (igual para polling e webhook) ---
+
+def handle_text_message(message):
+    """Mensagem de texto: classifica a intenção e dispara a busca ou responde"""
+    chat_id = message["chat"]["id"]
+    text = message["text"]
+
+    if str(chat_id) not in ALLOWED_USERS:
+        print(f"⛔ Acesso Negado: {chat_id}")
+        send_telegram_message(chat_id, "⛔ Acesso não autorizado.")
+        return
+
+    print(f"\n📨 Mensagem de {chat_id}: {text}")
+    metrics.inc("telegram_updates_total", kind="message")
+
+    decision = classify_intent_with_history(chat_id, text)
+    tipo = decision.get('type', 'CHAT')
+    metrics.inc("intent_decisions_total", type=tipo)
+    update_history(chat_id, "User", text)
+
+    if tipo == 'SEARCH':
+        query_consolidada = decision.get('consolidated_query', text)
+        print(f"🤔 Decisão: SEARCH -> '{query_consolidada}'")
+        if not quota.allow_chat(chat_id, "search"):
+            send_telegram_message(chat_id, "⛔ Você atingiu o limite diário de buscas. Tente novamente amanhã.")
+            return
+        send_telegram_message(chat_id, f"🔍 Entendido! Preparando busca para: {query_consolidada}\n(/cancel para interromper)")
+        search_id = uuid.uuid4().hex[:12]
+        database.set_chat_last_search(chat_id, search_id, query_consolidada)
+
+        # Monta o Prompt com o Template Original
+        final_prompt_content = TEMPLATE_BUSCA.format(pedido=query_consolidada)
+
+        # Payload Original para o Agente 1 (search_id acompanha os leads até o Agente 3)
+        payload = {
+            "command": final_prompt_content,
+            "chat_id": chat_id,
+            "original_term": query_consolidada,
+            "search_id": search_id
+        }
+        # Publica no Tópico do Agente 1 (topic-discovery-input)
+        publisher.publish(topic_path_1, json.dumps(payload).encode("utf-8"))
+        metrics.inc("searches_published_total")
+        print("🚀 Enviado Template para Agente 1!")
+
+    else:
+        resposta = decision.get('response')
+        print(f"🤔 Decisão: CHAT -> '{resposta}'")
+        send_telegram_message(chat_id, resposta)
+        update_history(chat_id, "Bot", resposta)
+
+
+def process_update(update):
+    """Roteia um update do Telegram (chamado pelo polling ou pelo webhook)"""
+    # --- CASO A: Clique no Botão ---
+    if "callback_query" in update:
+        metrics.inc("telegram_updates_total", kind="callback_query")
+        with metrics.timer("update_handling_seconds", kind="callback_query"):
+            handle_callback_query(update["callback_query"])
+        return
+
+    # --- CASO B: Mensagem de Texto ---
+    if "message" in update and "text" in update["message"]:
+        message = update["message"]
+        allowed = str(message["chat"]["id"]) in ALLOWED_USERS
+        if allowed and message["text"].strip().lower().startswith("/cancel"):
+            debouncer.discard(message["chat"]["id"])
+            with metrics.timer("update_handling_seconds", kind="cancel"):
+                handle_cancel_command(message)
+            return
+        # Mensagens picadas esperam a janela do debounce e voltam como uma só ("coalesced")
+        if not update.get("coalesced") and allowed:
+            debouncer.add(message)
+            return
+        with metrics.timer("update_handling_seconds", kind="message"):
+            handle_text_message(message)
+
+def dispatch_update(update):
+    """Entrega o update ao dispatcher (paralelo entre chats, em ordem dentro do chat)"""
+    if dispatcher.submit(update):
+        return
+    print(f"⚠️ Fila cheia para o chat {chat_dispatcher.chat_key(update)}. Update {update.get('update_id')} recusado.")
+    if "callback_query" in update:
+        answer_callback(update["callback_query"]["id"], "⏳ Calma! Ainda processando seus cliques anteriores.")
+    elif "message" in update:
+        chat_id = update["message"]["chat"]["id"]
+        if str(chat_id) in ALLOWED_USERS:
+            send_telegram_message(chat_id, "⏳ Calma! Ainda estou processando suas mensagens anteriores.")
+
+dispatcher = chat_dispatcher.ChatDispatcher(process_update)
+
+def dispatch_coalesced(message):
+    """Rajada já agregada pelo debounce: várias mensagens do usuário numa só, nunca recusada"""
+    dispatcher.submit({"message": message, "coalesced": True}, force=True)
+
+debouncer = message_debouncer.MessageDebouncer(dispatch_coalesced)
+
 # --- LOOP PRINCIPAL ---
 
-def main():
+def run_polling(deduper):
     global last_update_id
-    print(f"\n🤖 Bot Agente 0 RODANDO! (Search Original + Callbacks)")
-    
+    # getUpdates não funciona com webhook registrado (polling foi escolhido: pode remover)
+    telegram_webhook.delete_webhook(TELEGRAM_TOKEN)
+    print(f"\n🤖 Bot Agente 0 RODANDO em polling! (Search Original + Callbacks)")
+
+    error_backoff = 1
     while True:
         updates = get_telegram_updates(last_update_id + 1)
-        
+        if updates == WEBHOOK_CONFLICT:
+            # Outra instância registrou webhook no meio do caminho: polling nunca mais recebe nada
+            print("❌ ERRO: há um webhook ativo neste bot. Rode com ROUTER_MODE=webhook ou remova o webhook.")
+            sys.exit(1)
+        if updates is None:
+            # Só dorme em caso de erro (o long-poll já espera quando não há nada)
+            time.sleep(error_backoff)
+            error_backoff = min(error_backoff * 2, 30)
+            continue
+        error_backoff = 1
+
         for update in updates.get("result", []):
             last_update_id = update["update_id"]
-            
-            # --- CASO A: Clique no Botão (NOVO) ---
-            if "callback_query" in update:
-                handle_callback_query(update["callback_query"])
+            if not deduper.first_time(last_update_id):
                 continue
-            
-            # --- CASO B: Mensagem de Texto (Lógica Original Mantida) ---
-            if "message" in update and "text" in update["message"]:
-                chat_id = update["message"]["chat"]["id"]
-                text = update["message"]["text"]
-                
-                if str(chat_id) not in ALLOWED_USERS:
-                    print(f"⛔ Acesso Negado: {chat_id}")
-                    send_telegram_message(chat_id, "⛔ Acesso não autorizado.")
-                    continue 
-
-                print(f"\n📨 Mensagem de {chat_id}: {text}")
-                
-                decision = classify_intent_with_history(chat_id, text)
-                tipo = decision.get('type', 'CHAT')
-                update_history(chat_id, "User", text)
-
-                if tipo == 'SEARCH':
-                    query_consolidada = decision.get('consolidated_query', text)
-                    print(f"🤔 Decisão: SEARCH -> '{query_consolidada}'")
-                    send_telegram_message(chat_id, f"🔍 Entendido! Preparando busca para: {query_consolidada}")
-                    
-                    # Monta o Prompt com o Template Original
-                    final_prompt_content = TEMPLATE_BUSCA.format(pedido=query_consolidada)
-                    
-                    # Payload Original para o Agente 1
-                    payload = {
-                        "command": final_prompt_content,
-                        "chat_id": chat_id,
-                        "original_term": query_consolidada
-                    }
-                    # Publica no Tópico do Agente 1 (topic-discovery-input)
-                    publisher.publish(topic_path_1, json.dumps(payload).encode("utf-8"))
-                    print("🚀 Enviado Template para Agente 1!")
-                
-                else:
-                    resposta = decision.get('response')
-                    print(f"🤔 Decisão: CHAT -> '{resposta}'")
-                    send_telegram_message(chat_id, resposta)
-                    update_history(chat_id, "Bot", resposta)
-
-        time.sleep(1)
+            dispatch_update(update)
+
+
+def main():
+    metrics.instrument_requests()
+    metrics.start_http_server_from_env("agent_0")
+    deduper = telegram_webhook.UpdateDeduper(db=db)
+
+    if ROUTER_MODE == "webhook":
+        if not telegram_webhook.WEBHOOK_SECRET:
+            print("❌ ERRO: ROUTER_MODE=webhook exige WEBHOOK_SECRET (senão qualquer um injeta updates).")
+            sys.exit(1)
+        if telegram_webhook.WEBHOOK_URL and telegram_webhook.set_webhook(TELEGRAM_TOKEN):
+            print(f"\n🤖 Bot Agente 0 RODANDO em webhook! (Search Original + Callbacks)")
+            telegram_webhook.serve(dispatch_update, deduper)
+            return
+        # Sem fallback para polling: com o webhook antigo registrado o getUpdates dá 409
+        # para sempre, e removê-lo derrubaria as outras réplicas em webhook
+        print("❌ ERRO: webhook indisponível (WEBHOOK_URL ausente ou setWebhook falhou).")
+        sys.exit(1)
+
+    run_polling(deduper)
 
 if __name__ == "__main__":
     try:
         main()
     except KeyboardInterrupt:
+        debouncer.flush_all()
+        dispatcher.shutdown(wait=False)
         print("Bot parado.")
@@ -1,11 +1,28 @@
 
 import os
+import sys
 import json
 import requests
 import time
+import uuid
+import threading
 from google.cloud import pubsub_v1
 from dotenv import load_dotenv
 
+import metrics
+import backpressure
+import sharding
+import worker_lifecycle
+import telegram_client
+import bulk_actions
+import search_cache
+import quota
+import tombstones
+import discovery_planner
+import llm_cache
+import perplexity_stream
+import domain_utils
+
 # --- IMPORTAÇÃO DO BANCO ---
 try:
     import database
@@ -16,7 +33,13 @@ except ImportError:
         @staticmethod
         def check_lead_exists(domain): return False
         @staticmethod
-        def save_new_lead(domain, query): pass 
+        def save_new_lead(domain, query, search_id=None): pass 
+        @staticmethod
+        def save_queued_lead(domain, query, payload): pass
+        @staticmethod
+        def get_queued_leads(limit): return []
+        @staticmethod
+        def claim_queued_lead(domain): return False
 
 # --- Configuração ---
 load_dotenv()
@@ -28,7 +51,12 @@ NEXT_TOPIC_NAME = "topic-tech-filter"
 PERPLEXITY_API_KEY = os.getenv("PERPLEXITY_API_KEY")
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN") 
 
-MAX_RETRIES = 1  
+MAX_EXCLUSIONS = 30  # Nomes citados no "NÃO inclua estas" do prompt
+
+# --- Backpressure ---
+MAX_FANOUT_PER_SEARCH = int(os.getenv("DISCOVERY_MAX_FANOUT", "25"))   # Teto de leads publicados por busca
+BACKPRESSURE_WAIT_SECONDS = int(os.getenv("BACKPRESSURE_WAIT_SECONDS", "20"))  # Quanto segurar antes de enfileirar
+QUEUE_DRAIN_INTERVAL = int(os.getenv("QUEUE_DRAIN_INTERVAL", "30"))    # Frequência do drenador da fila de espera
 
 if not PERPLEXITY_API_KEY:
     print("❌ ERRO: PERPLEXITY_API_KEY não configurada!")
@@ -39,32 +67,113 @@ subscriber = pubsub_v1.SubscriberClient()
 topic_path = publisher.topic_path(PROJECT_ID, NEXT_TOPIC_NAME)
 subscription_path = subscriber.subscription_path(PROJECT_ID, SUBSCRIPTION_NAME)
 
-def notify_telegram(chat_id, text):
+def notify_telegram(chat_id, text, reply_markup=None):
     if not chat_id: return
-    try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-        requests.post(url, json={"chat_id": chat_id, "text": text, "parse_mode": "Markdown"})
-    except: pass
+    telegram_client.send_message(chat_id, text, reply_markup=reply_markup, wait=False)
+
+# Compilada uma vez (trie de sufixos): bloqueia o domínio e subdomínios, nunca por substring
+BLACKLIST = domain_utils.DomainBlacklist([
+    "instagram.com", "facebook.com", "linkedin.com", "youtube.com", 
+    "twitter.com", "google.com", "linktr.ee", "whatsapp.com",
+    "t.me", "goo.gl", "bit.ly", "reclameaqui.com.br", "glassdoor.com",
+    ".org" # <-- BLOQUEIO DE ONGs/ASSOCIAÇÕES (.org.br de empresa passa)
+])
 
 def clean_url(url):
-    if not url: return None
-    clean = url.lower().replace("https://", "").replace("http://", "").replace("www.", "")
-    if "/" in clean: clean = clean.split("/")[0]
-    clean = clean.strip()
-    if " " in clean or "." not in clean or len(clean) < 4: return None
-    return clean
+    """URL do Perplexity -> domínio registrável (mesma chave de dedupe em todos os agentes)"""
+    return domain_utils.canonical_domain(url)
 
 def is_blacklisted(domain):
-    blacklist = [
-        "instagram.com", "facebook.com", "linkedin.com", "youtube.com", 
-        "twitter.com", "google.com", "linktr.ee", "whatsapp.com",
-        "t.me", "goo.gl", "bit.ly", "reclameaqui.com.br", "glassdoor.com",
-        ".org" # <-- BLOQUEIO DE ONGs/ASSOCIAÇÕES
-    ]
-    return any(b in domain for b in blacklist)
-
-def search_perplexity_v3(prompt_completo):
-    print(f"🔎 Consultando Perplexity...")
+    return BLACKLIST.matches(domain)
+
+# ==============================================================================
+# 🚦 BACKPRESSURE
+# ==============================================================================
+
+def publish_lead(payload):
+    """Publica lead para o Agente 2 (com shard do domínio) e desconta do orçamento da esteira"""
+    publisher.publish(
+        topic_path,
+        json.dumps(payload).encode("utf-8"),
+        **sharding.shard_attributes(payload.get("domain"))
+    )
+    metrics.inc("leads_published_total", stage="agent_1")
+    backpressure.consume_budget(1)
+
+
+def wait_for_budget():
+    """
+    Throttle: espera até BACKPRESSURE_WAIT_SECONDS por espaço nos Agentes 2/3.
+    Retorna False se a esteira continuar cheia (lead deve ir para a fila de espera).
+    """
+    deadline = time.monotonic() + BACKPRESSURE_WAIT_SECONDS
+    budget = backpressure.available_budget()
+    while budget is not None and budget <= 0:
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(backpressure.PROBE_TTL_SECONDS)
+        budget = backpressure.available_budget(force=True)
+    return True
+
+
+def drain_queued_leads():
+    """Publica leads da fila de espera conforme a esteira libera espaço"""
+    budget = backpressure.available_budget(force=True)
+    limit = MAX_FANOUT_PER_SEARCH if budget is None else min(budget, MAX_FANOUT_PER_SEARCH)
+    if limit <= 0:
+        return
+
+    released = {}
+    for lead in database.get_queued_leads(limit):
+        payload = lead.get("queued_payload")
+        if not payload:
+            continue
+        if tombstones.check(payload.get("search_id"), "agent_1_publish"):
+            database.bulk_update_status([lead.get("domain")], "CANCELLED")
+            continue
+        if not database.claim_queued_lead(lead.get("domain")):
+            continue
+        publish_lead(payload)
+        metrics.inc("leads_dequeued_total")
+        chat_id = payload.get("chat_id")
+        released[chat_id] = released.get(chat_id, 0) + 1
+
+    for chat_id, count in released.items():
+        print(f"   🚚 {count} leads liberados da fila de espera (chat {chat_id})")
+        notify_telegram(chat_id, f"🚚 {count} lead(s) que estavam na fila foram liberados para análise.")
+
+
+def drain_queued_leads_loop():
+    while True:
+        time.sleep(QUEUE_DRAIN_INTERVAL)
+        try:
+            drain_queued_leads()
+        except Exception as e:
+            print(f"⚠️ Erro drenando fila de espera: {e}")
+
+
+PERPLEXITY_MODEL = "sonar"
+PERPLEXITY_TEMPERATURE = 0.2  # Baixei para 0.2 para ele ser mais obediente
+
+def parse_companies(content):
+    """Extrai a lista de empresas do JSON da resposta (None se não veio JSON)"""
+    start = content.find('{')
+    end = content.rfind('}') + 1
+    if start == -1 or end == 0: return None
+    return json.loads(content[start:end]).get('companies', [])
+
+def _emit_all(companies, on_company):
+    """Entrega as empresas uma a uma (para se on_company devolver False)"""
+    for comp in companies:
+        if on_company(comp) is False:
+            return
+
+def search_perplexity_v3(prompt_completo, bypass_cache=False, on_company=None):
+    """
+    Empresas candidatas. None = orçamento do Perplexity esgotado.
+    on_company(empresa): chamado para cada empresa assim que ela chega
+    (com PERPLEXITY_STREAMING, antes de a geração terminar). False interrompe.
+    """
     
     # --- AQUI ESTÁ A MUDANÇA NO PROMPT ---
     system_instruction = """
@@ -77,30 +186,77 @@ def search_perplexity_v3(prompt_completo):
     3. Se a busca for por startups, ignore quem "apoia" startups e liste as startups em si.
     """
     
+    # Prompt idêntico (mesmo template/variante/exclusões) não paga de novo
+    cache_key, content = llm_cache.lookup(
+        PERPLEXITY_MODEL, system_instruction, prompt_completo, PERPLEXITY_TEMPERATURE,
+        provider="perplexity", bypass=bypass_cache,
+    )
+    if content is not None:
+        print(f"⚡ Perplexity (cache)")
+        try:
+            companies = parse_companies(content) or []
+            if on_company:
+                _emit_all(companies, on_company)
+            return companies
+        except ValueError:
+            pass
+
+    if not quota.spend_provider("perplexity"):
+        print("   ⛔ Orçamento Perplexity do dia esgotado.")
+        return None
+
+    print(f"🔎 Consultando Perplexity...")
     url = "https://api.perplexity.ai/chat/completions"
     payload = {
-        "model": "sonar", 
+        "model": PERPLEXITY_MODEL, 
         "messages": [
             {"role": "system", "content": system_instruction},
             {"role": "user", "content": prompt_completo}
         ],
-        "temperature": 0.2 # Baixei para 0.2 para ele ser mais obediente
+        "temperature": PERPLEXITY_TEMPERATURE
     }
     headers = {"Authorization": f"Bearer {PERPLEXITY_API_KEY}", "Content-Type": "application/json"}
 
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=60)
-        if response.status_code != 200:
-            print(f"⚠️ API Status: {response.status_code}")
-            return []
-
-        content = response.json()['choices'][0]['message']['content']
-        start = content.find('{')
-        end = content.rfind('}') + 1
-        if start == -1 or end == 0: return []
-        
-        data = json.loads(content[start:end])
-        return data.get('companies', [])
+        started = time.monotonic()
+        if on_company and perplexity_stream.PERPLEXITY_STREAMING:
+            # Cada objeto de "companies" segue para a esteira assim que fecha no stream
+            parser = perplexity_stream.CompanyStreamParser()
+            interrupted = False
+
+            def on_text(delta):
+                nonlocal interrupted
+                for comp in parser.feed(delta):
+                    if on_company(comp) is False:
+                        interrupted = True
+                        return False
+                return True
+
+            with metrics.timer("llm_call_seconds", provider="perplexity", agent="agent_1"):
+                content = perplexity_stream.stream_chat(url, payload, headers, on_text, timeout=60)
+            if interrupted:
+                return []
+            companies = parse_companies(content)
+            if companies is None: return []
+            # O parser incremental perdeu algum objeto (JSON torto): entrega o resto agora
+            # (repetidos são descartados pelo dedupe de quem chama)
+            if parser.emitted < len(companies):
+                _emit_all(companies, on_company)
+        else:
+            with metrics.timer("llm_call_seconds", provider="perplexity", agent="agent_1"):
+                response = requests.post(url, json=payload, headers=headers, timeout=60)
+            if response.status_code != 200:
+                print(f"⚠️ API Status: {response.status_code}")
+                return []
+
+            content = response.json()['choices'][0]['message']['content']
+            companies = parse_companies(content)
+            if companies is None: return []
+            if on_company:
+                _emit_all(companies, on_company)
+        # Só resposta válida entra no cache
+        llm_cache.put(cache_key, content, time.monotonic() - started, model=PERPLEXITY_MODEL)
+        return companies
     except Exception as e:
         print(f"❌ Erro API: {e}")
         return []
@@ -112,85 +268,215 @@ def callback(message):
         base_prompt = data.get("command")
         chat_id = data.get("chat_id")
         query = data.get("original_term", "Busca")
+        search_id = data.get("search_id") or uuid.uuid4().hex[:12]
         
-        attempt = 0
         leads_enviados_total = 0
         leads_enviados_nomes = [] 
+        leads_enfileirados_nomes = []
+        esteira_cheia = False
         exclude_names = [] 
+        candidatos = []
+        lead_domains = []
+        known_domains = set()
+        cancelled = False
+
+        # --- Cache de busca: responde na hora e busca só o incremental ---
+        cached = search_cache.lookup(query)
+        if cached:
+            notify_telegram(chat_id, search_cache.format_cached_report(cached))
+            known_domains = set(cached.get("lead_domains", [])) | {c.get("domain") for c in cached.get("candidates", [])}
+            exclude_names = [c.get("name") for c in cached.get("candidates", []) if c.get("name")]
+            if search_cache.is_fresh(cached):
+                print(f"   ⚡ Busca idêntica há {cached['age'].total_seconds() / 60:.0f} min. Respondido do cache.")
+                metrics.inc("search_cache_skipped_searches_total")
+                message.ack()
+                return
+            print(f"   ⚡ Cache: {len(known_domains)} candidatos conhecidos. Buscando só o incremental...")
         
-        while attempt <= MAX_RETRIES:
-            print(f"   🔄 Tentativa {attempt + 1} de {MAX_RETRIES + 1}...")
-            
+        # Variantes da busca (porte / região / nichos) em paralelo, com meta de leads novos.
+        # Orçamento do Perplexity baixo: só a busca original.
+        max_variants = 1 if quota.provider_low("perplexity") else discovery_planner.DISCOVERY_VARIANTS
+        variants = discovery_planner.plan_variants(query, max_variants)
+        target = min(discovery_planner.DISCOVERY_TARGET_NEW_LEADS, MAX_FANOUT_PER_SEARCH)
+        # Exclusões fixadas no lançamento: cada variante já sai sem o que o cache conhece
+        base_exclusions = list(exclude_names[:MAX_EXCLUSIONS])
+        seen_domains = set()
+        new_leads = 0
+        budget_exhausted = False
+        publish_lock = threading.Lock()
+        search_started = time.monotonic()
+        # "no_cache": true no payload força resposta nova do Perplexity (ver llm_cache.py)
+        bypass_cache = bool(data.get("no_cache"))
+        print(f"   🧭 {len(variants)} variante(s): {', '.join(name for name, _ in variants)} | meta: {target} leads novos")
+
+        def build_prompt(focus):
             current_prompt = base_prompt
-            if attempt > 0 and exclude_names:
-                exclusions_str = ", ".join(exclude_names[:15]) 
-                print(f"   🚫 Excluindo da busca: {exclusions_str[:50]}...")
+            if focus:
+                current_prompt += f"\n\nFOCO DESTA BUSCA: {focus}"
+            if base_exclusions:
+                exclusions_str = ", ".join(base_exclusions)
                 current_prompt += f"\n\nIMPORTANTE: Busque OUTRAS empresas. NÃO inclua estas: {exclusions_str}."
+            return current_prompt
+
+        def search_variant(name, focus):
+            nonlocal budget_exhausted
+            print(f"   🔄 Variante '{name}'...")
+            companies = search_perplexity_v3(build_prompt(focus), bypass_cache=bypass_cache, on_company=on_company)
+            if companies is None:
+                budget_exhausted = True
+                return []
+            return companies
+
+        def should_stop():
+            nonlocal cancelled
+            if budget_exhausted:
+                return True
+            if new_leads >= target:
+                print(f"   🎯 Meta de {target} leads novos atingida. Parando variantes.")
+                return True
+            if esteira_cheia:
+                return True
+            if tombstones.check(search_id, "agent_1_search"):
+                cancelled = True
+                return True
+            return False
 
-            companies = search_perplexity_v3(current_prompt)
+        def dedupe_company(comp):
+            """Dedupe de um candidato (sob publish_lock). Retorna o payload se o lead é novo."""
+            nonlocal cancelled
+            # /cancel no meio da rodada: o resto dos candidatos nem entra na esteira
+            if cancelled or tombstones.check(search_id, "agent_1_publish"):
+                cancelled = True
+                return None
+
+            domain = clean_url(comp.get('website'))
+            company_name = comp.get("name", domain)
             
-            if not companies:
-                print("   ⚠️ Perplexity não retornou nada nesta tentativa.")
-                break 
+            # O filtro .org vai pegar aqui
+            if not domain or is_blacklisted(domain):
+                print(f"      🗑️ Ignorado (Blacklist/Org): {domain}")
+                return None
+
+            # Variantes diferentes costumam repetir empresas: uma vez só por busca
+            if domain in seen_domains:
+                metrics.inc("discovery_duplicate_candidates_total")
+                return None
+            seen_domains.add(domain)
+            candidatos.append({"domain": domain, "name": company_name, "sector": comp.get("sector")})
 
-            print(f"   ✅ Retornou {len(companies)} candidatos.")
+            # Já veio numa execução anterior desta busca (cache): nem consulta o banco
+            if domain in known_domains:
+                print(f"      ⏩ {domain}: Já conhecido (cache).")
+                return None
             
-            new_in_this_batch = 0
+            if database.check_lead_exists(domain):
+                print(f"      ⏩ {domain}: Já existe.")
+                return None
             
-            for comp in companies:
-                domain = clean_url(comp.get('website'))
-                company_name = comp.get("name", domain)
-                
-                # O filtro .org vai pegar aqui
-                if not domain or is_blacklisted(domain):
-                    print(f"      🗑️ Ignorado (Blacklist/Org): {domain}")
-                    continue
-                
-                if database.check_lead_exists(domain):
-                    print(f"      ⏩ {domain}: Já existe.")
-                    if company_name not in exclude_names:
-                        exclude_names.append(company_name)
-                    continue
-                
-                # É NOVO!
-                database.save_new_lead(domain, query)
-                
-                payload = {
-                    "domain": domain,
-                    "origin_query": query,
-                    "chat_id": chat_id,
-                    "context_data": {
-                        "name": company_name,
-                        "sector": comp.get("sector"),
-                        "size": comp.get("size"),
-                        "fit_explanation": comp.get("fit_explanation")
-                    }
+            # É NOVO!
+            return {
+                "domain": domain,
+                "origin_query": query,
+                "search_id": search_id,
+                "chat_id": chat_id,
+                "context_data": {
+                    "name": company_name,
+                    "sector": comp.get("sector"),
+                    "size": comp.get("size"),
+                    "fit_explanation": comp.get("fit_explanation")
                 }
-                publisher.publish(topic_path, json.dumps(payload).encode("utf-8"))
-                print(f"      🚀 {domain}: Enviado!")
-                leads_enviados_total += 1
-                leads_enviados_nomes.append(f"• {company_name} ({domain})")
-                new_in_this_batch += 1
-            
-            if new_in_this_batch < 2 and attempt < MAX_RETRIES:
-                print("   🤔 Poucos leads novos. Insistindo...")
-                attempt += 1
-                time.sleep(2) 
-                continue
+            }
+
+        def send_lead(payload, has_budget):
+            """Publica (ou segura na fila de espera) um lead novo (sob publish_lock)"""
+            nonlocal esteira_cheia, leads_enviados_total, new_leads
+            if cancelled:
+                return False
+            domain = payload["domain"]
+            company_name = payload["context_data"]["name"]
+
+            # Backpressure: teto por busca + espaço nos Agentes 2/3
+            if not esteira_cheia and leads_enviados_total >= MAX_FANOUT_PER_SEARCH:
+                print(f"   🧢 Teto de {MAX_FANOUT_PER_SEARCH} leads por busca atingido. Enfileirando o resto.")
+                esteira_cheia = True
+            elif not esteira_cheia and not has_budget:
+                print("   🚦 Esteira cheia (Agentes 2/3). Enfileirando o resto da busca.")
+                esteira_cheia = True
+
+            if esteira_cheia:
+                database.save_queued_lead(domain, query, payload)
+                metrics.inc("leads_queued_total")
+                leads_enfileirados_nomes.append(f"• {company_name} ({domain})")
+                lead_domains.append(domain)
+                new_leads += 1
+                return True
+
+            database.save_new_lead(domain, query, search_id)
+            publish_lead(payload)
+            print(f"      🚀 {domain}: Enviado!")
+            if not leads_enviados_total:
+                metrics.observe("discovery_time_to_first_lead_seconds", time.monotonic() - search_started)
+            leads_enviados_total += 1
+            leads_enviados_nomes.append(f"• {company_name} ({domain})")
+            lead_domains.append(domain)
+            new_leads += 1
+            return True
+
+        def on_company(comp):
+            """Chamado pelas threads das variantes (streaming): dedupe e publish uma empresa por vez"""
+            with publish_lock:
+                payload = dedupe_company(comp)
+                if payload is None:
+                    return not cancelled
+                must_wait = not esteira_cheia and leads_enviados_total < MAX_FANOUT_PER_SEARCH
+            # Espera por espaço na esteira (até BACKPRESSURE_WAIT_SECONDS) FORA do lock:
+            # as outras variantes continuam fazendo dedupe enquanto isso
+            has_budget = wait_for_budget() if must_wait else True
+            with publish_lock:
+                return send_lead(payload, has_budget)
+
+        def variant_done(name, companies):
+            if companies:
+                print(f"   ✅ Variante '{name}': {len(companies)} candidatos.")
             else:
-                break
+                print(f"   ⚠️ Variante '{name}': Perplexity não retornou nada.")
+
+        with metrics.timer("discovery_search_seconds"):
+            launched = discovery_planner.run_variants(
+                variants, search_variant, variant_done,
+                should_stop=should_stop,
+            )
+        if budget_exhausted and not new_leads:
+            notify_telegram(chat_id, "⛔ Limite diário de buscas da plataforma atingido. Tente novamente mais tarde.")
+        metrics.observe("discovery_new_leads_per_search", new_leads)
+        cache_stats = llm_cache.stats()
+        print(f"   📦 Cache LLM (processo): {cache_stats['hits']} hit(s), {cache_stats['misses']} miss(es), "
+              f"{cache_stats['saved_seconds']:.0f}s poupados")
+
+        search_cache.record(query, candidatos, lead_domains, previous=cached)
+
+        if cancelled:
+            print(f"   🛑 Busca {search_id} cancelada pelo usuário. Sem relatório.")
+            message.ack()
+            return
 
         # --- RELATÓRIO FINAL ---
         msg = f"📊 *Relatório Final: {query}*\n"
         
-        if leads_enviados_total > 0:
+        if leads_enviados_total > 0 or leads_enfileirados_nomes:
             msg += f"✅ Enviados para esteira: {leads_enviados_total}\n"
             msg += "\n".join(leads_enviados_nomes)
+            if leads_enfileirados_nomes:
+                msg += f"\n\n⏳ *Na fila (esteira cheia): {len(leads_enfileirados_nomes)}*\n"
+                msg += "Serão analisados automaticamente assim que houver espaço.\n"
+                msg += "\n".join(leads_enfileirados_nomes)
         else:
-            msg += f"⚠️ Nenhum lead NOVO encontrado após {attempt+1} tentativas.\n"
+            msg += f"⚠️ Nenhum lead NOVO encontrado em {launched} variante(s) da busca.\n"
             msg += "Tente refinar a busca."
 
-        notify_telegram(chat_id, msg)
+        # Ações em lote da busca (enriquecer top N / descartar resto / copies)
+        keyboard = {"inline_keyboard": bulk_actions.bulk_keyboard(search_id)} if leads_enviados_total else None
+        notify_telegram(chat_id, msg, keyboard)
         message.ack()
         
     except Exception as e:
@@ -198,8 +484,10 @@ def callback(message):
         message.nack()
 
 if __name__ == "__main__":
+    metrics.instrument_requests()
+    metrics.start_http_server_from_env("agent_1")
+    threading.Thread(target=drain_queued_leads_loop, name="queued-leads-drainer", daemon=True).start()
     print(f"🎧 Agente 1 (V4.3 - Anti-Hub) ouvindo...")
-    with subscriber:
-        try:
-            subscriber.subscribe(subscription_path, callback=callback).result()
-        except KeyboardInterrupt: pass
+    sys.exit(worker_lifecycle.run("agent_1", subscriber, [
+        {"subscription": subscription_path, "callback": callback},
+    ], flushers=[publisher.stop]))
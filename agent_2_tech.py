@@ -13,6 +13,7 @@ Responsabilidades:
 """
 
 import os
+import sys
 import json
 import warnings
 import requests
@@ -21,10 +22,18 @@ import random
 import time
 import zlib
 import base64
+import threading
+from collections import OrderedDict
 from Wappalyzer import Wappalyzer, WebPage
 from google.cloud import pubsub_v1
 from dotenv import load_dotenv
 
+import metrics
+import sharding
+import worker_lifecycle
+import tombstones
+import fair_scheduler
+
 try:
     import database
     print("✅ [Agente 2] Módulo database carregado.")
@@ -50,12 +59,20 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 DEBUG_CHAT_ID = os.getenv("DEBUG_CHAT_ID", "-1002424609562")
 
 TOPIC_OUTPUT = "topic-enricher"
-SUBSCRIPTION_INPUT = "sub-tech-checker"
+SUBSCRIPTION_INPUT = "sub-tech-checker"  # Com TECH_SHARDS > 1 vira uma assinatura por shard (sharding.py)
+MAX_MESSAGES = int(os.getenv("AGENT2_MAX_MESSAGES", "10"))
+
+# Cache local de análises: com afinidade por shard o mesmo domínio volta para esta réplica
+TECH_CACHE_TTL = int(os.getenv("TECH_CACHE_TTL", "3600"))
+TECH_CACHE_MAX = int(os.getenv("TECH_CACHE_MAX", "256"))
 
 publisher = pubsub_v1.PublisherClient()
 subscriber = pubsub_v1.SubscriberClient()
 topic_path = publisher.topic_path(PROJECT_ID, TOPIC_OUTPUT)
-subscription_path = subscriber.subscription_path(PROJECT_ID, SUBSCRIPTION_INPUT)
+OWNED_SHARDS = sharding.owned_shards()
+subscription_paths = [
+    subscriber.subscription_path(PROJECT_ID, sharding.shard_subscription_name(i)) for i in OWNED_SHARDS
+]
 
 print("📚 Carregando cérebro do Wappalyzer...")
 wappalyzer = Wappalyzer.latest()
@@ -454,6 +471,37 @@ def analyze_domain(domain):
             "final_url": ""
         }
 
+# ==============================================================================
+# 💾 CACHE LOCAL DE ANÁLISES
+# ==============================================================================
+
+_tech_cache = OrderedDict()
+_tech_cache_lock = threading.Lock()
+
+
+def analyze_domain_cached(domain):
+    """analyze_domain com cache LRU+TTL por processo (só guarda fetch bem-sucedido)"""
+    now = time.monotonic()
+    with _tech_cache_lock:
+        entry = _tech_cache.get(domain)
+        if entry and now - entry[0] < TECH_CACHE_TTL:
+            _tech_cache.move_to_end(domain)
+            metrics.inc("cache_requests_total", cache="tech_analysis", result="hit")
+            print(f"   💾 Cache de análise: {domain}")
+            return entry[1]
+    metrics.inc("cache_requests_total", cache="tech_analysis", result="miss")
+
+    with metrics.timer("stage_step_seconds", stage="agent_2", step="analyze_domain"):
+        result = analyze_domain(domain)
+
+    if result and result.get("final_url"):
+        with _tech_cache_lock:
+            _tech_cache[domain] = (now, result)
+            _tech_cache.move_to_end(domain)
+            while len(_tech_cache) > TECH_CACHE_MAX:
+                _tech_cache.popitem(last=False)
+    return result
+
 # ==============================================================================
 # 📨 CALLBACK PRINCIPAL
 # ==============================================================================
@@ -468,8 +516,13 @@ def callback(message):
         context_data = data.get("context_data", {})
         
         print(f"\n📨 RECEBIDO: {domain}")
+
+        # Busca cancelada (/cancel): ack-drop antes de baixar o site
+        if tombstones.check(data.get("search_id"), "agent_2_fetch"):
+            message.ack()
+            return
         
-        result = analyze_domain(domain)
+        result = analyze_domain_cached(domain)
         
         if result:
             score = result['total_score']
@@ -507,6 +560,7 @@ def callback(message):
                 "hosting": host,
                 "chat_id": chat_id,
                 "origin_query": origin_query,
+                "search_id": data.get("search_id"),
                 "context_data": context_data,
                 "site_emails": site_emails,
                 "site_socials": site_socials,
@@ -516,6 +570,7 @@ def callback(message):
             }
             
             publisher.publish(topic_path, json.dumps(payload).encode("utf-8"))
+            metrics.inc("leads_published_total", stage="agent_2")
             print(f"   📤 Enviado para Agente 3 | Techs: {techs[:5]}...")
 
         message.ack()
@@ -531,10 +586,29 @@ def callback(message):
 # ==============================================================================
 
 if __name__ == "__main__":
-    flow_control = pubsub_v1.types.FlowControl(max_messages=10)
+    metrics.instrument_requests()
+    metrics.start_http_server_from_env("agent_2")
+    if not subscription_paths:
+        print("❌ ERRO: nenhum shard atribuído a esta réplica (AGENT2_SHARDS).")
+        sys.exit(1)
+
+    # Divide a capacidade entre os shards que esta réplica possui
+    per_lane = max(1, MAX_MESSAGES // len(subscription_paths))
     print(f"🛠️ Agente 2 (V4.1 - Fixed) ouvindo...")
-    with subscriber:
-        try:
-            subscriber.subscribe(subscription_path, callback=callback, flow_control=flow_control).result()
-        except KeyboardInterrupt:
-            print("\n👋 Agente 2 finalizado.")
+    if sharding.TECH_SHARDS > 1:
+        print(f"   🧩 Shards: {OWNED_SHARDS} de {sharding.TECH_SHARDS} ({per_lane} msgs por shard)")
+    # Fila justa entre usuários: um pool só para todos os shards, puxando com folga
+    fair = None
+    if fair_scheduler.FAIR_SCHEDULING:
+        fair = fair_scheduler.FairScheduler("agent_2", workers=MAX_MESSAGES)
+        per_lane = max(1, fair.prefetch // len(subscription_paths))
+        print(f"   ⚖️ Fila justa por {fair_scheduler.FAIR_TENANT_KEY} ({fair.workers} workers, prefetch {fair.prefetch})")
+    sys.exit(worker_lifecycle.run("agent_2", subscriber, [
+        {
+            "subscription": path,
+            "callback": callback,
+            "flow_control": pubsub_v1.types.FlowControl(max_messages=per_lane),
+            "fair": fair,
+        }
+        for path in subscription_paths
+    ], flushers=[publisher.stop]))
@@ -11,6 +11,7 @@ Correções v4.8:
 """
 
 import os
+import sys
 import json
 import requests
 import datetime
@@ -18,10 +19,20 @@ import traceback
 import re
 import zlib
 import base64
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import pubsub_v1
+from google.cloud.pubsub_v1.subscriber.scheduler import ThreadScheduler
 from google.cloud import firestore
 from dotenv import load_dotenv
 
+import metrics
+import worker_lifecycle
+import telegram_client
+import digest
+import quota
+import tombstones
+import fair_scheduler
+
 # --- Banco ---
 try:
     import database
@@ -60,6 +71,7 @@ DATA_STONE_BASE_URL = "https://docs.datastone.com.br/_mock/api"
 
 # Pub/Sub
 SUBSCRIPTION_INPUT = "sub-enricher-worker"
+SUBSCRIPTION_PRIORITY = "sub-enricher-priority"  # Cliques "Enriquecer Pessoas" (Agente 0)
 TOPIC_CLOSER = "topic-closer-hubspot"
 TOPIC_COPY = "topic-copy-generator"
 
@@ -68,12 +80,21 @@ subscriber = pubsub_v1.SubscriberClient()
 topic_path_closer = publisher.topic_path(PROJECT_ID, TOPIC_CLOSER)
 topic_path_copy = publisher.topic_path(PROJECT_ID, TOPIC_COPY)
 subscription_path = subscriber.subscription_path(PROJECT_ID, SUBSCRIPTION_INPUT)
+subscription_path_priority = subscriber.subscription_path(PROJECT_ID, SUBSCRIPTION_PRIORITY)
 
 # Firestore
 db_firestore = firestore.Client(project=PROJECT_ID)
 
 # Limites
 MAX_SERPER_CALLS = 5
+# Orçamento do provedor baixo (quota.provider_low): caminho mais barato
+MAX_SERPER_CALLS_LOW_BUDGET = 1
+MAX_DATASTONE_SOCIOS_LOW_BUDGET = 2
+
+# Capacidade: o lote (Parte 1) e os cliques (Parte 2) têm pools SEPARADOS,
+# então um backlog de descoberta nunca atrasa o clique do usuário
+BULK_MAX_MESSAGES = int(os.getenv("AGENT3_BULK_MAX_MESSAGES", "2"))
+PRIORITY_WORKERS = int(os.getenv("AGENT3_PRIORITY_WORKERS", "2"))
 
 # ==============================================================================
 # 🛠️ UTILITÁRIOS
@@ -205,32 +226,10 @@ def format_person_profile_full(person):
 # ==============================================================================
 
 def send_telegram(chat_id, text, reply_markup=None):
-    """Envia mensagem no Telegram"""
+    """Envia mensagem no Telegram (retorna o message_id)"""
     if not TELEGRAM_TOKEN or not chat_id:
         return None
-    try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-        payload = {
-            "chat_id": chat_id,
-            "text": text,
-            "parse_mode": "Markdown",
-            "disable_web_page_preview": True
-        }
-        if reply_markup:
-            payload["reply_markup"] = reply_markup
-        
-        resp = requests.post(url, json=payload, timeout=10)
-        if resp.status_code == 200:
-            return resp.json().get("result", {}).get("message_id")
-        else:
-            # Tenta sem Markdown se falhar
-            payload["parse_mode"] = None
-            resp = requests.post(url, json=payload, timeout=10)
-            if resp.status_code == 200:
-                return resp.json().get("result", {}).get("message_id")
-    except Exception as e:
-        print(f"⚠️ Erro Telegram: {e}")
-    return None
+    return telegram_client.send_message(chat_id, text, reply_markup=reply_markup)
 
 
 def send_telegram_preview(chat_id, text, domain):
@@ -245,22 +244,11 @@ def send_telegram_preview(chat_id, text, domain):
 
 
 def edit_msg_final(chat_id, msg_id, text):
-    """Edita mensagem existente"""
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/editMessageText"
-    try:
-        payload = {
-            "chat_id": chat_id,
-            "message_id": msg_id,
-            "text": text,
-            "parse_mode": "Markdown",
-            "disable_web_page_preview": True
-        }
-        r = requests.post(url, json=payload)
-        if r.status_code != 200:
-            payload["parse_mode"] = None
-            requests.post(url, json=payload)
-    except Exception as e:
-        print(f"⚠️ Falha envio Telegram: {e}")
+    """Edita mensagem existente (sem msg_id - clique vindo do digest - envia mensagem nova)"""
+    if not msg_id:
+        send_telegram(chat_id, text)
+        return
+    telegram_client.edit_message(chat_id, msg_id, text)
 
 
 def send_new_message_with_copies_button(chat_id, text, domain):
@@ -307,6 +295,9 @@ def search_cnpj_serper(company_name, domain):
     """Busca CNPJ via Serper quando não encontrou no site"""
     if not SERPER_API_KEY or not company_name:
         return None
+    if not quota.spend_provider("serper"):
+        print("   ⛔ Orçamento Serper do dia esgotado (CNPJ)")
+        return None
     
     try:
         query = f"{company_name} CNPJ site:cnpj.info OR site:consultasocio.com"
@@ -409,6 +400,10 @@ def fetch_datastone_person_by_name(name, uf=None):
     """
     if not DATA_STONE_API_KEY or not name:
         return None
+    # Busca + detalhe = 2 consultas
+    if not quota.spend_provider("datastone", cost=2):
+        print("   ⛔ Orçamento DataStone do dia esgotado")
+        return None
 
     try:
         url_busca = "https://api.datastone.com.br/v1/persons/search"
@@ -520,6 +515,9 @@ def enrich_company_basic(domain):
     """Busca dados da empresa no CrustData"""
     if not CRUST_API_KEY:
         return None
+    if not quota.spend_provider("crustdata"):
+        print("   ⛔ Orçamento CrustData do dia esgotado (empresa)")
+        return None
     try:
         url = f"{CRUST_BASE_URL}/screener/company"
         resp = requests.get(
@@ -543,6 +541,9 @@ def get_decision_makers_by_id(company_id):
     """
     if not company_id or not CRUST_API_KEY:
         return []
+    if not quota.spend_provider("crustdata"):
+        print("   ⛔ Orçamento CrustData do dia esgotado (DMs)")
+        return []
     try:
         url = f"{CRUST_BASE_URL}/screener/company"
         params = {"company_id": str(company_id), "fields": "decision_makers"}
@@ -570,6 +571,9 @@ def search_people_robust(company_key, titles_list=None, limit=5):
     """
     if not company_key or not CRUST_API_KEY:
         return []
+    if not quota.spend_provider("crustdata"):
+        print("   ⛔ Orçamento CrustData do dia esgotado (pessoas)")
+        return []
     
     url = f"{CRUST_BASE_URL}/screener/person/search/"
     headers = {"Authorization": f"Token {CRUST_API_KEY}", "Content-Type": "application/json"}
@@ -597,6 +601,9 @@ def apollo_organization_search(domain):
     """Busca dados da empresa no Apollo"""
     if not APOLLO_API_KEY:
         return None
+    if not quota.spend_provider("apollo"):
+        print("   ⛔ Orçamento Apollo do dia esgotado (empresa)")
+        return None
     try:
         url = "https://api.apollo.io/v1/organizations/search"
         payload = {
@@ -627,6 +634,9 @@ def apollo_people_search(domain, titles=None, limit=5):
     """Busca pessoas no Apollo"""
     if not APOLLO_API_KEY:
         return []
+    if not quota.spend_provider("apollo"):
+        print("   ⛔ Orçamento Apollo do dia esgotado (pessoas)")
+        return []
     try:
         url = "https://api.apollo.io/v1/mixed_people/search"
         payload = {
@@ -666,6 +676,9 @@ def lusha_people_search(domain, titles=None, limit=5):
     """Busca pessoas no Lusha"""
     if not LUSHA_API_KEY:
         return []
+    if not quota.spend_provider("lusha"):
+        print("   ⛔ Orçamento Lusha do dia esgotado")
+        return []
     try:
         url = "https://api.lusha.com/prospecting/contact/search"
         headers = {"api_key": LUSHA_API_KEY, "Content-Type": "application/json"}
@@ -707,6 +720,9 @@ def search_linkedin_serper(name, company_name):
     """Busca perfil LinkedIn via Serper"""
     if not SERPER_API_KEY or not name:
         return None
+    if not quota.spend_provider("serper"):
+        print("   ⛔ Orçamento Serper do dia esgotado (LinkedIn)")
+        return None
     try:
         query = f'"{name}" {company_name} site:linkedin.com/in'
         url = "https://google.serper.dev/search"
@@ -759,6 +775,7 @@ def process_new_lead_part1(data):
     """
     domain = data.get("domain")
     chat_id = data.get("chat_id")
+    search_id = data.get("search_id")
     techs = data.get("techs", [])
     tech_summary = data.get("tech_summary", {})
     tech_score = data.get("tech_score", 0)
@@ -768,6 +785,17 @@ def process_new_lead_part1(data):
     site_socials = data.get("site_socials", [])
     
     print(f"\n🔵 [Parte 1] Analisando Empresa: {domain}")
+
+    # Busca cancelada (/cancel): nada de Serper/CrustData para ela
+    if tombstones.check(search_id, "agent_3_enrich"):
+        return
+
+    # Orçamento do chat: sem saldo, o preview sai só com o que é gratuito (HTML + BrasilAPI).
+    # Leads importados (import_leads.py) têm cota própria e não comem a das buscas.
+    quota_action = "import_lead" if context_data.get("source") == "import" else "lead"
+    paid_lookups = quota.allow_chat(chat_id, quota_action)
+    if not paid_lookups:
+        print("   ⛔ Orçamento de leads do chat esgotado: pulando Serper/CrustData")
     
     # 1. Descomprime HTML
     html_content = decompress_html(html_compressed)
@@ -776,7 +804,7 @@ def process_new_lead_part1(data):
     
     # 2. Extrai CNPJ (PARA TODOS - PME E ENTERPRISE)
     cnpj = extract_cnpj_from_html(html_content)
-    if not cnpj:
+    if not cnpj and paid_lookups:
         company_name = context_data.get("name", domain.split(".")[0])
         print(f"   🔍 Buscando CNPJ via Serper para: {company_name}")
         cnpj = search_cnpj_serper(company_name, domain)
@@ -795,8 +823,10 @@ def process_new_lead_part1(data):
             socios = extract_socios_from_brasil_api(brasil_data)
     
     # 4. Busca dados no CrustData (LÓGICA ORIGINAL)
-    print(f"   🦀 Buscando no CrustData...")
-    comp_info = enrich_company_basic(domain)
+    comp_info = None
+    if paid_lookups:
+        print(f"   🦀 Buscando no CrustData...")
+        comp_info = enrich_company_basic(domain)
     
     # 5. Monta payload da empresa
     if comp_info:
@@ -917,11 +947,28 @@ def process_new_lead_part1(data):
         "contacts_found": 0,
         "last_update": datetime.datetime.now(),
         "chat_id": chat_id,
+        "search_id": search_id,
         "preview_message": msg  # ⭐ SALVA A MENSAGEM PARA CONCATENAR DEPOIS
     }
     database.update_enrichment(domain, db_data)
     
-    # 12. Envia preview com botões
+    # 12. Modo digest: uma linha na página da busca (editada no lugar)
+    if digest.DIGEST_MODE and search_id and chat_id:
+        stack = (tech_summary.get('marketing') or []) + (tech_summary.get('cms') or []) or techs
+        entry = {
+            "domain": domain,
+            "name": comp_payload.get('name') or domain,
+            "porte": porte,
+            "score": pre_score,
+            "cnpj": bool(cnpj),
+            "summary": ", ".join(stack[:3]),
+        }
+        if digest.add_lead(search_id, chat_id, data.get("origin_query") or "Busca", entry):
+            print(f"   ✅ Adicionado ao digest {search_id} | Porte: {porte} | CNPJ: {'✅' if cnpj else '❌'}")
+            return
+        print("   ⚠️ Digest indisponível. Enviando preview avulso.")
+
+    # 12b. Envia preview com botões
     send_telegram_preview(chat_id, msg, domain)
     print(f"   ✅ Preview enviado | Porte: {porte} | CNPJ: {'✅' if cnpj else '❌'}")
 
@@ -941,10 +988,15 @@ def process_enrich_command_part2(data):
 
     print(f"\n🟢 [Parte 2] Enriquecendo Pessoas: {domain}")
 
+    # Ações em lote de uma busca cancelada caem aqui; clique avulso é sempre atendido
+    if data.get("bulk") and tombstones.check(data.get("search_id"), "agent_3_enrich"):
+        return
+
     try:
         # 1. Busca lead no Firestore
         doc_ref = db_firestore.collection("leads_b2b").document(domain)
-        doc = doc_ref.get()
+        with metrics.timer("firestore_op_seconds", op="get", collection="leads_b2b"):
+            doc = doc_ref.get()
         if not doc.exists:
             edit_msg_final(chat_id, msg_id, "❌ Erro: Lead expirou ou não existe.")
             return
@@ -1013,14 +1065,19 @@ def process_enrich_command_part2(data):
                 if not is_duplicate(p):
                     final_people.append(p)
 
-        if len(final_people) < 5:
+        # Orçamento CrustData baixo: fica só na busca por cargo-chave
+        crust_low = quota.provider_low("crustdata")
+        if crust_low:
+            print("   ↳ Orçamento CrustData baixo: pulando buscas amplas")
+
+        if len(final_people) < 5 and not crust_low:
             print("   ↳ CrustData Gerentes...")
             res = search_people_robust(cdom, ["manager", "gerente", "head"], limit=5) or []
             for p in res:
                 if not is_duplicate(p):
                     final_people.append(p)
 
-        if len(final_people) < 5:
+        if len(final_people) < 5 and not crust_low:
             print("   ↳ CrustData Genérico...")
             res = search_people_robust(cdom, None, limit=5) or []
             for p in res:
@@ -1051,6 +1108,10 @@ def process_enrich_command_part2(data):
             nome_fantasia = brasil_data.get("nome_fantasia", domain) if brasil_data else domain
             uf_empresa = brasil_data.get("uf") if brasil_data else None
             serper_calls = 0
+            max_serper = MAX_SERPER_CALLS_LOW_BUDGET if quota.provider_low("serper") else MAX_SERPER_CALLS
+            if quota.provider_low("datastone"):
+                print(f"   ↳ Orçamento DataStone baixo: só os {MAX_DATASTONE_SOCIOS_LOW_BUDGET} primeiros sócios")
+                socios = socios[:MAX_DATASTONE_SOCIOS_LOW_BUDGET]
             
             for socio in socios:
                 nome = socio.get("nome")
@@ -1059,7 +1120,7 @@ def process_enrich_command_part2(data):
                 
                 # Busca LinkedIn (limitado pelo MAX_SERPER_CALLS)
                 linkedin_url = None
-                if serper_calls < MAX_SERPER_CALLS:
+                if serper_calls < max_serper:
                     serper_calls += 1
                     linkedin_url = search_linkedin_serper(nome, nome_fantasia)
                 
@@ -1100,14 +1161,15 @@ def process_enrich_command_part2(data):
             final_score = 100
         
         # 9. Atualiza Firestore
-        doc_ref.update({
-            "status": "ENRICHED",
-            "people_data": final_people,
-            "socios_enriquecidos": socios_enriquecidos,  # ⭐ Salva sócios enriquecidos separadamente
-            "contacts_found": len(final_people),
-            "final_score": final_score,
-            "enriched_at": datetime.datetime.now()
-        })
+        with metrics.timer("firestore_op_seconds", op="update", collection="leads_b2b"):
+            doc_ref.update({
+                "status": "ENRICHED",
+                "people_data": final_people,
+                "socios_enriquecidos": socios_enriquecidos,  # ⭐ Salva sócios enriquecidos separadamente
+                "contacts_found": len(final_people),
+                "final_score": final_score,
+                "enriched_at": datetime.datetime.now()
+            })
         
         # 10. Publica para HubSpot
         payload_closer = {
@@ -1191,6 +1253,9 @@ def process_enrich_command_part2(data):
         
         send_new_message_with_copies_button(chat_id, copy_msg, domain)
 
+        if data.get("search_id"):
+            digest.mark_lead(data["search_id"], domain, "enriched")
+
     except Exception as e:
         print(f"🔥 ERRO FATAL PARTE 2: {e}")
         traceback.print_exc()
@@ -1208,10 +1273,12 @@ def callback(message):
         
         if data.get("command") == "FETCH_PEOPLE":
             # Comando do botão "Enriquecer Pessoas"
-            process_enrich_command_part2(data)
+            with metrics.timer("stage_step_seconds", stage="agent_3", step="part2"):
+                process_enrich_command_part2(data)
         else:
             # Novo lead vindo do Agente 2
-            process_new_lead_part1(data)
+            with metrics.timer("stage_step_seconds", stage="agent_3", step="part1"):
+                process_new_lead_part1(data)
         
         message.ack()
     except Exception as e:
@@ -1235,11 +1302,28 @@ if __name__ == "__main__":
     if not CRUST_API_KEY:
         print("⚠️ AVISO: CRUST_API_KEY não configurada. Usando apenas Apollo/Lusha.")
     
-    flow_control = pubsub_v1.types.FlowControl(max_messages=2)
+    metrics.instrument_requests()
+    metrics.start_http_server_from_env("agent_3")
+    flow_control = pubsub_v1.types.FlowControl(max_messages=BULK_MAX_MESSAGES)
+    # Lote com fila justa entre usuários (a faixa prioritária já é só de cliques)
+    fair = None
+    if fair_scheduler.FAIR_SCHEDULING:
+        fair = fair_scheduler.FairScheduler("agent_3", workers=BULK_MAX_MESSAGES)
+        flow_control = pubsub_v1.types.FlowControl(max_messages=fair.prefetch)
+    flow_control_priority = pubsub_v1.types.FlowControl(max_messages=PRIORITY_WORKERS)
     print(f"\n💎 Agente 3 (V4.8 - Sócios Universal) ouvindo...")
+    print(f"   - Lote: {SUBSCRIPTION_INPUT} (max {BULK_MAX_MESSAGES})")
+    print(f"   - Prioritária: {SUBSCRIPTION_PRIORITY} ({PRIORITY_WORKERS} workers reservados)")
     
-    with subscriber:
-        try:
-            subscriber.subscribe(subscription_path, callback=callback, flow_control=flow_control).result()
-        except KeyboardInterrupt:
-            print("\n👋 Agente 3 finalizado.")
+    sys.exit(worker_lifecycle.run("agent_3", subscriber, [
+        {"subscription": subscription_path, "callback": callback, "flow_control": flow_control, "fair": fair},
+        {
+            "subscription": subscription_path_priority,
+            "callback": callback,
+            "flow_control": flow_control_priority,
+            "scheduler": ThreadScheduler(ThreadPoolExecutor(
+                max_workers=PRIORITY_WORKERS, thread_name_prefix="agent3-priority"
+            )),
+            "stage": "agent_3_priority",
+        },
+    ], flushers=[publisher.stop, digest.flush]))
@@ -11,8 +11,8 @@ Responsabilidades:
 """
 
 import os
+import sys
 import json
-import requests
 import datetime
 import traceback
 import re
@@ -21,6 +21,11 @@ from google.cloud import pubsub_v1
 from google.cloud import firestore
 from dotenv import load_dotenv
 
+import metrics
+import worker_lifecycle
+import telegram_client
+import tombstones
+
 # --- Banco ---
 try:
     import database
@@ -235,7 +240,8 @@ def generate_copy_gemini(prompt):
     """Gera copy usando Gemini"""
     try:
         model = genai.GenerativeModel(MODELO_GEMINI)
-        response = model.generate_content(prompt)
+        with metrics.timer("llm_call_seconds", provider="gemini", agent="agent_4"):
+            response = model.generate_content(prompt)
         return response.text.strip()
     except Exception as e:
         print(f"   ⚠️ Erro Gemini: {e}")
@@ -359,22 +365,7 @@ def send_telegram(chat_id, text):
     """Envia mensagem para o Telegram"""
     if not TELEGRAM_TOKEN or not chat_id:
         return None
-    try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-        payload = {
-            "chat_id": chat_id,
-            "text": text,
-            "parse_mode": "Markdown",
-            "disable_web_page_preview": True
-        }
-        r = requests.post(url, json=payload, timeout=10)
-        if r.status_code != 200:
-            payload["parse_mode"] = None
-            r = requests.post(url, json=payload, timeout=10)
-        return r.json().get("result", {}).get("message_id") if r.status_code == 200 else None
-    except Exception as e:
-        print(f"⚠️ Erro Telegram: {e}")
-        return None
+    return telegram_client.send_message(chat_id, text)
 
 
 def clean_markdown(text):
@@ -445,6 +436,10 @@ def process_copy_request(data):
     site_socials = data.get("site_socials", [])
     
     print(f"\n✍️ [Copy Request] Processando: {domain}")
+
+    # Copies em lote de uma busca cancelada (/cancel) não gastam Gemini
+    if data.get("bulk") and tombstones.check(data.get("search_id"), "agent_4_copies"):
+        return
     print(f"   📊 Contatos: {len(contacts)} | Stack: {stack_maturity}")
     
     # Se não tem contatos, cria contato genérico
@@ -564,11 +559,11 @@ if __name__ == "__main__":
     print(f"\n📡 Debug Chat: {DEBUG_CHAT_ID}")
     print(f"🤖 Modelo: {MODELO_GEMINI}")
     
+    metrics.instrument_requests()
+    metrics.start_http_server_from_env("agent_4")
     flow_control = pubsub_v1.types.FlowControl(max_messages=2)
     print(f"\n✍️ Agente 4 (V1.0 - Gemini Powered) ouvindo: {SUBSCRIPTION_INPUT}")
     
-    with subscriber:
-        try:
-            subscriber.subscribe(subscription_path, callback=callback, flow_control=flow_control).result()
-        except KeyboardInterrupt:
-            pass
+    sys.exit(worker_lifecycle.run("agent_4", subscriber, [
+        {"subscription": subscription_path, "callback": callback, "flow_control": flow_control},
+    ]))
@@ -0,0 +1,153 @@
+"""
+BACKPRESSURE.PY - SalesMachine
+Controle de vazão da esteira (usado pelo Agente 1 antes de publicar)
+
+Responsabilidades:
+- Medir a carga dos agentes de baixo (backlog + em processamento)
+  1) Cloud Monitoring (num_undelivered_messages) - produção
+  2) Endpoints /metrics dos agentes (pubsub_inflight_messages) - DOWNSTREAM_METRICS_URLS
+- Transformar a carga em "orçamento" de publicação (quantos leads cabem agora)
+- Cache curto do probe para não martelar as APIs a cada lead
+
+Sem nenhuma fonte configurada o orçamento é "desconhecido" e nada é segurado.
+"""
+
+import os
+import time
+import threading
+import requests
+from dotenv import load_dotenv
+
+import metrics
+import sharding
+
+load_dotenv()
+
+PROJECT_ID = os.getenv("GCP_PROJECT_ID")
+EMULATOR_HOST = os.getenv("PUBSUB_EMULATOR_HOST")
+
+# Filas observadas (Agente 2 e Agente 3 - lote)
+_DEFAULT_WATCHED = ",".join(sharding.all_subscription_names() + ["sub-enricher-worker"])
+WATCHED_SUBSCRIPTIONS = [
+    s.strip() for s in os.getenv("BACKPRESSURE_SUBSCRIPTIONS", _DEFAULT_WATCHED).split(",") if s.strip()
+]
+# Ex: "http://agent2:9102/metrics,http://agent3:9103/metrics"
+DOWNSTREAM_METRICS_URLS = [u.strip() for u in os.getenv("DOWNSTREAM_METRICS_URLS", "").split(",") if u.strip()]
+
+# Quantas mensagens (backlog + em voo) a esteira aguenta antes de segurar novos leads
+DOWNSTREAM_BACKLOG_LIMIT = int(os.getenv("DOWNSTREAM_BACKLOG_LIMIT", "40"))
+PROBE_TTL_SECONDS = int(os.getenv("BACKPRESSURE_PROBE_TTL", "15"))
+
+try:
+    from google.cloud import monitoring_v3
+except ImportError:
+    monitoring_v3 = None
+
+_lock = threading.Lock()
+_cache = {"at": 0.0, "load": None}
+
+
+# ==============================================================================
+# 🔍 FONTES DE CARGA
+# ==============================================================================
+
+def _backlog_from_monitoring():
+    """Soma num_undelivered_messages das filas observadas (None se indisponível)"""
+    if not monitoring_v3 or EMULATOR_HOST or not PROJECT_ID:
+        return None
+    client = monitoring_v3.MetricServiceClient()
+    now = int(time.time())
+    total = 0
+    found = False
+    for sub_name in WATCHED_SUBSCRIPTIONS:
+        results = client.list_time_series(request={
+            "name": f"projects/{PROJECT_ID}",
+            "filter": (
+                'metric.type = "pubsub.googleapis.com/subscription/num_undelivered_messages" '
+                f'AND resource.labels.subscription_id = "{sub_name}"'
+            ),
+            "interval": {"end_time": {"seconds": now}, "start_time": {"seconds": now - 300}},
+            "view": monitoring_v3.ListTimeSeriesRequest.TimeSeriesView.FULL,
+        })
+        for series in results:
+            if series.points:
+                total += series.points[0].value.int64_value
+                found = True
+                break
+    return total if found else None
+
+
+def _sum_metric(text, name):
+    """Soma todas as séries de uma métrica no formato texto do Prometheus"""
+    total = 0.0
+    for line in text.splitlines():
+        if line.startswith(name + "{") or line.startswith(name + " "):
+            try:
+                total += float(line.rsplit(" ", 1)[1])
+            except (IndexError, ValueError):
+                pass
+    return total
+
+
+def _inflight_from_metrics_endpoints():
+    """Soma pubsub_inflight_messages dos agentes de baixo (None se nenhum respondeu)"""
+    if not DOWNSTREAM_METRICS_URLS:
+        return None
+    total = 0
+    answered = False
+    for url in DOWNSTREAM_METRICS_URLS:
+        try:
+            resp = requests.get(url, timeout=2)
+            if resp.status_code == 200:
+                total += int(_sum_metric(resp.text, "pubsub_inflight_messages"))
+                answered = True
+        except Exception:
+            pass
+    return total if answered else None
+
+
+def downstream_load(force=False):
+    """
+    Retorna {"backlog": int|None, "inflight": int|None, "total": int|None}.
+    Resultado é cacheado por PROBE_TTL_SECONDS.
+    """
+    with _lock:
+        if not force and _cache["load"] and time.monotonic() - _cache["at"] < PROBE_TTL_SECONDS:
+            return _cache["load"]
+
+    backlog = None
+    inflight = None
+    try:
+        backlog = _backlog_from_monitoring()
+    except Exception as e:
+        print(f"   ⚠️ Backpressure: Monitoring falhou ({e})")
+    inflight = _inflight_from_metrics_endpoints()
+
+    known = [v for v in (backlog, inflight) if v is not None]
+    load = {"backlog": backlog, "inflight": inflight, "total": sum(known) if known else None}
+    if load["total"] is not None:
+        metrics.set_gauge("downstream_load_messages", load["total"])
+
+    with _lock:
+        _cache["at"] = time.monotonic()
+        _cache["load"] = load
+    return load
+
+
+def available_budget(force=False):
+    """
+    Quantos leads ainda cabem na esteira agora.
+    None = carga desconhecida (nenhuma fonte configurada) -> não segurar.
+    """
+    total = downstream_load(force).get("total")
+    if total is None:
+        return None
+    return max(0, DOWNSTREAM_BACKLOG_LIMIT - total)
+
+
+def consume_budget(amount=1):
+    """Desconta do probe cacheado os leads recém-publicados (evita estourar até o próximo probe)"""
+    with _lock:
+        load = _cache.get("load")
+        if load and load.get("total") is not None:
+            load["total"] += amount
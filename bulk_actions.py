@@ -0,0 +1,134 @@
+"""
+BULK_ACTIONS.PY - SalesMachine
+Ações em lote sobre os leads de uma busca (botões no Telegram, tratados pelo Agente 0)
+
+Responsabilidades:
+- Teclado de ações da busca (BULK_ENRICH:<search_id>:<N>, BULK_DISCARD:<search_id>, BULK_COPIES:<search_id>)
+- Enriquecer o top N por preliminary_score
+- Descartar o resto (aguardando decisão ou ainda na fila de espera)
+- Gerar copies de todos os enriquecidos
+- Tudo com WriteBatch no Firestore e publishes em rajada (o client do Pub/Sub agrupa)
+"""
+
+import os
+import json
+import datetime
+from datetime import timezone
+
+from dotenv import load_dotenv
+
+import metrics
+import database
+import digest
+
+load_dotenv()
+
+BULK_ENRICH_TOP_N = int(os.getenv("BULK_ENRICH_TOP_N", "5"))
+PUBLISH_TIMEOUT_SECONDS = 30
+
+PENDING_DECISION = {"WAITING_DECISION"}
+DISCARDABLE = {"WAITING_DECISION", "QUEUED"}
+
+
+def bulk_keyboard(search_id, top_n=None):
+    """Linhas de botões de ação em lote para uma busca"""
+    top_n = top_n or BULK_ENRICH_TOP_N
+    return [
+        [
+            {"text": f"🚀 Enriquecer top {top_n}", "callback_data": f"BULK_ENRICH:{search_id}:{top_n}"},
+            {"text": "🗑 Descartar resto", "callback_data": f"BULK_DISCARD:{search_id}"},
+        ],
+        [{"text": "✍️ Copies dos enriquecidos", "callback_data": f"BULK_COPIES:{search_id}"}],
+    ]
+
+
+def _publish_all(publisher, topic_path, payloads):
+    """Publica tudo de uma vez e só então espera as confirmações. Retorna quantos foram aceitos."""
+    futures = [publisher.publish(topic_path, json.dumps(p).encode("utf-8")) for p in payloads]
+    ok = 0
+    for future in futures:
+        try:
+            future.result(timeout=PUBLISH_TIMEOUT_SECONDS)
+            ok += 1
+        except Exception as e:
+            print(f"⚠️ Publish em lote falhou: {e}")
+    return ok
+
+
+def copy_payload(lead, chat_id):
+    """Payload do Agente 4 a partir do doc do lead enriquecido"""
+    company = lead.get("crust_company") or {}
+    return {
+        "domain": lead.get("domain"),
+        "company_name": company.get("name", lead.get("domain")),
+        "contacts": lead.get("people_data", []),
+        "tech_summary": lead.get("tech_summary", {}),
+        "chat_id": chat_id,
+        "stack_maturity": lead.get("stack_maturity", "unknown"),
+        "site_emails": lead.get("site_emails") or lead.get("scraped_emails", []),
+        "site_socials": lead.get("site_socials") or lead.get("scraped_socials", []),
+        "brasil_api_data": lead.get("brasil_data") or {},
+    }
+
+
+def top_pending(search_id, top_n):
+    """Domínios dos N melhores leads (preliminary_score) ainda aguardando decisão"""
+    leads = database.get_leads_by_search(search_id, PENDING_DECISION)
+    leads.sort(key=lambda l: l.get("preliminary_score") or 0, reverse=True)
+    return [l["domain"] for l in leads if l.get("domain")][:top_n]
+
+
+def enrich_top(publisher, topic_path, search_id, chat_id, top_n, domains=None):
+    """
+    Manda os N melhores leads da busca para a Parte 2 do Agente 3.
+    `domains` (de top_pending) evita reler a busca quando quem chama já contou os candidatos.
+    """
+    if domains is None:
+        domains = top_pending(search_id, top_n)
+    domains = domains[:top_n]
+    if not domains:
+        return 0
+
+    database.bulk_update_status(domains, "ENRICH_REQUESTED")
+    sent = _publish_all(publisher, topic_path, [{
+        "command": "FETCH_PEOPLE",
+        "domain": domain,
+        "chat_id": chat_id,
+        "message_id": None,
+        "search_id": search_id,
+        "bulk": True,
+    } for domain in domains])
+    digest.mark_leads(search_id, {d: "enriching" for d in domains}, immediate=True)
+    metrics.inc("bulk_actions_total", action="enrich")
+    metrics.inc("bulk_action_leads_total", sent, action="enrich")
+    return sent
+
+
+def discard_rest(search_id):
+    """Descarta tudo que ainda não foi decidido (inclui o que está na fila de espera do Agente 1)"""
+    leads = database.get_leads_by_search(search_id, DISCARDABLE)
+    domains = [l["domain"] for l in leads if l.get("domain")]
+    if not domains:
+        return 0
+    done = database.bulk_update_status(domains, "DISCARDED_BY_USER")
+    digest.mark_leads(search_id, {d: "discarded" for d in domains}, immediate=True)
+    metrics.inc("bulk_actions_total", action="discard")
+    metrics.inc("bulk_action_leads_total", done, action="discard")
+    return done
+
+
+def copies_for_enriched(publisher, topic_path, search_id, chat_id):
+    """Pede copies ao Agente 4 para todos os leads enriquecidos da busca"""
+    leads = database.get_leads_by_search(search_id, {"ENRICHED"})
+    if not leads:
+        return 0
+    sent = _publish_all(publisher, topic_path, [
+        dict(copy_payload(l, chat_id), search_id=search_id, bulk=True) for l in leads
+    ])
+    database.bulk_update_leads(
+        [l["domain"] for l in leads if l.get("domain")],
+        {"copies_requested_at": datetime.datetime.now(timezone.utc)},
+    )
+    metrics.inc("bulk_actions_total", action="copies")
+    metrics.inc("bulk_action_leads_total", sent, action="copies")
+    return sent
@@ -0,0 +1,97 @@
+"""
+CHAT_DISPATCHER.PY - SalesMachine
+Processamento concorrente de updates do Telegram no Agente 0
+
+Responsabilidades:
+- Processar chats diferentes em paralelo (pool com teto global de workers)
+- Manter a ORDEM dentro de um mesmo chat (uma fila por chat, um worker por vez)
+- Fila por chat limitada: se um usuário dispara mensagens demais, o excesso é recusado
+  (force=True passa do teto: mensagem já agregada pelo debounce não pode ser perdida)
+- Justiça: um chat com fila longa devolve o worker depois de ROUTER_CHAT_BATCH itens
+"""
+
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+ROUTER_WORKERS = int(os.getenv("ROUTER_WORKERS", "8"))
+ROUTER_CHAT_QUEUE = int(os.getenv("ROUTER_CHAT_QUEUE", "20"))
+ROUTER_CHAT_BATCH = int(os.getenv("ROUTER_CHAT_BATCH", "5"))
+
+
+def chat_key(update):
+    """Chave de ordenação do update (chat de origem)"""
+    if "callback_query" in update:
+        return update["callback_query"].get("message", {}).get("chat", {}).get("id")
+    for kind in ("message", "edited_message"):
+        if kind in update:
+            return update[kind].get("chat", {}).get("id")
+    return None
+
+
+class ChatDispatcher:
+    """Fila por chat + pool global. submit() nunca bloqueia."""
+
+    def __init__(self, handler, max_workers=None, max_per_chat=None, batch=None):
+        self._handler = handler
+        self._max_per_chat = max_per_chat or ROUTER_CHAT_QUEUE
+        self._batch = batch or ROUTER_CHAT_BATCH
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or ROUTER_WORKERS, thread_name_prefix="router")
+        self._lock = threading.Lock()
+        self._queues = {}       # chat -> deque de updates pendentes
+        self._active = set()    # chats com um worker agendado/rodando
+        self._pending = 0
+
+    def submit(self, update, force=False):
+        """Enfileira o update. Retorna False se a fila do chat está cheia (e não é force)."""
+        key = chat_key(update)
+        with self._lock:
+            q = self._queues.setdefault(key, deque())
+            if len(q) >= self._max_per_chat and not force:
+                metrics.inc("router_updates_rejected_total", reason="chat_queue_full")
+                return False
+            q.append(update)
+            self._pending += 1
+            metrics.set_gauge("router_pending_updates", self._pending)
+            if key in self._active:
+                return True
+            self._active.add(key)
+        self._pool.submit(self._drain, key)
+        return True
+
+    def _drain(self, key):
+        """Processa até `batch` updates do chat e, se sobrou, volta para o fim da fila do pool"""
+        for _ in range(self._batch):
+            with self._lock:
+                q = self._queues.get(key)
+                if not q:
+                    self._active.discard(key)
+                    self._queues.pop(key, None)
+                    return
+                update = q.popleft()
+                self._pending -= 1
+                metrics.set_gauge("router_pending_updates", self._pending)
+            try:
+                self._handler(update)
+            except Exception as e:
+                print(f"⚠️ Erro processando update {update.get('update_id')}: {e}")
+
+        with self._lock:
+            if not self._queues.get(key):
+                self._active.discard(key)
+                self._queues.pop(key, None)
+                return
+        self._pool.submit(self._drain, key)
+
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
@@ -1,44 +1,11 @@
-import os
-from google.cloud import pubsub_v1
-from dotenv import load_dotenv
-
-load_dotenv()
-project_id = os.getenv("GCP_PROJECT_ID")
-subscriber = pubsub_v1.SubscriberClient()
-
-# Lista de todas as assinaturas do nosso projeto
-subscriptions = [
-    "sub-telegram-input",   # Fila do Agente 1
-    "sub-tech-checker",     # Fila do Agente 2
-    "sub-enricher-worker"   # Fila do Agente 3
-]
-
-print(f"🧹 INICIANDO FAXINA NO PROJETO: {project_id}...\n")
-
-for sub_name in subscriptions:
-    subscription_path = subscriber.subscription_path(project_id, sub_name)
-    print(f"🗑️ Verificando fila: {sub_name}...")
-    
-    try:
-        # Tenta puxar até 100 mensagens de uma vez
-        response = subscriber.pull(
-            request={"subscription": subscription_path, "max_messages": 100}
-        )
-        
-        if not response.received_messages:
-            print("   ✅ Fila já estava vazia.")
-            continue
-
-        ack_ids = [msg.ack_id for msg in response.received_messages]
-        
-        # Confirma o recebimento (isso deleta a mensagem da fila)
-        subscriber.acknowledge(
-            request={"subscription": subscription_path, "ack_ids": ack_ids}
-        )
-        
-        print(f"   🔥 {len(ack_ids)} mensagens antigas deletadas!")
-        
-    except Exception as e:
-        print(f"   ⚠️ Fila vazia ou inexistente (pode ignorar).")
-
-print("\n✨ Tudo limpo!")
+"""
+Faxina das filas: descarta o backlog INTEIRO de todas as assinaturas da topologia.
+Atalho para `python queue_ops.py purge --all --yes` (seek-to-now com fallback pull+ack paralelo).
+Roda o próprio CLI do queue_ops: assinatura inexistente ou sem permissão aparece no
+relatório e o processo sai com código 1 (nada de "Tudo limpo!" em cima de erro).
+"""
+import sys
+import runpy
+
+sys.argv = ["queue_ops.py", "purge", "--all", "--yes"] + sys.argv[1:]
+runpy.run_module("queue_ops", run_name="__main__")
@@ -0,0 +1,251 @@
+"""
+CONVERSATION_STORE.PY - SalesMachine
+Memória de conversa do Agente 0 (histórico curto por chat)
+
+Responsabilidades:
+- Cache local limitado: LRU por chat, TTL de inatividade e teto de memória
+- Backend persistente opcional (carregado sob demanda na primeira mensagem do chat)
+  - memory   -> só processo (padrão, igual ao comportamento antigo)
+  - sqlite   -> arquivo local, sobrevive a restart
+  - firestore-> compartilhado entre réplicas do roteador (coleção `conversations`)
+- Com backend compartilhado, a cópia local é revalidada a cada CONVERSATION_SYNC_SECONDS
+
+Configuração:
+    CONVERSATION_BACKEND=memory|sqlite|firestore
+    CONVERSATION_MAX_CHATS=1000
+    CONVERSATION_TTL_HOURS=24
+    CONVERSATION_MAX_BYTES=5000000
+"""
+
+import os
+import json
+import time
+import sqlite3
+import datetime
+import threading
+from collections import OrderedDict
+from datetime import timezone
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+CONVERSATION_BACKEND = os.getenv("CONVERSATION_BACKEND", "memory").lower()
+CONVERSATION_MAX_CHATS = int(os.getenv("CONVERSATION_MAX_CHATS", "1000"))
+CONVERSATION_TTL_HOURS = float(os.getenv("CONVERSATION_TTL_HOURS", "24"))
+CONVERSATION_MAX_BYTES = int(os.getenv("CONVERSATION_MAX_BYTES", "5000000"))
+CONVERSATION_SYNC_SECONDS = float(os.getenv("CONVERSATION_SYNC_SECONDS", "10"))
+CONVERSATION_SQLITE_PATH = os.getenv("CONVERSATION_SQLITE_PATH", "conversations.db")
+COLLECTION_CONVERSATIONS = "conversations"
+
+MAX_MESSAGE_CHARS = 1000
+SQLITE_PURGE_INTERVAL_SECONDS = 3600   # Varredura de conversas vencidas no arquivo
+
+
+# ==============================================================================
+# 💾 BACKENDS
+# ==============================================================================
+
+class SqliteBackend:
+    """Arquivo local. Conversas mais velhas que o TTL saem na abertura e a cada hora."""
+
+    def __init__(self, path=CONVERSATION_SQLITE_PATH, ttl_hours=None):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._ttl = (ttl_hours if ttl_hours is not None else CONVERSATION_TTL_HOURS) * 3600
+        self._purged_at = 0.0
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "chat_id TEXT PRIMARY KEY, lines TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+        self._purge_expired()
+
+    def _purge_expired(self):
+        now = time.time()
+        self._purged_at = now
+        removed = self.purge_older_than(now - self._ttl)
+        if removed:
+            metrics.inc("conversation_evictions_total", removed, reason="sqlite_ttl")
+
+    def load(self, chat_id):
+        """Retorna (lines, updated_at_epoch) ou None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT lines, updated_at FROM conversations WHERE chat_id = ?", (str(chat_id),)
+            ).fetchone()
+        if not row:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def save(self, chat_id, lines, updated_at):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO conversations (chat_id, lines, updated_at) VALUES (?, ?, ?)",
+                (str(chat_id), json.dumps(lines, ensure_ascii=False), updated_at),
+            )
+            self._conn.commit()
+        if time.time() - self._purged_at > SQLITE_PURGE_INTERVAL_SECONDS:
+            self._purge_expired()
+
+    def purge_older_than(self, cutoff):
+        """Apaga conversas sem atividade desde `cutoff` (epoch). Retorna quantas saíram."""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM conversations WHERE updated_at < ?", (cutoff,)).rowcount
+            self._conn.commit()
+        return removed
+
+
+class FirestoreBackend:
+    shared = True
+
+    def __init__(self, db):
+        self._db = db
+
+    def load(self, chat_id):
+        with metrics.timer("firestore_op_seconds", op="get", collection=COLLECTION_CONVERSATIONS):
+            doc = self._db.collection(COLLECTION_CONVERSATIONS).document(str(chat_id)).get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        updated_at = data.get("updated_at")
+        return data.get("lines", []), updated_at.timestamp() if updated_at else 0.0
+
+    def save(self, chat_id, lines, updated_at):
+        now = datetime.datetime.fromtimestamp(updated_at, timezone.utc)
+        with metrics.timer("firestore_op_seconds", op="set", collection=COLLECTION_CONVERSATIONS):
+            self._db.collection(COLLECTION_CONVERSATIONS).document(str(chat_id)).set({
+                "lines": lines,
+                "updated_at": now,
+                # TTL policy do Firestore apaga conversas abandonadas
+                "expires_at": now + datetime.timedelta(hours=CONVERSATION_TTL_HOURS),
+            })
+
+
+# ==============================================================================
+# 🧠 STORE
+# ==============================================================================
+
+class ConversationStore:
+    """Histórico por chat com LRU + TTL + teto de bytes e write-through no backend"""
+
+    def __init__(self, backend=None, history_limit=6, max_chats=None, ttl_hours=None, max_bytes=None):
+        self._backend = backend
+        self._shared = getattr(backend, "shared", False)
+        self.history_limit = history_limit
+        self._max_chats = max_chats or CONVERSATION_MAX_CHATS
+        self._ttl = (ttl_hours if ttl_hours is not None else CONVERSATION_TTL_HOURS) * 3600
+        self._max_bytes = max_bytes or CONVERSATION_MAX_BYTES
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # chat -> {"lines", "touched", "synced", "bytes"}
+        self._bytes = 0
+
+    @staticmethod
+    def _size(lines):
+        return sum(len(line) for line in lines)
+
+    def _drop(self, chat_id):
+        entry = self._entries.pop(chat_id, None)
+        if entry:
+            self._bytes -= entry["bytes"]
+
+    def _evict(self):
+        """Remove expirados e, se ainda estourar, os menos usados (lock já adquirido)"""
+        now = time.time()
+        while self._entries:
+            oldest_key, oldest = next(iter(self._entries.items()))
+            expired = now - oldest["touched"] > self._ttl
+            too_many = len(self._entries) > self._max_chats
+            too_big = self._bytes > self._max_bytes
+            if not (expired or too_many or too_big):
+                break
+            self._drop(oldest_key)
+            metrics.inc("conversation_evictions_total", reason="ttl" if expired else "capacity")
+        metrics.set_gauge("conversation_cached_chats", len(self._entries))
+        metrics.set_gauge("conversation_cached_bytes", self._bytes)
+
+    def _load(self, chat_id):
+        """Lê do backend (fora do lock). Histórico velho demais é ignorado."""
+        if self._backend is None:
+            return []
+        try:
+            found = self._backend.load(chat_id)
+        except Exception as e:
+            print(f"⚠️ Conversa: falha ao carregar {chat_id} ({e})")
+            return None
+        metrics.inc("conversation_loads_total", found=str(bool(found)).lower())
+        if not found:
+            return []
+        lines, updated_at = found
+        if time.time() - updated_at > self._ttl:
+            return []
+        return list(lines)[-self.history_limit:]
+
+    def _entry(self, chat_id):
+        """Entrada local do chat, carregando do backend quando necessário"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry and now - entry["touched"] > self._ttl:
+                self._drop(chat_id)
+                entry = None
+            fresh = entry and (not self._shared or now - entry["synced"] < CONVERSATION_SYNC_SECONDS)
+            if fresh:
+                self._entries.move_to_end(chat_id)
+                return entry
+
+        lines = self._load(chat_id)
+        with self._lock:
+            if lines is None:
+                # Backend indisponível: segue com o que tiver local
+                lines = self._entries[chat_id]["lines"] if chat_id in self._entries else []
+            self._drop(chat_id)
+            entry = {"lines": lines, "touched": now, "synced": now, "bytes": self._size(lines)}
+            self._entries[chat_id] = entry
+            self._bytes += entry["bytes"]
+            self._evict()
+            return entry
+
+    def get(self, chat_id):
+        """Histórico recente do chat (lista de "Role: texto")"""
+        return list(self._entry(chat_id)["lines"])
+
+    def append(self, chat_id, role, message):
+        entry = self._entry(chat_id)
+        line = f"{role}: {str(message)[:MAX_MESSAGE_CHARS]}"
+        now = time.time()
+        with self._lock:
+            lines = (entry["lines"] + [line])[-self.history_limit:]
+            if chat_id in self._entries:
+                self._bytes -= self._entries[chat_id]["bytes"]
+            entry.update({"lines": lines, "touched": now, "synced": now, "bytes": self._size(lines)})
+            self._entries[chat_id] = entry
+            self._entries.move_to_end(chat_id)
+            self._bytes += entry["bytes"]
+            self._evict()
+
+        if self._backend is not None:
+            try:
+                self._backend.save(chat_id, lines, now)
+            except Exception as e:
+                print(f"⚠️ Conversa: falha ao salvar {chat_id} ({e})")
+
+
+def from_env(db=None, history_limit=6):
+    """Monta o store conforme CONVERSATION_BACKEND (cai para memória se não der)"""
+    backend = None
+    try:
+        if CONVERSATION_BACKEND == "sqlite":
+            backend = SqliteBackend()
+        elif CONVERSATION_BACKEND == "firestore":
+            if db is None:
+                raise ValueError("cliente Firestore indisponível")
+            backend = FirestoreBackend(db)
+    except Exception as e:
+        print(f"⚠️ Backend de conversa '{CONVERSATION_BACKEND}' indisponível ({e}). Usando memória.")
+        backend = None
+    if backend is not None:
+        print(f"🧠 Memória de conversa persistente: {CONVERSATION_BACKEND}")
+    return ConversationStore(backend, history_limit=history_limit)
@@ -8,6 +8,8 @@ from google.cloud import firestore
 from dotenv import load_dotenv
 from datetime import timezone
 
+import metrics
+
 load_dotenv()
 
 PROJECT_ID = os.getenv("GCP_PROJECT_ID", "databasecaracol")
@@ -30,30 +32,37 @@ def check_lead_exists(domain):
     if not db: return False
     try:
         doc_ref = db.collection(COLLECTION_NAME).document(domain)
-        doc = doc_ref.get()
+        with metrics.timer("firestore_op_seconds", op="get", collection=COLLECTION_NAME):
+            doc = doc_ref.get()
         if not doc.exists: return False
-        data = doc.to_dict()
-        last_date = data.get("created_at") or data.get("enriched_date")
-        if not last_date: return False
-        now = datetime.datetime.now(timezone.utc)
-        if last_date.tzinfo is None:
-            last_date = last_date.replace(tzinfo=timezone.utc)
-        diferenca = now - last_date
-        if diferenca.days > DIAS_PARA_REPROSPECTAR:
-            print(f"   ♻️ Lead antigo ({diferenca.days} dias). Reciclando: {domain}")
-            return False
-        return True
+        return _is_recent_lead(domain, doc.to_dict())
     except Exception as e:
         print(f"⚠️ Erro ao checar banco: {e}")
         return True
 
+def _is_recent_lead(domain, data):
+    """Lead prospectado há menos de DIAS_PARA_REPROSPECTAR (senão pode ser reciclado)"""
+    last_date = data.get("created_at") or data.get("enriched_date")
+    if not last_date: return False
+    now = datetime.datetime.now(timezone.utc)
+    if last_date.tzinfo is None:
+        last_date = last_date.replace(tzinfo=timezone.utc)
+    diferenca = now - last_date
+    if diferenca.days > DIAS_PARA_REPROSPECTAR:
+        print(f"   ♻️ Lead antigo ({diferenca.days} dias). Reciclando: {domain}")
+        return False
+    return True
+
 def get_cnpj_cache(cnpj):
     if not db or not cnpj: return None
     try:
         cnpj_limpo = "".join(filter(str.isdigit, str(cnpj)))
         doc_ref = db.collection(COLLECTION_CNPJ_CACHE).document(cnpj_limpo)
-        doc = doc_ref.get()
-        if not doc.exists: return None
+        with metrics.timer("firestore_op_seconds", op="get", collection=COLLECTION_CNPJ_CACHE):
+            doc = doc_ref.get()
+        if not doc.exists:
+            metrics.inc("cache_requests_total", cache="cnpj", result="miss")
+            return None
         data = doc.to_dict()
         cached_at = data.get("cached_at")
         if not cached_at: return None
@@ -61,7 +70,10 @@ def get_cnpj_cache(cnpj):
         if cached_at.tzinfo is None:
             cached_at = cached_at.replace(tzinfo=timezone.utc)
         diferenca = now - cached_at
-        if diferenca.days > DIAS_CACHE_CNPJ: return None
+        if diferenca.days > DIAS_CACHE_CNPJ:
+            metrics.inc("cache_requests_total", cache="cnpj", result="expired")
+            return None
+        metrics.inc("cache_requests_total", cache="cnpj", result="hit")
         print(f"   💾 Cache CNPJ válido: {cnpj_limpo}")
         return data.get("brasil_api_data")
     except Exception as e:
@@ -72,11 +84,12 @@ def save_cnpj_cache(cnpj, brasil_api_data):
     if not db or not cnpj: return
     try:
         cnpj_limpo = "".join(filter(str.isdigit, str(cnpj)))
-        db.collection(COLLECTION_CNPJ_CACHE).document(cnpj_limpo).set({
-            "cnpj": cnpj_limpo,
-            "brasil_api_data": brasil_api_data,
-            "cached_at": datetime.datetime.now(timezone.utc)
-        })
+        with metrics.timer("firestore_op_seconds", op="set", collection=COLLECTION_CNPJ_CACHE):
+            db.collection(COLLECTION_CNPJ_CACHE).document(cnpj_limpo).set({
+                "cnpj": cnpj_limpo,
+                "brasil_api_data": brasil_api_data,
+                "cached_at": datetime.datetime.now(timezone.utc)
+            })
         print(f"💾 [DB] Cache CNPJ salvo: {cnpj_limpo}")
     except Exception as e:
         print(f"⚠️ Erro salvar cache CNPJ: {e}")
@@ -84,19 +97,35 @@ def save_cnpj_cache(cnpj, brasil_api_data):
 def get_lead(domain):
     if not db: return None
     try:
-        doc = db.collection(COLLECTION_NAME).document(domain).get()
+        with metrics.timer("firestore_op_seconds", op="get", collection=COLLECTION_NAME):
+            doc = db.collection(COLLECTION_NAME).document(domain).get()
         return doc.to_dict() if doc.exists else None
     except: return None
 
-def save_new_lead(domain, origin_query):
+def get_leads(domains):
+    """Vários leads num round-trip só (get_all). Retorna {domain: dados}."""
+    if not db or not domains: return {}
+    try:
+        refs = [db.collection(COLLECTION_NAME).document(d) for d in domains]
+        with metrics.timer("firestore_op_seconds", op="get_all", collection=COLLECTION_NAME):
+            return {snap.id: snap.to_dict() for snap in db.get_all(refs) if snap.exists}
+    except Exception as e:
+        print(f"⚠️ Erro leitura em lote: {e}")
+        return {}
+
+def save_new_lead(domain, origin_query, search_id=None):
     if not db: return
     try:
-        db.collection(COLLECTION_NAME).document(domain).set({
+        data = {
             "domain": domain,
             "created_at": datetime.datetime.now(timezone.utc),
             "status": "NEW",
             "origin_query": origin_query
-        }, merge=True)
+        }
+        if search_id:
+            data["search_id"] = search_id
+        with metrics.timer("firestore_op_seconds", op="set", collection=COLLECTION_NAME):
+            db.collection(COLLECTION_NAME).document(domain).set(data, merge=True)
         print(f"💾 [DB] Salvo: {domain}")
     except Exception as e:
         print(f"⚠️ Erro salvar lead: {e}")
@@ -106,7 +135,8 @@ def update_techs(domain, data_dict):
     try:
         data_dict["tech_date"] = datetime.datetime.now(timezone.utc)
         data_dict["status"] = "TECH_OK"
-        db.collection(COLLECTION_NAME).document(domain).set(data_dict, merge=True)
+        with metrics.timer("firestore_op_seconds", op="set", collection=COLLECTION_NAME):
+            db.collection(COLLECTION_NAME).document(domain).set(data_dict, merge=True)
         print(f"💾 [DB] Techs: {domain}")
     except Exception as e:
         print(f"⚠️ Erro techs: {e}")
@@ -116,7 +146,8 @@ def update_enrichment(domain, data_dict):
     try:
         data_dict["enriched_date"] = datetime.datetime.now(timezone.utc)
         data_dict["status"] = data_dict.get("status", "ENRICHED")
-        db.collection(COLLECTION_NAME).document(domain).set(data_dict, merge=True)
+        with metrics.timer("firestore_op_seconds", op="set", collection=COLLECTION_NAME):
+            db.collection(COLLECTION_NAME).document(domain).set(data_dict, merge=True)
         print(f"💾 [DB] Enrich: {domain}")
     except Exception as e:
         print(f"⚠️ Erro enrich: {e}")
@@ -124,11 +155,12 @@ def update_enrichment(domain, data_dict):
 def update_copies(domain, copies_data):
     if not db: return
     try:
-        db.collection(COLLECTION_NAME).document(domain).set({
-            "copies": copies_data,
-            "copies_generated_at": datetime.datetime.now(timezone.utc),
-            "status": "COPIES_READY"
-        }, merge=True)
+        with metrics.timer("firestore_op_seconds", op="set", collection=COLLECTION_NAME):
+            db.collection(COLLECTION_NAME).document(domain).set({
+                "copies": copies_data,
+                "copies_generated_at": datetime.datetime.now(timezone.utc),
+                "status": "COPIES_READY"
+            }, merge=True)
         print(f"💾 [DB] Copies: {domain}")
     except Exception as e:
         print(f"⚠️ Erro copies: {e}")
@@ -137,11 +169,430 @@ def save_debug_log(agent_name, direction, payload, domain=None):
     if not db: return
     try:
         doc_id = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{agent_name}_{direction}"
-        db.collection(COLLECTION_DEBUG).document(doc_id).set({
-            "timestamp": datetime.datetime.now(timezone.utc),
-            "agent": agent_name,
-            "direction": direction,
-            "domain": domain or (payload.get("domain", "?") if isinstance(payload, dict) else "?"),
-            "payload_preview": str(payload)[:2000]
-        })
+        with metrics.timer("firestore_op_seconds", op="set", collection=COLLECTION_DEBUG):
+            db.collection(COLLECTION_DEBUG).document(doc_id).set({
+                "timestamp": datetime.datetime.now(timezone.utc),
+                "agent": agent_name,
+                "direction": direction,
+                "domain": domain or (payload.get("domain", "?") if isinstance(payload, dict) else "?"),
+                "payload_preview": str(payload)[:2000]
+            })
     except: pass
+
+# ==============================================================================
+# 📦 OPERAÇÕES EM LOTE (ações por busca no Telegram)
+# ==============================================================================
+
+FIRESTORE_BATCH_LIMIT = 500
+
+def get_leads_by_search(search_id, statuses=None):
+    """Leads de uma busca (filtro de status no cliente - sem índice composto)"""
+    if not db or not search_id: return []
+    try:
+        with metrics.timer("firestore_op_seconds", op="query", collection=COLLECTION_NAME):
+            docs = db.collection(COLLECTION_NAME).where("search_id", "==", search_id).stream()
+            leads = [d.to_dict() for d in docs]
+        if statuses:
+            leads = [l for l in leads if l.get("status") in statuses]
+        return leads
+    except Exception as e:
+        print(f"⚠️ Erro ler leads da busca: {e}")
+        return []
+
+def bulk_update_leads(domains, fields):
+    """Aplica o mesmo update em vários leads com WriteBatch (1 round-trip a cada 500). Retorna quantos."""
+    if not db or not domains: return 0
+    done = 0
+    try:
+        domains = list(domains)
+        for i in range(0, len(domains), FIRESTORE_BATCH_LIMIT):
+            batch = db.batch()
+            chunk = domains[i:i + FIRESTORE_BATCH_LIMIT]
+            for domain in chunk:
+                batch.update(db.collection(COLLECTION_NAME).document(domain), fields)
+            with metrics.timer("firestore_op_seconds", op="batch_update", collection=COLLECTION_NAME):
+                batch.commit()
+            done += len(chunk)
+        print(f"💾 [DB] Lote: {done} leads atualizados")
+    except Exception as e:
+        print(f"⚠️ Erro update em lote: {e}")
+    return done
+
+def bulk_update_status(domains, status):
+    return bulk_update_leads(domains, {"status": status, "last_update": datetime.datetime.now(timezone.utc)})
+
+def existing_leads(domains):
+    """check_lead_exists em lote (get_all): conjunto dos domínios que NÃO devem ser prospectados"""
+    if not db or not domains: return set()
+    found = set()
+    domains = list(domains)
+    try:
+        for i in range(0, len(domains), FIRESTORE_BATCH_LIMIT):
+            refs = [db.collection(COLLECTION_NAME).document(d) for d in domains[i:i + FIRESTORE_BATCH_LIMIT]]
+            with metrics.timer("firestore_op_seconds", op="get_all", collection=COLLECTION_NAME):
+                for snap in db.get_all(refs):
+                    if snap.exists and _is_recent_lead(snap.id, snap.to_dict()):
+                        found.add(snap.id)
+        return found
+    except Exception as e:
+        print(f"⚠️ Erro ao checar banco em lote: {e}")
+        # Mesmo critério do check_lead_exists: na dúvida, não reprospecta
+        return set(domains)
+
+def bulk_save_new_leads(domains, origin_query, search_id=None):
+    """save_new_lead em lote (WriteBatch de até 500). Retorna quantos foram gravados."""
+    if not db or not domains: return 0
+    done = 0
+    now = datetime.datetime.now(timezone.utc)
+    domains = list(domains)
+    try:
+        for i in range(0, len(domains), FIRESTORE_BATCH_LIMIT):
+            batch = db.batch()
+            chunk = domains[i:i + FIRESTORE_BATCH_LIMIT]
+            for domain in chunk:
+                data = {"domain": domain, "created_at": now, "status": "NEW", "origin_query": origin_query}
+                if search_id:
+                    data["search_id"] = search_id
+                batch.set(db.collection(COLLECTION_NAME).document(domain), data, merge=True)
+            with metrics.timer("firestore_op_seconds", op="batch_set", collection=COLLECTION_NAME):
+                batch.commit()
+            done += len(chunk)
+        print(f"💾 [DB] Lote: {done} leads novos salvos")
+    except Exception as e:
+        print(f"⚠️ Erro salvar leads em lote: {e}")
+    return done
+
+# ==============================================================================
+# ⏳ FILA DE ESPERA (Backpressure do Agente 1)
+# ==============================================================================
+
+def save_queued_lead(domain, origin_query, payload):
+    """Registra lead novo que ficou segurado (esteira cheia) com o payload pronto para publicar"""
+    if not db: return
+    try:
+        now = datetime.datetime.now(timezone.utc)
+        data = {
+            "domain": domain,
+            "created_at": now,
+            "queued_at": now,
+            "status": "QUEUED",
+            "origin_query": origin_query,
+            "queued_payload": payload
+        }
+        # No topo do doc para get_leads_by_search (descartar resto, /cancel) achar o lead
+        for key in ("search_id", "chat_id"):
+            if payload.get(key):
+                data[key] = payload[key]
+        with metrics.timer("firestore_op_seconds", op="set", collection=COLLECTION_NAME):
+            db.collection(COLLECTION_NAME).document(domain).set(data, merge=True)
+        print(f"💾 [DB] Enfileirado: {domain}")
+    except Exception as e:
+        print(f"⚠️ Erro enfileirar lead: {e}")
+
+def get_queued_leads(limit):
+    """Leads segurados aguardando espaço na esteira"""
+    if not db or limit <= 0: return []
+    try:
+        with metrics.timer("firestore_op_seconds", op="query", collection=COLLECTION_NAME):
+            docs = db.collection(COLLECTION_NAME).where("status", "==", "QUEUED").limit(limit).stream()
+            return [d.to_dict() for d in docs]
+    except Exception as e:
+        print(f"⚠️ Erro ler fila de espera: {e}")
+        return []
+
+def claim_queued_lead(domain):
+    """
+    Tira o lead da fila de espera de forma atômica (QUEUED -> NEW).
+    Retorna True só para quem conseguiu o claim (evita publicação dupla entre réplicas).
+    """
+    if not db: return False
+
+    @firestore.transactional
+    def _claim(transaction, doc_ref):
+        snap = doc_ref.get(transaction=transaction)
+        if not snap.exists or snap.to_dict().get("status") != "QUEUED":
+            return False
+        transaction.update(doc_ref, {"status": "NEW", "dequeued_at": datetime.datetime.now(timezone.utc)})
+        return True
+
+    try:
+        with metrics.timer("firestore_op_seconds", op="transaction", collection=COLLECTION_NAME):
+            return _claim(db.transaction(), db.collection(COLLECTION_NAME).document(domain))
+    except Exception as e:
+        print(f"⚠️ Erro claim fila de espera: {e}")
+        return False
+
+# ==============================================================================
+# 🎞️ GRAVAÇÃO DE ENTRADAS POR ESTÁGIO (Replay)
+# ==============================================================================
+
+COLLECTION_STAGE_INPUTS = "stage_inputs"
+
+def save_stage_input(record):
+    """Grava a entrada completa (comprimida) de um estágio. O campo expires_at alimenta a TTL policy."""
+    if not db: return
+    try:
+        doc_id = f"{record['stage']}_{record['message_id']}"
+        with metrics.timer("firestore_op_seconds", op="set", collection=COLLECTION_STAGE_INPUTS):
+            db.collection(COLLECTION_STAGE_INPUTS).document(doc_id).set(record)
+    except Exception as e:
+        print(f"⚠️ Erro gravar entrada de estágio: {e}")
+
+def list_stage_inputs(stage, domain=None, since=None, limit=50):
+    """Entradas gravadas de um estágio (filtro de domínio/data feito no cliente - sem índice composto)"""
+    if not db: return []
+    records = []
+    try:
+        query = db.collection(COLLECTION_STAGE_INPUTS).where("stage", "==", stage)
+        if domain:
+            query = query.where("domain", "==", domain)
+        for doc in query.stream():
+            data = doc.to_dict()
+            recorded_at = data.get("recorded_at")
+            if since and recorded_at and recorded_at < since:
+                continue
+            records.append(data)
+        records.sort(key=lambda r: r.get("recorded_at") or datetime.datetime.min.replace(tzinfo=timezone.utc), reverse=True)
+        return records[:limit]
+    except Exception as e:
+        print(f"⚠️ Erro ler entradas de estágio: {e}")
+        return []
+
+# ==============================================================================
+# 📋 DIGEST DE BUSCA (Agente 3 - previews agrupados)
+# ==============================================================================
+
+COLLECTION_DIGESTS = "search_digests"
+
+def append_digest_entry(search_id, chat_id, query, entry, page_size):
+    """
+    Adiciona um lead ao digest da busca (transação - várias réplicas escrevem no mesmo doc).
+    Retorna (índice do lead, página, message_id da página ou None). None se falhar.
+    Entrada repetida (redelivery) devolve a posição já existente.
+    """
+    if not db: return None
+
+    @firestore.transactional
+    def _append(transaction, doc_ref):
+        snap = doc_ref.get(transaction=transaction)
+        data = snap.to_dict() if snap.exists else {}
+        entries = data.get("entries", [])
+        pages = data.get("pages", {})
+        for i, existing in enumerate(entries):
+            if existing.get("domain") == entry.get("domain"):
+                page = i // page_size
+                return i, page, pages.get(str(page))
+        index = len(entries)
+        entries.append(entry)
+        now = datetime.datetime.now(timezone.utc)
+        transaction.set(doc_ref, {
+            "search_id": search_id,
+            "chat_id": chat_id,
+            "query": query,
+            "entries": entries,
+            "pages": pages,
+            "created_at": data.get("created_at", now),
+            "updated_at": now,
+        })
+        page = index // page_size
+        return index, page, pages.get(str(page))
+
+    try:
+        with metrics.timer("firestore_op_seconds", op="transaction", collection=COLLECTION_DIGESTS):
+            return _append(db.transaction(), db.collection(COLLECTION_DIGESTS).document(search_id))
+    except Exception as e:
+        print(f"⚠️ Erro digest (append): {e}")
+        return None
+
+def set_digest_page_message(search_id, page, message_id):
+    """Registra o message_id da mensagem do Telegram que mostra a página (e solta a reserva)"""
+    if not db: return
+    try:
+        with metrics.timer("firestore_op_seconds", op="update", collection=COLLECTION_DIGESTS):
+            db.collection(COLLECTION_DIGESTS).document(search_id).update({
+                f"pages.`{page}`": message_id,
+                f"page_claims.`{page}`": firestore.DELETE_FIELD,
+            })
+    except Exception as e:
+        print(f"⚠️ Erro digest (página): {e}")
+
+def claim_digest_page(search_id, page, ttl_seconds):
+    """
+    Reserva a criação da mensagem da página (compare-and-set em `page_claims.<n>`).
+    Retorna ("sent", message_id) se a página já tem mensagem, ("mine", None) se a reserva
+    é nossa, ("busy", None) se outra réplica reservou há menos de ttl_seconds e None se falhar.
+    Reserva vencida (réplica morreu antes de enviar) pode ser tomada.
+    """
+    if not db: return None
+
+    @firestore.transactional
+    def _claim(transaction, doc_ref):
+        snap = doc_ref.get(transaction=transaction)
+        if not snap.exists:
+            return None
+        data = snap.to_dict()
+        message_id = data.get("pages", {}).get(str(page))
+        if message_id:
+            return "sent", message_id
+        now = datetime.datetime.now(timezone.utc)
+        claimed_at = data.get("page_claims", {}).get(str(page))
+        if claimed_at and (now - claimed_at).total_seconds() < ttl_seconds:
+            return "busy", None
+        transaction.update(doc_ref, {f"page_claims.`{page}`": now})
+        return "mine", None
+
+    try:
+        with metrics.timer("firestore_op_seconds", op="transaction", collection=COLLECTION_DIGESTS):
+            return _claim(db.transaction(), db.collection(COLLECTION_DIGESTS).document(search_id))
+    except Exception as e:
+        print(f"⚠️ Erro digest (reserva): {e}")
+        return None
+
+def release_digest_page_claim(search_id, page):
+    """Solta a reserva sem mensagem (envio falhou): a próxima edição tenta de novo"""
+    if not db: return
+    try:
+        with metrics.timer("firestore_op_seconds", op="update", collection=COLLECTION_DIGESTS):
+            db.collection(COLLECTION_DIGESTS).document(search_id).update({f"page_claims.`{page}`": firestore.DELETE_FIELD})
+    except Exception as e:
+        print(f"⚠️ Erro digest (reserva): {e}")
+
+def get_digest(search_id):
+    if not db or not search_id: return None
+    try:
+        with metrics.timer("firestore_op_seconds", op="get", collection=COLLECTION_DIGESTS):
+            doc = db.collection(COLLECTION_DIGESTS).document(search_id).get()
+        return doc.to_dict() if doc.exists else None
+    except Exception as e:
+        print(f"⚠️ Erro digest (get): {e}")
+        return None
+
+def update_digest_entries(search_id, statuses):
+    """
+    Marca o status de leads no digest ({domain: enriching/enriched/discarded}) numa transação só.
+    Retorna a lista de índices alterados (vazia se nada mudou).
+    """
+    if not db or not search_id or not statuses: return []
+
+    @firestore.transactional
+    def _update(transaction, doc_ref):
+        snap = doc_ref.get(transaction=transaction)
+        if not snap.exists:
+            return []
+        entries = snap.to_dict().get("entries", [])
+        changed = []
+        for i, existing in enumerate(entries):
+            status = statuses.get(existing.get("domain"))
+            if status and existing.get("status") != status:
+                existing["status"] = status
+                changed.append(i)
+        if changed:
+            transaction.update(doc_ref, {"entries": entries, "updated_at": datetime.datetime.now(timezone.utc)})
+        return changed
+
+    try:
+        with metrics.timer("firestore_op_seconds", op="transaction", collection=COLLECTION_DIGESTS):
+            return _update(db.transaction(), db.collection(COLLECTION_DIGESTS).document(search_id))
+    except Exception as e:
+        print(f"⚠️ Erro digest (status): {e}")
+        return []
+
+# ==============================================================================
+# ⚡ CACHE DE BUSCAS (Agente 1)
+# ==============================================================================
+
+COLLECTION_SEARCH_CACHE = "search_cache"
+
+def get_search_cache(key):
+    if not db or not key: return None
+    try:
+        with metrics.timer("firestore_op_seconds", op="get", collection=COLLECTION_SEARCH_CACHE):
+            doc = db.collection(COLLECTION_SEARCH_CACHE).document(key).get()
+        return doc.to_dict() if doc.exists else None
+    except Exception as e:
+        print(f"⚠️ Erro ler cache de busca: {e}")
+        return None
+
+def save_search_cache(key, data):
+    if not db or not key: return
+    try:
+        with metrics.timer("firestore_op_seconds", op="set", collection=COLLECTION_SEARCH_CACHE):
+            db.collection(COLLECTION_SEARCH_CACHE).document(key).set(data)
+    except Exception as e:
+        print(f"⚠️ Erro salvar cache de busca: {e}")
+
+# ==============================================================================
+# 🛑 CANCELAMENTO DE BUSCAS (tombstones)
+# ==============================================================================
+
+COLLECTION_TOMBSTONES = "search_tombstones"
+COLLECTION_CHAT_STATE = "chat_state"
+
+def save_tombstone(search_id, chat_id, ttl_hours):
+    """
+    Marca a busca como cancelada. True = lápide criada, False = já estava cancelada,
+    None = falhou (Firestore fora ou erro: as outras réplicas NÃO ficam sabendo).
+    """
+    if not db or not search_id: return None
+    now = datetime.datetime.now(timezone.utc)
+    try:
+        with metrics.timer("firestore_op_seconds", op="create", collection=COLLECTION_TOMBSTONES):
+            db.collection(COLLECTION_TOMBSTONES).document(search_id).create({
+                "search_id": search_id,
+                "chat_id": chat_id,
+                "cancelled_at": now,
+                "avoided": {},
+                "expires_at": now + datetime.timedelta(hours=ttl_hours),
+            })
+        return True
+    except Exception as e:
+        if type(e).__name__ in ("AlreadyExists", "Conflict"):
+            return False
+        print(f"⚠️ Erro salvar tombstone: {e}")
+        return None
+
+def get_tombstone(search_id):
+    if not db or not search_id: return None
+    try:
+        with metrics.timer("firestore_op_seconds", op="get", collection=COLLECTION_TOMBSTONES):
+            doc = db.collection(COLLECTION_TOMBSTONES).document(search_id).get()
+        return doc.to_dict() if doc.exists else None
+    except Exception as e:
+        print(f"⚠️ Erro ler tombstone: {e}")
+        return None
+
+def increment_tombstone_avoided(search_id, stage, amount=1):
+    """Soma trabalho evitado pelo cancelamento (avoided.<stage>)"""
+    if not db or not search_id: return
+    try:
+        with metrics.timer("firestore_op_seconds", op="update", collection=COLLECTION_TOMBSTONES):
+            db.collection(COLLECTION_TOMBSTONES).document(search_id).update({
+                f"avoided.{stage}": firestore.Increment(amount)
+            })
+    except Exception as e:
+        print(f"⚠️ Erro atualizar tombstone: {e}")
+
+def set_chat_last_search(chat_id, search_id, query):
+    """Última busca disparada pelo chat (alvo do /cancel sem argumento)"""
+    if not db: return
+    try:
+        with metrics.timer("firestore_op_seconds", op="set", collection=COLLECTION_CHAT_STATE):
+            db.collection(COLLECTION_CHAT_STATE).document(str(chat_id)).set({
+                "last_search_id": search_id,
+                "last_search_query": query,
+                "last_search_at": datetime.datetime.now(timezone.utc),
+            }, merge=True)
+    except Exception as e:
+        print(f"⚠️ Erro salvar estado do chat: {e}")
+
+def get_chat_last_search(chat_id):
+    """(search_id, query) da última busca do chat ou (None, None)"""
+    if not db: return None, None
+    try:
+        with metrics.timer("firestore_op_seconds", op="get", collection=COLLECTION_CHAT_STATE):
+            doc = db.collection(COLLECTION_CHAT_STATE).document(str(chat_id)).get()
+        data = doc.to_dict() if doc.exists else {}
+        return data.get("last_search_id"), data.get("last_search_query")
+    except Exception as e:
+        print(f"⚠️ Erro ler estado do chat: {e}")
+        return None, None
@@ -0,0 +1,217 @@
+"""
+DIGEST.PY - SalesMachine
+Modo digest: previews de uma busca agrupados em poucas mensagens paginadas
+
+Responsabilidades:
+- Acumular os leads de uma busca (search_id) no doc `search_digests/<search_id>`
+- Renderizar páginas (DIGEST_PAGE_SIZE leads por mensagem) com botões por lead
+- Editar as páginas no lugar conforme os leads chegam, com debounce
+  (N leads chegando juntos = 1 edição, não N)
+- Página sem mensagem (envio falhou, réplica caiu no meio) é criada por quem a encontrar
+  assim: reserva no doc (compare-and-set) garante uma mensagem só por página
+- Refletir no digest os cliques (⏳ enriquecendo, ✅ enriquecido, 🗑 descartado)
+
+Botões do digest usam ações próprias (ENRICH_D / DISCARD_D) para o Agente 0
+não sobrescrever a página ao tratar o clique.
+
+Ativação (Agente 3): DIGEST_MODE=1
+"""
+
+import os
+import time
+import threading
+
+from dotenv import load_dotenv
+
+import metrics
+import database
+import telegram_client
+import bulk_actions
+
+load_dotenv()
+
+DIGEST_MODE = os.getenv("DIGEST_MODE", "0") == "1"
+DIGEST_PAGE_SIZE = int(os.getenv("DIGEST_PAGE_SIZE", "8"))
+DIGEST_EDIT_DEBOUNCE = float(os.getenv("DIGEST_EDIT_DEBOUNCE", "3"))
+DIGEST_PAGE_CLAIM_SECONDS = 30      # Reserva de criação de página mais velha que isso é tomada
+DIGEST_PAGE_RETRY_SECONDS = 10
+
+STATUS_ICONS = {"new": "🆕", "enriching": "⏳", "enriched": "✅", "discarded": "🗑"}
+
+_pending = {}           # (search_id, page) -> instante em que a edição vence
+_pending_lock = threading.Lock()
+_worker = None
+
+
+# ==============================================================================
+# 🖼️ RENDERIZAÇÃO
+# ==============================================================================
+
+def _markdown_safe(text):
+    return str(text or "").replace("_", " ").replace("*", " ").replace("`", "'").replace("[", "(").replace("]", ")")
+
+
+def render_page(digest, page):
+    """Texto + teclado de uma página do digest"""
+    entries = digest.get("entries", [])
+    total_pages = max(1, (len(entries) + DIGEST_PAGE_SIZE - 1) // DIGEST_PAGE_SIZE)
+    start = page * DIGEST_PAGE_SIZE
+    chunk = entries[start:start + DIGEST_PAGE_SIZE]
+
+    lines = [f"📋 *{_markdown_safe(digest.get('query', 'Busca'))}*"]
+    lines.append(f"Página {page + 1}/{total_pages} · {len(entries)} lead(s) analisado(s)\n")
+    rows = []
+    for offset, entry in enumerate(chunk):
+        n = start + offset + 1
+        status = entry.get("status", "new")
+        name = _markdown_safe(entry.get("name") or entry.get("domain"))
+        line = f"{STATUS_ICONS.get(status, '•')} {n}. *{name}* ({entry.get('porte', '?').upper()})"
+        line += f" · 📊 {entry.get('score', 0)}"
+        if entry.get("cnpj"):
+            line += " · 📋 CNPJ"
+        line += f"\n      {entry.get('domain')}"
+        if entry.get("summary"):
+            line += f" · {_markdown_safe(entry['summary'])}"
+        lines.append(line)
+        if status == "new":
+            rows.append([
+                {"text": f"👥 {n}. {(entry.get('name') or entry.get('domain'))[:24]}", "callback_data": f"ENRICH_D:{entry['domain']}"},
+                {"text": "🗑", "callback_data": f"DISCARD_D:{entry['domain']}"},
+            ])
+
+    # Ações em lote ficam na primeira página
+    if page == 0 and digest.get("search_id"):
+        rows += bulk_actions.bulk_keyboard(digest["search_id"])
+    keyboard = {"inline_keyboard": rows}
+    return "\n".join(lines), keyboard
+
+
+def ensure_page(search_id, page):
+    """
+    Garante a mensagem da página. Retorna o message_id, ou None se outra réplica está
+    criando ou o envio falhou (nos dois casos a página é reagendada).
+    """
+    claim = database.claim_digest_page(search_id, page, DIGEST_PAGE_CLAIM_SECONDS)
+    if claim is None:
+        schedule_edit(search_id, page, delay=DIGEST_PAGE_RETRY_SECONDS)
+        return None
+    state, message_id = claim
+    if state == "sent":
+        return message_id
+    if state == "busy":
+        schedule_edit(search_id, page, delay=DIGEST_PAGE_RETRY_SECONDS)
+        return None
+
+    digest = database.get_digest(search_id)
+    message_id = None
+    if digest:
+        text, keyboard = render_page(digest, page)
+        message_id = telegram_client.send_message(digest.get("chat_id"), text, reply_markup=keyboard)
+    if not message_id:
+        database.release_digest_page_claim(search_id, page)
+        schedule_edit(search_id, page, delay=DIGEST_PAGE_RETRY_SECONDS)
+        return None
+    database.set_digest_page_message(search_id, page, message_id)
+    metrics.inc("digest_pages_total")
+    # Leads que chegaram enquanto a página era criada entram na próxima edição
+    schedule_edit(search_id, page)
+    return message_id
+
+
+def render_and_edit(search_id, page):
+    """Relê o digest e atualiza a mensagem da página (estado mais recente sempre vence)"""
+    digest = database.get_digest(search_id)
+    if not digest:
+        return
+    message_id = digest.get("pages", {}).get(str(page))
+    if not message_id:
+        # Página órfã: ninguém conseguiu criar a mensagem ainda
+        ensure_page(search_id, page)
+        return
+    text, keyboard = render_page(digest, page)
+    telegram_client.edit_message(digest.get("chat_id"), message_id, text, reply_markup=keyboard)
+    metrics.inc("digest_edits_total")
+
+
+# ==============================================================================
+# ⏱️ DEBOUNCE DAS EDIÇÕES
+# ==============================================================================
+
+def _editor_loop():
+    while True:
+        time.sleep(0.5)
+        _run_due()
+
+
+def _run_due(force=False):
+    now = time.monotonic()
+    with _pending_lock:
+        due = [key for key, at in _pending.items() if force or at <= now]
+        for key in due:
+            _pending.pop(key, None)
+    for search_id, page in due:
+        try:
+            render_and_edit(search_id, page)
+        except Exception as e:
+            print(f"⚠️ Digest: falha ao editar {search_id}/{page}: {e}")
+
+
+def schedule_edit(search_id, page, delay=None):
+    """Agenda a re-renderização da página (edições próximas viram uma só)"""
+    global _worker
+    with _pending_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_editor_loop, name="digest-editor", daemon=True)
+            _worker.start()
+        key = (search_id, page)
+        if key not in _pending:
+            _pending[key] = time.monotonic() + (DIGEST_EDIT_DEBOUNCE if delay is None else delay)
+        else:
+            metrics.inc("digest_edits_coalesced_total")
+
+
+def flush():
+    """Aplica as edições pendentes agora (shutdown)"""
+    _run_due(force=True)
+
+
+# ==============================================================================
+# ➕ ENTRADA DE LEADS / CLIQUES
+# ==============================================================================
+
+def add_lead(search_id, chat_id, query, entry):
+    """
+    Coloca o lead no digest. Quem encontra a página sem mensagem cria a mensagem (reserva
+    no doc evita duplicar); os demais só agendam a edição. Envio que falhou é retentado
+    pelo editor, então o lead não vira preview avulso. Retorna False só se o digest falhou.
+    """
+    entry = dict(entry, status="new")
+    result = database.append_digest_entry(search_id, chat_id, query, entry, DIGEST_PAGE_SIZE)
+    if result is None:
+        return False
+    index, page, message_id = result
+    metrics.inc("digest_leads_total")
+
+    if message_id is None:
+        ensure_page(search_id, page)
+        return True
+
+    schedule_edit(search_id, page)
+    return True
+
+
+def mark_leads(search_id, statuses, immediate=False):
+    """Atualiza ícone/botões de vários leads ({domain: status}); cada página afetada é editada uma vez"""
+    changed = database.update_digest_entries(search_id, statuses)
+    pages = sorted({index // DIGEST_PAGE_SIZE for index in changed})
+    for page in pages:
+        if immediate:
+            render_and_edit(search_id, page)
+        else:
+            schedule_edit(search_id, page)
+    return bool(changed)
+
+
+def mark_lead(search_id, domain, status, immediate=False):
+    """Atualiza o ícone/botões do lead na página (clique no Agente 0, fim do enriquecimento)"""
+    return mark_leads(search_id, {domain: status}, immediate)
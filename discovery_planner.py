@@ -0,0 +1,141 @@
+"""
+DISCOVERY_PLANNER.PY - SalesMachine
+Planejador de variantes da busca do Agente 1
+
+Responsabilidades:
+- Quebrar o pedido em variantes (porte, sub-região, nichos do setor) que puxam
+  listas diferentes do Perplexity, em vez de repetir a mesma busca com exclusões
+- Rodar as variantes em paralelo com teto (DISCOVERY_PARALLELISM)
+- Entregar cada resultado assim que chega (quem chama mescla/deduplica/publica)
+- Parar de lançar variantes quando a meta de leads novos é atingida, a busca
+  é cancelada ou o orçamento acaba
+
+Configuração:
+    DISCOVERY_VARIANTS=4            (inclui a busca original)
+    DISCOVERY_PARALLELISM=3
+    DISCOVERY_TARGET_NEW_LEADS=12
+"""
+
+import os
+import re
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+DISCOVERY_VARIANTS = int(os.getenv("DISCOVERY_VARIANTS", "4"))
+DISCOVERY_PARALLELISM = int(os.getenv("DISCOVERY_PARALLELISM", "3"))
+DISCOVERY_TARGET_NEW_LEADS = int(os.getenv("DISCOVERY_TARGET_NEW_LEADS", "12"))
+
+SIZE_FOCUS = [
+    ("pme", "Foque em PEQUENAS e MÉDIAS empresas (PMEs), fora do radar das grandes listas."),
+    ("grandes", "Foque em empresas de GRANDE porte e líderes do segmento."),
+]
+NICHE_FOCUS = ("nichos", "Foque em NICHOS e subsegmentos menos óbvios deste setor (especialistas, fornecedores, verticais).")
+
+# Pedido já cita um lugar -> varia dentro dele; senão -> varia por macro-região
+_UFS = {
+    "AC", "AL", "AP", "AM", "BA", "CE", "DF", "ES", "GO", "MA", "MT", "MS", "MG", "PA", "PB", "PR",
+    "PE", "PI", "RJ", "RN", "RS", "RO", "RR", "SC", "SP", "SE", "TO",
+}
+# "pará" fica de fora (sem acento vira a preposição "para")
+_STATES = {
+    "acre", "alagoas", "amapa", "amazonas", "bahia", "ceara", "distrito federal", "espirito santo",
+    "goias", "maranhao", "mato grosso", "minas gerais", "minas", "paraiba", "parana",
+    "pernambuco", "piaui", "rio de janeiro", "rio grande do norte", "rio grande do sul", "rondonia",
+    "roraima", "santa catarina", "sao paulo", "sergipe", "tocantins",
+}
+_CITIES = {
+    "campinas", "curitiba", "porto alegre", "belo horizonte", "recife", "salvador", "fortaleza",
+    "florianopolis", "brasilia", "goiania", "manaus", "belem", "vitoria", "joao pessoa",
+    "maceio", "aracaju", "teresina", "sao luis", "cuiaba", "campo grande", "ribeirao preto",
+    "sorocaba", "santos", "joinville", "londrina", "uberlandia", "niteroi",
+}
+LOCAL_FOCUS = [
+    ("centro", "Foque na CIDADE/CAPITAL citada e bairros centrais."),
+    ("entorno", "Foque na REGIÃO METROPOLITANA e cidades do entorno/interior da região citada."),
+]
+MACRO_REGIONS = ["Sudeste", "Sul", "Nordeste", "Centro-Oeste", "Norte"]
+
+
+def _plain(text):
+    return unicodedata.normalize("NFKD", str(text or "")).encode("ascii", "ignore").decode("ascii").lower()
+
+
+def mentions_location(query):
+    """O pedido já restringe o lugar? (UF em maiúsculas, estado ou cidade grande)"""
+    # Siglas só em maiúsculas: "SE", "ES", "PA" minúsculos são palavras comuns
+    if any(token in _UFS for token in re.findall(r"\b[A-Z]{2}\b", str(query or ""))):
+        return True
+    if "pará" in str(query or "").lower():
+        return True
+    text = " " + re.sub(r"[^a-z0-9]+", " ", _plain(query)) + " "
+    return any(f" {place} " in text for place in _STATES | _CITIES)
+
+
+def plan_variants(query, max_variants=None):
+    """
+    Lista de (nome, foco) — a primeira é sempre a busca original (foco vazio).
+    Intercala porte, região e nicho para as primeiras variantes já serem bem diferentes.
+    """
+    max_variants = max_variants or DISCOVERY_VARIANTS
+    if mentions_location(query):
+        regional = LOCAL_FOCUS
+    else:
+        regional = [(f"regiao_{r.lower()}", f"Foque em empresas com sede na região {r} do Brasil.") for r in MACRO_REGIONS]
+
+    variants = [("original", "")]
+    pools = [list(SIZE_FOCUS), list(regional), [NICHE_FOCUS]]
+    while len(variants) < max_variants and any(pools):
+        for pool in pools:
+            if pool and len(variants) < max_variants:
+                variants.append(pool.pop(0))
+    return variants
+
+
+def run_variants(variants, search_fn, on_result, parallelism=None, should_stop=None, before_launch=None):
+    """
+    Roda search_fn(nome, foco) para cada variante com no máximo `parallelism` em voo.
+
+    on_result(nome, resultado): chamado na thread de quem chamou, um por vez
+                                (pode publicar/gravar sem lock)
+    should_stop(): checado antes de lançar cada variante (meta atingida, cancelada...)
+    before_launch(nome): False = não lança (ex: orçamento do provedor esgotado)
+    Retorna quantas variantes foram lançadas.
+    """
+    parallelism = max(1, parallelism or DISCOVERY_PARALLELISM)
+    pending = list(variants)
+    launched = 0
+    with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="discovery") as pool:
+        in_flight = {}
+        while pending or in_flight:
+            while pending and len(in_flight) < parallelism:
+                if should_stop and should_stop():
+                    skipped = len(pending)
+                    pending.clear()
+                    metrics.inc("discovery_variants_skipped_total", skipped)
+                    break
+                name, focus = pending.pop(0)
+                if before_launch and not before_launch(name):
+                    pending.clear()
+                    break
+                in_flight[pool.submit(search_fn, name, focus)] = name
+                launched += 1
+                metrics.inc("discovery_variants_launched_total")
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"   ⚠️ Variante '{name}' falhou: {e}")
+                    result = []
+                on_result(name, result)
+    return launched
@@ -0,0 +1,395 @@
+"""
+DOMAIN_UTILS.PY - SalesMachine
+Canonicalização de domínios (chave de dedupe dos leads em todos os agentes)
+
+Responsabilidades:
+- Extrair o host de uma URL de verdade (esquema, usuário, porta, caminho, IDN, ponto final)
+- Sufixo público offline (formato da Public Suffix List: regras normais, "*." e "!")
+  para achar o domínio registrável: loja.empresa.com.br -> empresa.com.br
+- Blacklist compilada numa trie de sufixos: "facebook.com" bloqueia m.facebook.com
+  mas não notfacebook.com; "org" bloqueia .org mas não .org.br
+
+Lista de sufixos: um recorte embutido (BUNDLED_SUFFIXES) cobre os TLDs que aparecem nas buscas.
+Para a lista completa baixe https://publicsuffix.org/list/public_suffix_list.dat e aponte
+PUBLIC_SUFFIX_LIST_PATH para o arquivo. Fora do recorte o domínio NÃO é truncado: sem regra
+explícita (só o "*" implícito) ou quando sobraria um segundo nível genérico (com, gob, nom...)
+a chave é o host inteiro (sem www), como o clean_url antigo.
+"""
+
+import os
+import re
+import ipaddress
+from urllib.parse import urlsplit
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PUBLIC_SUFFIX_LIST_PATH = os.getenv("PUBLIC_SUFFIX_LIST_PATH", "")
+
+BUNDLED_SUFFIXES = """
+// genéricos
+com
+net
+org
+info
+biz
+io
+co
+ai
+app
+dev
+tech
+online
+site
+store
+shop
+digital
+agency
+xyz
+me
+tv
+us
+eu
+ca
+de
+fr
+it
+nl
+ch
+// Brasil
+br
+com.br
+net.br
+org.br
+gov.br
+edu.br
+mil.br
+ind.br
+eco.br
+emp.br
+app.br
+art.br
+blog.br
+dev.br
+eng.br
+inf.br
+log.br
+med.br
+adv.br
+adm.br
+arq.br
+bio.br
+cnt.br
+ecn.br
+eti.br
+far.br
+fm.br
+fnd.br
+fot.br
+jor.br
+jus.br
+leg.br
+mus.br
+nom.br
+not.br
+odo.br
+ppg.br
+pro.br
+psc.br
+radio.br
+tmp.br
+trd.br
+tv.br
+tec.br
+tur.br
+srv.br
+agr.br
+imb.br
+esp.br
+etc.br
+ong.br
+psi.br
+rec.br
+vet.br
+coop.br
+seg.br
+// América Latina / Europa
+pt
+com.pt
+org.pt
+gov.pt
+ar
+com.ar
+net.ar
+org.ar
+gob.ar
+gov.ar
+edu.ar
+int.ar
+tur.ar
+mx
+com.mx
+net.mx
+org.mx
+gob.mx
+edu.mx
+cl
+gob.cl
+gov.cl
+pe
+com.pe
+net.pe
+org.pe
+gob.pe
+edu.pe
+nom.pe
+uy
+com.uy
+net.uy
+org.uy
+gub.uy
+edu.uy
+com.co
+net.co
+org.co
+gov.co
+edu.co
+nom.co
+py
+com.py
+net.py
+org.py
+gov.py
+edu.py
+coop.py
+bo
+com.bo
+net.bo
+org.bo
+gob.bo
+edu.bo
+ve
+com.ve
+net.ve
+org.ve
+gob.ve
+co.ve
+ec
+com.ec
+net.ec
+org.ec
+gob.ec
+fin.ec
+edu.ec
+za
+co.za
+org.za
+net.za
+gov.za
+es
+com.es
+nom.es
+org.es
+gob.es
+edu.es
+uk
+co.uk
+org.uk
+ac.uk
+gov.uk
+ltd.uk
+plc.uk
+au
+com.au
+jp
+co.jp
+in
+co.in
+// hospedagens (seção privada da PSL: cada cliente é um "domínio")
+blogspot.com
+wixsite.com
+wordpress.com
+github.io
+herokuapp.com
+netlify.app
+vercel.app
+web.app
+firebaseapp.com
+appspot.com
+myshopify.com
+webflow.io
+azurewebsites.net
+cloudfront.net
+"""
+
+_END = "$"
+_HOST_LABEL = re.compile(r"^(?!-)[a-z0-9-]{1,63}(?<!-)$")
+# Segundos níveis de registro comuns: "gob.mx" nunca é o domínio de uma empresa
+_GENERIC_SECOND_LEVELS = {"com", "net", "org", "gov", "gob", "gub", "edu", "mil", "nom", "co", "ac", "or", "ne", "go"}
+
+
+class SuffixTrie:
+    """Trie de labels invertidos (com.br -> br -> com)"""
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, domain, value=True):
+        node = self.root
+        for label in reversed(domain.split(".")):
+            node = node.setdefault(label, {})
+        node[_END] = value
+
+    def covers(self, labels_reversed):
+        """Algum prefixo (invertido) do host está na trie? -> host é o item ou subdomínio dele"""
+        node = self.root
+        for label in labels_reversed:
+            node = node.get(label)
+            if node is None:
+                return False
+            if _END in node:
+                return True
+        return False
+
+
+class PublicSuffixList:
+    def __init__(self, rules_text):
+        self._trie = SuffixTrie()
+        self.size = 0
+        for line in rules_text.splitlines():
+            rule = line.strip().split(" ", 1)[0].lower()
+            if not rule or rule.startswith("//"):
+                continue
+            if rule.startswith("!"):
+                self._trie.add(rule[1:], "!")
+            else:
+                self._trie.add(rule)
+            self.size += 1
+
+    def suffix_length(self, labels_reversed):
+        """Quantos labels (da direita) formam o sufixo público"""
+        return self.suffix_match(labels_reversed)[0]
+
+    def suffix_match(self, labels_reversed):
+        """(tamanho do sufixo, True se veio de regra explícita e não do "*" implícito)"""
+        node = self._trie.root
+        match = 1                       # Regra padrão "*": TLD desconhecido é sufixo
+        explicit = False
+        exception = None
+        for i, label in enumerate(labels_reversed):
+            wild = node.get("*")
+            if wild is not None and _END in wild:
+                match = max(match, i + 1)
+                explicit = True
+            node = node.get(label)
+            if node is None:
+                break
+            if _END in node:
+                explicit = True
+                if node[_END] == "!":
+                    exception = i
+                else:
+                    match = max(match, i + 1)
+        return (exception if exception is not None else match), explicit
+
+
+def _load_public_suffixes():
+    if PUBLIC_SUFFIX_LIST_PATH:
+        try:
+            with open(PUBLIC_SUFFIX_LIST_PATH, "r", encoding="utf-8") as f:
+                psl = PublicSuffixList(f.read())
+            print(f"🌐 Public Suffix List carregada: {psl.size} regras ({PUBLIC_SUFFIX_LIST_PATH})")
+            return psl
+        except OSError as e:
+            print(f"⚠️ PUBLIC_SUFFIX_LIST_PATH ilegível ({e}). Usando lista embutida.")
+    return PublicSuffixList(BUNDLED_SUFFIXES)
+
+
+PUBLIC_SUFFIXES = _load_public_suffixes()
+
+
+# ==============================================================================
+# 🧹 CANONICALIZAÇÃO
+# ==============================================================================
+
+def canonical_host(url):
+    """
+    Host normalizado ou None: minúsculo, sem esquema/porta/caminho, IDN em punycode,
+    sem "www." NO INÍCIO (e só no início). IPs e hosts sem TLD são descartados.
+    """
+    if not url:
+        return None
+    raw = str(url).strip()
+    if "://" not in raw:
+        raw = "http://" + raw.lstrip("/")
+    try:
+        host = urlsplit(raw).hostname
+    except ValueError:
+        return None
+    if not host:
+        return None
+    host = host.strip(".").lower()
+    try:
+        host = host.encode("idna").decode("ascii")
+    except UnicodeError:
+        return None
+    try:
+        ipaddress.ip_address(host)
+        return None
+    except ValueError:
+        pass
+
+    labels = host.split(".")
+    while len(labels) > 2 and labels[0] in ("www", "www1", "www2", "www3"):
+        labels = labels[1:]
+    if len(labels) < 2 or not all(_HOST_LABEL.match(label) for label in labels):
+        return None
+    return ".".join(labels)
+
+
+def registrable_domain(host):
+    """
+    Domínio registrável (sufixo público + 1 label). None se o host é o próprio sufixo.
+    Sufixo fora da lista (só o "*" implícito, ou sobraria "gob.mx"/"com.xx") -> host inteiro:
+    melhor não deduplicar do que juntar empresas diferentes num lead "com.py".
+    """
+    if not host:
+        return None
+    labels = host.split(".")
+    suffix_len, explicit = PUBLIC_SUFFIXES.suffix_match(list(reversed(labels)))
+    if len(labels) <= suffix_len:
+        return None
+    if not explicit:
+        return host
+    if len(labels) > suffix_len + 1 and labels[-(suffix_len + 1)] in _GENERIC_SECOND_LEVELS:
+        return host
+    return ".".join(labels[-(suffix_len + 1):])
+
+
+def canonical_domain(url):
+    """URL/host qualquer -> chave do lead (domínio registrável) ou None"""
+    return registrable_domain(canonical_host(url))
+
+
+# ==============================================================================
+# 🚫 BLACKLIST
+# ==============================================================================
+
+class DomainBlacklist:
+    """
+    Compilada uma vez. Entradas são domínios ("facebook.com") ou sufixos (".org" / "org");
+    bloqueia o item e os subdomínios dele, nunca por substring.
+    """
+
+    def __init__(self, entries):
+        self._trie = SuffixTrie()
+        for entry in entries:
+            entry = entry.strip().strip(".").lower()
+            if entry:
+                self._trie.add(entry)
+
+    def matches(self, domain):
+        if not domain:
+            return False
+        return self._trie.covers(reversed(domain.lower().strip(".").split(".")))
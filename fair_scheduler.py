@@ -0,0 +1,214 @@
+"""
+FAIR_SCHEDULER.PY - SalesMachine
+Fila justa entre usuários dentro de um worker (Agentes 2 e 3)
+
+Responsabilidades:
+- Puxar mais mensagens do que processa (prefetch) e separá-las em filas virtuais por tenant
+  (chat_id por padrão, ou search_id)
+- Escolher a próxima mensagem pelo tenant com menor tempo virtual (fair queueing ponderado):
+  a busca de 40 leads de um usuário não passa na frente da busca de 5 de outro
+- Peso por tenant (FAIR_WEIGHTS) e fatia máxima de workers por tenant (FAIR_MAX_SHARE),
+  que só vale quando outro tenant está esperando (worker nunca fica ocioso à toa)
+- No shutdown: pause() para de despachar e SEGURA o que chega (sem nack: nack com o
+  stream aberto volta na hora e só queima delivery_attempt); com o flow control cheio o
+  client para de puxar. release() no fim devolve (nack) tudo de uma vez
+
+Uso (worker_lifecycle):
+    fair = fair_scheduler.FairScheduler("agent_2", workers=MAX_MESSAGES)
+    lanes = [{"subscription": path, "callback": callback, "fair": fair,
+              "flow_control": FlowControl(max_messages=fair.prefetch)}]
+
+Configuração:
+    FAIR_SCHEDULING=1          (0 = comportamento antigo, FIFO do Pub/Sub)
+    FAIR_TENANT_KEY=chat_id    (ou search_id)
+    FAIR_WEIGHTS=123:2,456:0.5 (tenant:peso; padrão 1)
+    FAIR_MAX_SHARE=0.5         (fração dos workers que um tenant pode ocupar com outros esperando)
+    FAIR_PREFETCH_FACTOR=4     (mensagens puxadas por worker)
+"""
+
+import os
+import json
+import math
+import time
+import threading
+from collections import deque
+
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+FAIR_SCHEDULING = os.getenv("FAIR_SCHEDULING", "1") == "1"
+FAIR_TENANT_KEY = os.getenv("FAIR_TENANT_KEY", "chat_id")
+FAIR_MAX_SHARE = float(os.getenv("FAIR_MAX_SHARE", "0.5"))
+FAIR_PREFETCH_FACTOR = int(os.getenv("FAIR_PREFETCH_FACTOR", "4"))
+DEFAULT_TENANT = "_default"
+
+
+def parse_weights(raw):
+    """'123:2,456:0.5' -> {'123': 2.0, '456': 0.5}"""
+    weights = {}
+    for item in (raw or "").split(","):
+        if ":" not in item:
+            continue
+        tenant, weight = item.rsplit(":", 1)
+        try:
+            weights[tenant.strip()] = max(0.01, float(weight))
+        except ValueError:
+            print(f"⚠️ FAIR_WEIGHTS: peso inválido em '{item}'")
+    return weights
+
+
+FAIR_WEIGHTS = parse_weights(os.getenv("FAIR_WEIGHTS", ""))
+
+
+def tenant_of(message, key=None):
+    """Tenant da mensagem (campo do payload JSON); sem o campo cai no tenant padrão"""
+    key = key or FAIR_TENANT_KEY
+    try:
+        data = json.loads(message.data.decode("utf-8"))
+    except Exception:
+        return DEFAULT_TENANT
+    value = data.get(key) or data.get("chat_id")
+    return str(value) if value is not None else DEFAULT_TENANT
+
+
+class _Tenant:
+    __slots__ = ("queue", "vtime", "running", "weight")
+
+    def __init__(self, weight):
+        self.queue = deque()
+        self.vtime = 0.0
+        self.running = 0
+        self.weight = weight
+
+
+class FairScheduler:
+    """Filas virtuais por tenant + pool próprio de workers"""
+
+    def __init__(self, name, workers, tenant_key=None, weights=None, max_share=None):
+        self.name = name
+        self.workers = max(1, workers)
+        self.prefetch = self.workers * max(1, FAIR_PREFETCH_FACTOR)
+        self._tenant_key = tenant_key or FAIR_TENANT_KEY
+        self._weights = FAIR_WEIGHTS if weights is None else weights
+        share = FAIR_MAX_SHARE if max_share is None else max_share
+        self._max_running = max(1, math.ceil(self.workers * share))
+        self._cond = threading.Condition()
+        self._tenants = {}
+        self._queued = 0
+        self._vclock = 0.0       # tempo virtual do último despacho (tenant novo entra a partir daqui)
+        self._stopped = False
+        self._paused = False
+        self._threads = []
+
+    # --------------------------------------------------------------------------
+    # Entrada (callback do Pub/Sub) e pool
+    # --------------------------------------------------------------------------
+
+    def start(self, handler):
+        """Sobe os workers (idempotente: várias faixas podem dividir o mesmo scheduler)"""
+        with self._cond:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker_loop, args=(handler,), name=f"{self.name}-fair-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, message):
+        """Callback do Pub/Sub: só enfileira (ack/nack fica com o handler)"""
+        tenant_id = tenant_of(message, self._tenant_key)
+        with self._cond:
+            if self._stopped:
+                message.nack()
+                return
+            tenant = self._tenants.get(tenant_id)
+            if tenant is None:
+                tenant = self._tenants[tenant_id] = _Tenant(self._weights.get(tenant_id, 1.0))
+            if not tenant.queue and not tenant.running:
+                # Tenant que estava parado não acumula crédito
+                tenant.vtime = max(tenant.vtime, self._vclock)
+            tenant.queue.append((message, time.monotonic()))
+            self._queued += 1
+            self._update_gauges()
+            self._cond.notify()
+
+    def pause(self):
+        """Início do shutdown: workers terminam o que estão rodando e não pegam mais nada"""
+        with self._cond:
+            self._paused = True
+            self._cond.notify_all()
+
+    def release(self):
+        """Shutdown: para os workers e devolve o que não começou a ser processado"""
+        with self._cond:
+            self._stopped = True
+            pending = []
+            for tenant in self._tenants.values():
+                pending.extend(m for m, _ in tenant.queue)
+                tenant.queue.clear()
+            self._queued = 0
+            self._update_gauges()
+            self._cond.notify_all()
+        for message in pending:
+            try:
+                message.nack()
+            except Exception:
+                pass
+        if pending:
+            print(f"↩️ [{self.name}] {len(pending)} mensagem(ns) da fila justa devolvida(s).")
+        return len(pending)
+
+    def snapshot(self):
+        """{tenant: (na fila, rodando)} para debug"""
+        with self._cond:
+            return {tid: (len(t.queue), t.running) for tid, t in self._tenants.items() if t.queue or t.running}
+
+    # --------------------------------------------------------------------------
+    # Escolha justa
+    # --------------------------------------------------------------------------
+
+    def _pick(self):
+        if self._paused:
+            return None
+        waiting = [(tid, t) for tid, t in self._tenants.items() if t.queue]
+        if not waiting:
+            return None
+        # Fatia máxima só vale se existe alguém abaixo dela esperando
+        eligible = [(tid, t) for tid, t in waiting if t.running < self._max_running] or waiting
+        tenant_id, tenant = min(eligible, key=lambda item: item[1].vtime)
+        message, queued_at = tenant.queue.popleft()
+        self._queued -= 1
+        self._vclock = tenant.vtime
+        tenant.vtime += 1.0 / tenant.weight
+        tenant.running += 1
+        return tenant_id, tenant, message, queued_at
+
+    def _worker_loop(self, handler):
+        while True:
+            with self._cond:
+                picked = self._pick()
+                while picked is None and not self._stopped:
+                    self._cond.wait()
+                    picked = self._pick()
+                if picked is None:
+                    return
+                self._update_gauges()
+            tenant_id, tenant, message, queued_at = picked
+            metrics.observe("fair_queue_wait_seconds", time.monotonic() - queued_at, scheduler=self.name)
+            try:
+                handler(message)
+            except Exception as e:
+                print(f"⚠️ [{self.name}] Erro no handler (tenant {tenant_id}): {e}")
+            finally:
+                with self._cond:
+                    tenant.running -= 1
+                    if not tenant.queue and not tenant.running and tenant.vtime <= self._vclock:
+                        self._tenants.pop(tenant_id, None)
+                    self._cond.notify()
+
+    def _update_gauges(self):
+        metrics.set_gauge("fair_queued_messages", self._queued, scheduler=self.name)
+        metrics.set_gauge("fair_active_tenants", sum(1 for t in self._tenants.values() if t.queue or t.running), scheduler=self.name)
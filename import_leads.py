@@ -0,0 +1,350 @@
+"""
+IMPORT_LEADS.PY - SalesMachine
+Importação em massa de domínios (planilhas de parceiros) direto na esteira
+
+Responsabilidades:
+- Ler CSV ou JSONL em streaming (arquivo de milhares de linhas não vai inteiro para a memória)
+- Canonicalizar cada domínio (domain_utils, mesma chave de dedupe do Agente 1)
+- Deduplicar dentro do arquivo e contra `leads_b2b` em lotes (get_all)
+- Gravar os leads novos em lote (WriteBatch) e publicar no `topic-tech-filter`
+  (com shard), respeitando taxa máxima e o backpressure dos Agentes 2/3
+- Checkpoint retomável: se cair no meio, roda de novo e continua de onde parou
+- Leads vão para um chat de verdade (--chat-id ou IMPORT_CHAT_ID) e gastam a cota própria
+  de importação (QUOTA_CHAT_IMPORT_LEAD_PER_DAY), não a de leads das buscas
+
+Uso:
+    python import_leads.py parceiros.csv --chat-id -100123 --origin "Lista parceiro X"
+    python import_leads.py dominios.jsonl --chat-id -100123 --column website --rate 2
+    python import_leads.py parceiros.csv --dry-run            # só conta, não grava nem publica
+    python import_leads.py parceiros.csv --chat-id -100123 --restart   # ignora o checkpoint
+
+Configuração:
+    IMPORT_RATE_PER_SECOND=5
+    IMPORT_BATCH_SIZE=200
+    IMPORT_CHAT_ID=                 (chat padrão quando --chat-id não é passado)
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import uuid
+import argparse
+
+from dotenv import load_dotenv
+
+import database
+import domain_utils
+import backpressure
+import sharding
+import metrics
+import quota
+
+load_dotenv()
+
+PROJECT_ID = os.getenv("GCP_PROJECT_ID")
+NEXT_TOPIC_NAME = "topic-tech-filter"
+IMPORT_RATE_PER_SECOND = float(os.getenv("IMPORT_RATE_PER_SECOND", "5"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "200"))
+IMPORT_CHAT_ID = os.getenv("IMPORT_CHAT_ID", "")
+IMPORT_SOURCE = "import"            # context_data.source: Agente 3 cobra da cota de importação
+
+DOMAIN_COLUMNS = ["domain", "dominio", "domínio", "website", "site", "url", "homepage"]
+NAME_COLUMNS = ["name", "nome", "empresa", "company", "razao_social", "nome_fantasia"]
+
+
+# ==============================================================================
+# 📄 LEITURA (streaming)
+# ==============================================================================
+
+def _pick_column(fields, wanted, candidates):
+    if wanted:
+        return wanted
+    lowered = {f.strip().lower(): f for f in fields if f}
+    for name in candidates:
+        if name in lowered:
+            return lowered[name]
+    return None
+
+
+def read_csv(path, column=None, name_column=None):
+    """Gera (domínio bruto, nome) linha a linha. Detecta separador (, ; tab)."""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(f, dialect=dialect)
+        fields = reader.fieldnames or []
+        column = _pick_column(fields, column, DOMAIN_COLUMNS) or (fields[0] if fields else None)
+        name_column = _pick_column(fields, name_column, NAME_COLUMNS)
+        if column not in fields:
+            raise ValueError(f"Coluna '{column}' não existe no CSV (colunas: {', '.join(fields)})")
+        print(f"📄 CSV: domínio em '{column}'" + (f", nome em '{name_column}'" if name_column else ""))
+        for row in reader:
+            yield row.get(column), (row.get(name_column) if name_column else None)
+
+
+def read_jsonl(path, column=None, name_column=None):
+    """Gera (domínio bruto, nome) por linha JSON. Linha que é só uma string vale como domínio."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                yield None, None
+                continue
+            if isinstance(item, str):
+                yield item, None
+                continue
+            if not isinstance(item, dict):
+                yield None, None
+                continue
+            key = _pick_column(item.keys(), column, DOMAIN_COLUMNS)
+            name_key = _pick_column(item.keys(), name_column, NAME_COLUMNS)
+            yield item.get(key) if key else None, item.get(name_key) if name_key else None
+
+
+def read_records(path, fmt=None, column=None, name_column=None):
+    fmt = fmt or ("jsonl" if path.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv")
+    reader = read_jsonl if fmt == "jsonl" else read_csv
+    return reader(path, column, name_column)
+
+
+# ==============================================================================
+# 💾 CHECKPOINT
+# ==============================================================================
+
+def load_checkpoint(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_checkpoint(path, state):
+    """Escrita atômica (arquivo temporário + rename): nunca fica checkpoint pela metade"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+# ==============================================================================
+# 🚀 PUBLICAÇÃO (taxa + backpressure)
+# ==============================================================================
+
+class RateLimiter:
+    """Espaça as publicações em 1/taxa segundos e segura enquanto a esteira está cheia"""
+
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second if per_second and per_second > 0 else 0.0
+        self._next = time.monotonic()
+
+    def wait(self):
+        budget = backpressure.available_budget()
+        while budget is not None and budget <= 0:
+            print(f"   🚦 Esteira cheia (Agentes 2/3). Aguardando {backpressure.PROBE_TTL_SECONDS}s...")
+            time.sleep(backpressure.PROBE_TTL_SECONDS)
+            budget = backpressure.available_budget(force=True)
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+        self._next = max(now, self._next) + self.interval
+
+
+def publish_batch(publisher, topic_path, leads, origin, import_id, chat_id, limiter):
+    """Publica o lote (mesmo payload do Agente 1) e espera as confirmações"""
+    futures = []
+    for domain, name in leads:
+        limiter.wait()
+        payload = {
+            "domain": domain,
+            "origin_query": origin,
+            "search_id": import_id,
+            "chat_id": chat_id,
+            "context_data": {"name": name or domain, "source": IMPORT_SOURCE},
+        }
+        futures.append(publisher.publish(
+            topic_path,
+            json.dumps(payload).encode("utf-8"),
+            **sharding.shard_attributes(domain)
+        ))
+        backpressure.consume_budget(1)
+    for future in futures:
+        future.result()
+    metrics.inc("leads_published_total", len(futures), stage="import")
+    return len(futures)
+
+
+# ==============================================================================
+# 📥 IMPORTAÇÃO
+# ==============================================================================
+
+def run_import(path, fmt=None, column=None, name_column=None, origin=None, chat_id=None,
+               rate=None, batch_size=None, checkpoint_path=None, restart=False, dry_run=False):
+    batch_size = max(1, batch_size or IMPORT_BATCH_SIZE)
+    checkpoint_path = checkpoint_path or f"{path}.import.json"
+    origin = origin or f"Importação: {os.path.basename(path)}"
+
+    state = None if restart or dry_run else load_checkpoint(checkpoint_path)
+    if state and state.get("finished"):
+        print(f"✅ Checkpoint diz que {path} já foi importado ({state['stats']}). Use --restart para repetir.")
+        return state["stats"]
+    if state:
+        print(f"⏯️ Retomando {state['import_id']} a partir do registro {state['position']}.")
+    else:
+        state = {
+            "import_id": f"import-{uuid.uuid4().hex[:12]}",
+            "position": 0,
+            "pending": [],
+            "finished": False,
+            "stats": {"read": 0, "invalid": 0, "duplicated_in_file": 0, "existing": 0, "published": 0},
+        }
+    stats = state["stats"]
+    import_id = state["import_id"]
+
+    publisher = topic_path = None
+    if not dry_run:
+        if not chat_id:
+            # Sem chat o preview/digest não chega a ninguém e os leads ficam parados em WAITING_DECISION
+            print("❌ ERRO: informe --chat-id (ou IMPORT_CHAT_ID) para receber os leads importados.")
+            sys.exit(1)
+        budget = quota.limit_for("chat", "import_lead")
+        if budget > 0:
+            print(f"🎟️ Cota de importação: {budget:.0f} leads/dia com busca paga; além disso o preview sai só com dados gratuitos.")
+        if not database.db:
+            print("❌ ERRO: Firestore indisponível. Abortando importação.")
+            sys.exit(1)
+        from google.cloud import pubsub_v1
+        publisher = pubsub_v1.PublisherClient()
+        topic_path = publisher.topic_path(PROJECT_ID, NEXT_TOPIC_NAME)
+    limiter = RateLimiter(IMPORT_RATE_PER_SECOND if rate is None else rate)
+
+    def flush_pending(checked=False):
+        """
+        Grava e publica o lote pendente. O checkpoint com `pending` é escrito ANTES da gravação:
+        se cair no meio, a retomada grava o que faltou e publica tudo (senão o existing_leads
+        pularia leads gravados e nunca publicados).
+        """
+        pending = state["pending"]
+        if not pending:
+            return
+        domains = [d for d, _ in pending]
+        if not checked:
+            # Retomada: o que já está no banco foi gravado por nós; regravar zeraria o status
+            saved_before = database.existing_leads(domains)
+            domains = [d for d in domains if d not in saved_before]
+        if domains:
+            saved = database.bulk_save_new_leads(domains, origin, search_id=import_id)
+            if saved < len(domains):
+                raise RuntimeError(f"apenas {saved}/{len(domains)} leads gravados no lote")
+        stats["published"] += publish_batch(publisher, topic_path, pending, origin, import_id, chat_id, limiter)
+        state["pending"] = []
+        save_checkpoint(checkpoint_path, state)
+
+    def process_batch(batch, counts):
+        if dry_run:
+            existing = set()
+        else:
+            existing = database.existing_leads([d for d, _ in batch])
+        new = [(d, n) for d, n in batch if d not in existing]
+        counts["existing"] = len(batch) - len(new)
+        if dry_run or not new:
+            return
+        state["pending"] = [list(item) for item in new]
+        save_checkpoint(checkpoint_path, state)
+        flush_pending(checked=True)
+
+    def commit_batch(counts, position):
+        # Contadores só entram junto com a posição: lote que falhou é recontado na retomada
+        for key, value in counts.items():
+            stats[key] += value
+        state["position"] = position
+        if not dry_run:
+            save_checkpoint(checkpoint_path, state)
+
+    rate_label = f"{1 / limiter.interval:g}/s" if limiter.interval else "sem limite"
+    print(f"📥 Importando {path} ({import_id}) | lote {batch_size} | taxa {rate_label}")
+    started = time.monotonic()
+    seen = set()
+    batch = []
+    counts = {"read": 0, "invalid": 0, "duplicated_in_file": 0}
+    position = 0
+    try:
+        if not dry_run:
+            flush_pending()
+        for raw, name in read_records(path, fmt, column, name_column):
+            position += 1
+            if position <= state["position"]:
+                continue
+            counts["read"] += 1
+            domain = domain_utils.canonical_domain(raw)
+            if not domain:
+                counts["invalid"] += 1
+            elif domain in seen:
+                counts["duplicated_in_file"] += 1
+            else:
+                # Na retomada o `seen` recomeça vazio: o que já foi gravado cai em `existing`
+                seen.add(domain)
+                batch.append((domain, (name or "").strip() or None))
+
+            if len(batch) >= batch_size:
+                process_batch(batch, counts)
+                commit_batch(counts, position)
+                batch = []
+                counts = {"read": 0, "invalid": 0, "duplicated_in_file": 0}
+                print(f"   📦 {position} registros | {stats['published']} publicados | {stats['existing']} já existiam")
+
+        if batch:
+            process_batch(batch, counts)
+        state["finished"] = True
+        commit_batch(counts, position)
+    except KeyboardInterrupt:
+        print(f"\n⏸️ Interrompido. Rode de novo para continuar do registro {state['position']}.")
+    except Exception as e:
+        print(f"❌ Erro na importação: {e}. Rode de novo para continuar do registro {state['position']}.")
+    finally:
+        if publisher is not None:
+            publisher.stop()
+
+    elapsed = time.monotonic() - started
+    print("\n📊 Resumo" + (" (dry-run)" if dry_run else ""))
+    print(f"   Lidos: {stats['read']} | Inválidos: {stats['invalid']} | Repetidos no arquivo: {stats['duplicated_in_file']}")
+    print(f"   Já no banco: {stats['existing']} | Publicados: {stats['published']} | Tempo: {elapsed:.1f}s")
+    if dry_run:
+        print(f"   Seriam enviados (antes do dedupe com o banco): {stats['read'] - stats['invalid'] - stats['duplicated_in_file']}")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa uma lista de domínios (CSV/JSONL) para a esteira")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Padrão: pela extensão do arquivo")
+    parser.add_argument("--column", help="Coluna/campo do domínio (padrão: detecta domain/website/site/url)")
+    parser.add_argument("--name-column", help="Coluna/campo do nome da empresa")
+    parser.add_argument("--origin", help="origin_query gravado nos leads (padrão: nome do arquivo)")
+    parser.add_argument("--chat-id", default=IMPORT_CHAT_ID or None, help="Chat que recebe os leads (obrigatório; padrão: IMPORT_CHAT_ID)")
+    parser.add_argument("--rate", type=float, help=f"Publicações por segundo (padrão {IMPORT_RATE_PER_SECOND})")
+    parser.add_argument("--batch", type=int, help=f"Tamanho do lote (padrão {IMPORT_BATCH_SIZE})")
+    parser.add_argument("--checkpoint", help="Arquivo de checkpoint (padrão: <arquivo>.import.json)")
+    parser.add_argument("--restart", action="store_true", help="Ignora o checkpoint e começa do zero")
+    parser.add_argument("--dry-run", action="store_true", help="Só lê e conta: não consulta o banco nem publica")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        print(f"❌ Arquivo não encontrado: {args.path}")
+        sys.exit(1)
+
+    run_import(
+        args.path, fmt=args.format, column=args.column, name_column=args.name_column,
+        origin=args.origin, chat_id=args.chat_id, rate=args.rate, batch_size=args.batch,
+        checkpoint_path=args.checkpoint, restart=args.restart, dry_run=args.dry_run,
+    )
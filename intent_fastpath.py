@@ -0,0 +1,270 @@
+"""
+INTENT_FASTPATH.PY - SalesMachine
+Pré-classificador de intenção do Agente 0 (evita ida ao Gemini em casos óbvios)
+
+Responsabilidades:
+- Regras (regex) para CHAT óbvio: "oi", "obrigado", "valeu", "/start"...
+- Modelo leve (Naive Bayes multinomial) treinado com frases semente e
+  realimentado com as decisões do Gemini (aprende o vocabulário real do time)
+- Cache das decisões do Gemini por (histórico recente normalizado, texto normalizado)
+- Só o que é ambíguo vai para o Gemini
+- Estatísticas: taxa de acerto por fonte e latência economizada (metrics.py)
+
+Desligar: INTENT_FASTPATH=0
+"""
+
+import os
+import re
+import math
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict, defaultdict
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+INTENT_FASTPATH = os.getenv("INTENT_FASTPATH", "1") != "0"
+INTENT_CACHE_SIZE = int(os.getenv("INTENT_CACHE_SIZE", "2000"))
+INTENT_CACHE_TTL = int(os.getenv("INTENT_CACHE_TTL", "3600"))
+MODEL_MIN_CONFIDENCE = float(os.getenv("INTENT_MODEL_MIN_CONFIDENCE", "0.92"))
+
+RESPOSTA_SAUDACAO = "Olá! 👋 Me diz o nicho e a região que você quer prospectar (ex: Escolas de idiomas em Campinas)."
+RESPOSTA_AGRADECIMENTO = "Por nada! Quando quiser outra busca é só mandar o nicho e a região. 🚀"
+RESPOSTA_GENERICA = "Me conta o nicho e a região que você quer prospectar (ex: Startups de tecnologia em Piracicaba SP)."
+
+
+def normalize(text):
+    """minúsculas, sem acento, sem pontuação, espaços colapsados"""
+    text = unicodedata.normalize("NFKD", str(text or "")).encode("ascii", "ignore").decode("ascii")
+    text = re.sub(r"[^a-z0-9/ ]+", " ", text.lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def tokens(text):
+    return normalize(text).split()
+
+
+# ==============================================================================
+# 📏 REGRAS
+# ==============================================================================
+
+_GREETING = re.compile(
+    r"^(/start|oi+|ola|opa|e ai|eai|hey|hello|hi|bom dia|boa tarde|boa noite|tudo bem|tudo bom)"
+    r"( (tudo bem|tudo bom|td bem|como vai|bot|pessoal|ai|bom dia|boa tarde|boa noite))*$"
+)
+_THANKS = re.compile(
+    r"^(obrigad[oa]|obg|valeu|vlw|brigad[oa]|show|top|massa|perfeito|otimo|beleza|blz|ok|okay|certo|legal|tchau|ate mais)"
+    r"( (pela ajuda|mesmo|muito|demais|entao|obrigad[oa]|valeu|show|top))*$"
+)
+_SEARCH_VERB = re.compile(r"^(busque|buscar|busca|procure|procurar|prospecte|prospectar|encontre|encontrar|liste|listar|ache|achar|quero leads de|quero empresas de|leads de|empresas de)\b")
+_SEARCH_VERB_RAW = re.compile(_SEARCH_VERB.pattern, re.IGNORECASE)
+# Pedido que aponta para a conversa ("mais", "parecidas", "dessas") precisa do contexto do Gemini
+_REFERENCE = re.compile(r"\b(mais|outras?|outros?|parecid[oa]s?|similares?|semelhantes?|mesm[oa]s?|dess[ae]s?|dest[ae]s?|del[ae]s?|iguais)\b")
+_STOPWORDS = {"de", "da", "do", "das", "dos", "em", "no", "na", "nos", "nas", "e", "a", "o", "as", "os", "para", "pra", "com", "me", "uns", "umas", "algumas", "alguns"}
+
+
+def _content_tokens(norm):
+    return [t for t in norm.split() if t not in _STOPWORDS]
+
+
+def _bot_asked(history):
+    """A última fala do bot foi uma pergunta? ("ok" aí é resposta, não agradecimento)"""
+    for line in reversed(history or []):
+        if line.startswith("Bot:"):
+            return line.rstrip().endswith("?")
+    return False
+
+
+def _rule_decision(norm, text, history=None):
+    # Respondendo a uma pergunta do bot o sentido depende do contexto -> Gemini
+    if _bot_asked(history):
+        return None
+    if _GREETING.match(norm):
+        return {"type": "CHAT", "response": RESPOSTA_SAUDACAO}
+    if _THANKS.match(norm):
+        return {"type": "CHAT", "response": RESPOSTA_AGRADECIMENTO}
+    match = _SEARCH_VERB.match(norm)
+    if match:
+        rest = norm[match.end():].strip()
+        if history and _REFERENCE.search(rest):
+            return None
+        # Pedido autocontido: pelo menos nicho + região (ex: "escolas campinas")
+        if len(_content_tokens(rest)) < 2:
+            return None
+        # A busca vai com o texto original (acentos e maiúsculas), não com o normalizado
+        raw = _SEARCH_VERB_RAW.match(str(text or "").strip())
+        if not raw:
+            return None
+        query = raw.string[raw.end():].strip(" \t:,-")
+        if query:
+            return {"type": "SEARCH", "consolidated_query": query}
+    return None
+
+
+# ==============================================================================
+# 🧮 MODELO LEVE (Naive Bayes)
+# ==============================================================================
+
+_SEED = {
+    "CHAT": [
+        "oi tudo bem", "bom dia", "obrigado pela ajuda", "valeu", "como funciona",
+        "o que voce faz", "quem e voce", "me ajuda", "nao entendi", "pode repetir",
+        "ta demorando", "cade os resultados", "ok obrigado", "teste", "qual seu nome",
+        "como eu uso isso", "voce consegue me ajudar", "o que posso pedir",
+    ],
+    "SEARCH": [
+        "escolas de idiomas em campinas", "startups de tecnologia em piracicaba sp",
+        "clinicas odontologicas em sao paulo", "agencias de marketing em curitiba",
+        "construtoras em belo horizonte", "academias em porto alegre", "hoteis em florianopolis",
+        "faculdades particulares no rio de janeiro", "restaurantes em recife",
+        "empresas de software em santa catarina", "varejistas de moda em sao paulo",
+        "hospitais privados em salvador", "imobiliarias em goiania", "industrias quimicas em campinas",
+        "fintechs em sao paulo", "redes de farmacias no nordeste",
+    ],
+}
+
+
+class NaiveBayes:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.word_counts = {label: defaultdict(int) for label in _SEED}
+        self.total_words = {label: 0 for label in _SEED}
+        self.doc_counts = {label: 0 for label in _SEED}
+        self.vocab = set()
+        for label, examples in _SEED.items():
+            for example in examples:
+                self.learn(example, label)
+
+    def learn(self, text, label):
+        if label not in self.word_counts:
+            return
+        words = tokens(text)
+        if not words:
+            return
+        with self._lock:
+            self.doc_counts[label] += 1
+            for w in words:
+                self.word_counts[label][w] += 1
+                self.total_words[label] += 1
+                self.vocab.add(w)
+
+    def predict(self, text):
+        """Retorna (label, probabilidade) ou (None, 0) se não há palavras conhecidas"""
+        words = tokens(text)
+        with self._lock:
+            if not words or not any(w in self.vocab for w in words):
+                return None, 0.0
+            total_docs = sum(self.doc_counts.values())
+            vocab_size = len(self.vocab)
+            scores = {}
+            for label in self.word_counts:
+                score = math.log(self.doc_counts[label] / total_docs)
+                denom = self.total_words[label] + vocab_size
+                for w in words:
+                    score += math.log((self.word_counts[label].get(w, 0) + 1) / denom)
+                scores[label] = score
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp(s - scores[best]) for s in scores.values())
+        return best, 1.0 / norm
+
+
+_model = NaiveBayes()
+
+
+# ==============================================================================
+# 🗃️ CACHE + ESTATÍSTICAS
+# ==============================================================================
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_stats = {"rule": 0, "model": 0, "cache": 0, "llm": 0, "saved_seconds": 0.0}
+_llm_latency_ewma = None
+
+
+def _cache_key(history, text):
+    # Só a cauda do histórico importa para o contexto ("Campinas" depois de "Escolas")
+    tail = "\n".join(normalize(line) for line in (history or [])[-2:])
+    return hashlib.sha1(f"{tail}\n{normalize(text)}".encode("utf-8")).hexdigest()
+
+
+def _hit(source):
+    with _cache_lock:
+        _stats[source] += 1
+        saved = _llm_latency_ewma or 0.0
+        _stats["saved_seconds"] += saved
+    metrics.inc("intent_fastpath_total", source=source)
+    if saved:
+        metrics.inc("intent_llm_seconds_saved_total", saved)
+
+
+def classify(history, text):
+    """Decisão local ou None (ambíguo -> Gemini). Mesmo formato do Gemini."""
+    if not INTENT_FASTPATH:
+        return None
+    norm = normalize(text)
+    if not norm:
+        return None
+
+    decision = _rule_decision(norm, text, history)
+    if decision:
+        _hit("rule")
+        return decision
+
+    key = _cache_key(history, text)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and time.time() - cached[0] < INTENT_CACHE_TTL:
+            _cache.move_to_end(key)
+            decision = dict(cached[1])
+        elif cached:
+            _cache.pop(key, None)
+    if decision:
+        _hit("cache")
+        return decision
+
+    # Mensagem curta com histórico pode ser refinamento -> precisa do contexto do Gemini
+    if history and len(_content_tokens(norm)) < 3:
+        return None
+    label, prob = _model.predict(norm)
+    if label and prob >= MODEL_MIN_CONFIDENCE:
+        if label == "CHAT":
+            _hit("model")
+            return {"type": "CHAT", "response": RESPOSTA_GENERICA}
+        if len(_content_tokens(norm)) >= 2 and not text.strip().endswith("?"):
+            _hit("model")
+            return {"type": "SEARCH", "consolidated_query": text.strip()}
+    return None
+
+
+def remember(history, text, decision, llm_seconds=None):
+    """Guarda a decisão do Gemini no cache e realimenta o modelo"""
+    global _llm_latency_ewma
+    if not decision or decision.get("type") not in ("CHAT", "SEARCH"):
+        return
+    with _cache_lock:
+        _stats["llm"] += 1
+        if llm_seconds is not None:
+            _llm_latency_ewma = llm_seconds if _llm_latency_ewma is None else 0.8 * _llm_latency_ewma + 0.2 * llm_seconds
+        key = _cache_key(history, text)
+        _cache[key] = (time.time(), dict(decision))
+        _cache.move_to_end(key)
+        while len(_cache) > INTENT_CACHE_SIZE:
+            _cache.popitem(last=False)
+    metrics.inc("intent_fastpath_total", source="llm")
+    # Só aprende com mensagens sem dependência de contexto
+    if not history or len(_content_tokens(normalize(text))) >= 3:
+        _model.learn(text, decision["type"])
+
+
+def stats():
+    """Resumo: acertos por fonte, taxa de fast-path e segundos de Gemini economizados"""
+    with _cache_lock:
+        snapshot = dict(_stats)
+    local = snapshot["rule"] + snapshot["model"] + snapshot["cache"]
+    total = local + snapshot["llm"]
+    snapshot["hit_rate"] = local / total if total else 0.0
+    return snapshot
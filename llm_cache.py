@@ -0,0 +1,188 @@
+"""
+LLM_CACHE.PY - SalesMachine
+Cache de respostas de LLM endereçado por conteúdo (Perplexity do Agente 1)
+
+Responsabilidades:
+- Chave = sha256 de (modelo, system prompt, user prompt, temperatura)
+- Disco local (LLM_CACHE_DIR, um arquivo por chave, escrita atômica) e,
+  opcionalmente, Firestore compartilhado entre réplicas (coleção `llm_cache`)
+- TTL (LLM_CACHE_TTL_HOURS); entrada vencida conta como miss
+- Estatísticas: hits/misses por camada e segundos de LLM poupados
+- LLM_CACHE_BYPASS=1 (ou bypass=True na chamada) força resposta nova (e regrava)
+
+Configuração:
+    LLM_CACHE_BACKEND=disk          (disk | firestore | both | off)
+    LLM_CACHE_DIR=.llm_cache
+    LLM_CACHE_TTL_HOURS=24
+"""
+
+import os
+import json
+import time
+import hashlib
+import datetime
+import threading
+from datetime import timezone
+
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "disk").lower()
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", ".llm_cache")
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "24"))
+LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "0") == "1"
+COLLECTION_LLM_CACHE = "llm_cache"
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "bypass": 0, "saved_seconds": 0.0}
+
+
+def cache_key(model, system, user, temperature):
+    raw = json.dumps(
+        {"model": model, "system": system, "user": user, "temperature": temperature},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _use_disk():
+    return LLM_CACHE_BACKEND in ("disk", "both")
+
+
+def _use_firestore():
+    return LLM_CACHE_BACKEND in ("firestore", "both")
+
+
+# ==============================================================================
+# 💾 CAMADAS
+# ==============================================================================
+
+def _disk_path(key):
+    return os.path.join(LLM_CACHE_DIR, key[:2], f"{key}.json")
+
+
+def _disk_get(key):
+    try:
+        with open(_disk_path(key), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entry.get("expires_at_ts", 0) < time.time():
+        return None
+    return entry
+
+
+def _disk_put(key, entry):
+    path = _disk_path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"⚠️ LLM cache: falha ao gravar em disco ({e})")
+
+
+def _firestore_get(key):
+    import database
+    if not database.db:
+        return None
+    try:
+        with metrics.timer("firestore_op_seconds", op="get", collection=COLLECTION_LLM_CACHE):
+            doc = database.db.collection(COLLECTION_LLM_CACHE).document(key).get()
+        entry = doc.to_dict() if doc.exists else None
+    except Exception as e:
+        print(f"⚠️ LLM cache: erro ao ler do Firestore ({e})")
+        return None
+    if not entry or entry.get("expires_at_ts", 0) < time.time():
+        return None
+    entry.pop("expires_at", None)
+    return entry
+
+
+def _firestore_put(key, entry):
+    import database
+    if not database.db:
+        return
+    try:
+        with metrics.timer("firestore_op_seconds", op="set", collection=COLLECTION_LLM_CACHE):
+            database.db.collection(COLLECTION_LLM_CACHE).document(key).set(dict(
+                entry,
+                # Campo datetime para a política de TTL do Firestore
+                expires_at=datetime.datetime.fromtimestamp(entry["expires_at_ts"], timezone.utc),
+            ))
+    except Exception as e:
+        print(f"⚠️ LLM cache: erro ao gravar no Firestore ({e})")
+
+
+# ==============================================================================
+# 🔑 API
+# ==============================================================================
+
+def get(key, provider="llm"):
+    """Resposta guardada (str) ou None. Hit no Firestore aquece o disco."""
+    entry = _disk_get(key) if _use_disk() else None
+    layer = "disk"
+    if entry is None and _use_firestore():
+        entry = _firestore_get(key)
+        layer = "firestore"
+        if entry is not None and _use_disk():
+            _disk_put(key, entry)
+
+    if entry is None:
+        with _stats_lock:
+            _stats["misses"] += 1
+        metrics.inc("llm_cache_requests_total", provider=provider, result="miss")
+        return None
+
+    saved = float(entry.get("latency_seconds") or 0)
+    with _stats_lock:
+        _stats["hits"] += 1
+        _stats["saved_seconds"] += saved
+    metrics.inc("llm_cache_requests_total", provider=provider, result=f"hit_{layer}")
+    metrics.inc("llm_cache_saved_seconds_total", saved, provider=provider)
+    return entry.get("content")
+
+
+def put(key, content, latency_seconds=None, model=None, ttl_hours=None):
+    """Guarda a resposta (só chame com respostas válidas: erro não vira cache)"""
+    if LLM_CACHE_BACKEND == "off" or content is None:
+        return
+    now = time.time()
+    entry = {
+        "content": content,
+        "model": model,
+        "latency_seconds": round(latency_seconds or 0, 3),
+        "created_at_ts": now,
+        "expires_at_ts": now + 3600 * (LLM_CACHE_TTL_HOURS if ttl_hours is None else ttl_hours),
+    }
+    if _use_disk():
+        _disk_put(key, entry)
+    if _use_firestore():
+        _firestore_put(key, entry)
+
+
+def lookup(model, system, user, temperature, provider="llm", bypass=False):
+    """(chave, resposta ou None). Com bypass a chave vem, mas a leitura é pulada."""
+    key = cache_key(model, system, user, temperature)
+    if LLM_CACHE_BACKEND == "off":
+        return key, None
+    if bypass or LLM_CACHE_BYPASS:
+        with _stats_lock:
+            _stats["bypass"] += 1
+        metrics.inc("llm_cache_requests_total", provider=provider, result="bypass")
+        return key, None
+    return key, get(key, provider)
+
+
+def stats():
+    """Contadores do processo (hits, misses, bypass, hit_rate, saved_seconds)"""
+    with _stats_lock:
+        snapshot = dict(_stats)
+    total = snapshot["hits"] + snapshot["misses"]
+    snapshot["hit_rate"] = round(snapshot["hits"] / total, 3) if total else 0.0
+    return snapshot
@@ -0,0 +1,143 @@
+"""
+MESSAGE_DEBOUNCER.PY - SalesMachine
+Junta mensagens picadas do mesmo chat antes de classificar (Agente 0)
+
+Responsabilidades:
+- Segurar as mensagens de texto de um chat por uma janela curta (reinicia a cada mensagem)
+- Ao vencer a janela, entregar UMA mensagem com os textos unidos
+  ("escolas" / "em Campinas" / "particulares" -> 1 classificação e 1 busca)
+- Teto de espera e de mensagens por rajada (ninguém fica esperando para sempre)
+- Comando explícito (/go por padrão) libera na hora
+
+Configuração:
+    ROUTER_DEBOUNCE_SECONDS=2.5        (0 desliga)
+    ROUTER_DEBOUNCE_MAX_SECONDS=8
+    ROUTER_DEBOUNCE_MAX_MESSAGES=6
+    ROUTER_DEBOUNCE_FLUSH_COMMANDS=/go,/buscar
+"""
+
+import os
+import time
+import threading
+
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+ROUTER_DEBOUNCE_SECONDS = float(os.getenv("ROUTER_DEBOUNCE_SECONDS", "2.5"))
+ROUTER_DEBOUNCE_MAX_SECONDS = float(os.getenv("ROUTER_DEBOUNCE_MAX_SECONDS", "8"))
+ROUTER_DEBOUNCE_MAX_MESSAGES = int(os.getenv("ROUTER_DEBOUNCE_MAX_MESSAGES", "6"))
+FLUSH_COMMANDS = [c.strip().lower() for c in os.getenv("ROUTER_DEBOUNCE_FLUSH_COMMANDS", "/go,/buscar").split(",") if c.strip()]
+
+
+def split_flush_command(text):
+    """'/go particulares' -> (True, 'particulares'); texto comum -> (False, texto)"""
+    stripped = (text or "").strip()
+    first = stripped.split(maxsplit=1)[0].lower() if stripped else ""
+    # "/go@MeuBot" também vale (comando em grupo)
+    if first.split("@", 1)[0] in FLUSH_COMMANDS:
+        rest = stripped.split(maxsplit=1)
+        return True, rest[1] if len(rest) > 1 else ""
+    return False, text
+
+
+class MessageDebouncer:
+    """Buffer por chat. emit(message) recebe a mensagem consolidada (na thread do debouncer)."""
+
+    def __init__(self, emit, window=None, max_wait=None, max_messages=None):
+        self._emit = emit
+        self._window = ROUTER_DEBOUNCE_SECONDS if window is None else window
+        self._max_wait = max_wait or ROUTER_DEBOUNCE_MAX_SECONDS
+        self._max_messages = max_messages or ROUTER_DEBOUNCE_MAX_MESSAGES
+        self._cond = threading.Condition()
+        self._buffers = {}      # chat_id -> {"messages": [...], "first": t, "deadline": t}
+        self._worker = None
+
+    @property
+    def enabled(self):
+        return self._window > 0
+
+    def add(self, message):
+        """Bufferiza a mensagem de texto (ou entrega direto se o debounce está desligado)"""
+        flush_now, text = split_flush_command(message.get("text"))
+        if not self.enabled:
+            if text:
+                self._emit(dict(message, text=text))
+            return
+
+        chat_id = message["chat"]["id"]
+        reason = "command" if flush_now else None
+        now = time.monotonic()
+        with self._cond:
+            buf = self._buffers.get(chat_id)
+            if text:
+                if buf is None:
+                    buf = self._buffers[chat_id] = {"messages": [], "first": now}
+                buf["messages"].append(dict(message, text=text))
+                buf["deadline"] = min(now + self._window, buf["first"] + self._max_wait)
+                if len(buf["messages"]) >= self._max_messages:
+                    reason = reason or "max_messages"
+                    flush_now = True
+            if flush_now:
+                buf = self._buffers.pop(chat_id, None)
+            else:
+                self._ensure_worker()
+                self._cond.notify()
+                return
+        metrics.inc("router_debounce_flushes_total", reason=reason)
+        if buf:
+            self._deliver(buf)
+
+    def flush_all(self):
+        """Entrega tudo que está segurado (shutdown)"""
+        with self._cond:
+            bufs = list(self._buffers.values())
+            self._buffers.clear()
+        for buf in bufs:
+            self._deliver(buf)
+
+    def discard(self, chat_id):
+        """Joga fora o que o chat tinha segurado (ex: /cancel). Retorna quantas mensagens."""
+        with self._cond:
+            buf = self._buffers.pop(chat_id, None)
+        return len(buf["messages"]) if buf else 0
+
+    def pending(self):
+        with self._cond:
+            return sum(len(b["messages"]) for b in self._buffers.values())
+
+    # --------------------------------------------------------------------------
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._loop, name="router-debounce", daemon=True)
+            self._worker.start()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                due = [chat for chat, buf in self._buffers.items() if buf["deadline"] <= now]
+                ready = [self._buffers.pop(chat) for chat in due]
+                if not ready:
+                    next_deadline = min((b["deadline"] for b in self._buffers.values()), default=None)
+                    self._cond.wait(None if next_deadline is None else max(0.0, next_deadline - now))
+                    continue
+            for buf in ready:
+                self._deliver(buf)
+
+    def _deliver(self, buf):
+        messages = buf["messages"]
+        if not messages:
+            return
+        combined = dict(messages[-1], text="\n".join(m["text"] for m in messages))
+        combined["coalesced_count"] = len(messages)
+        if len(messages) > 1:
+            # Cada mensagem a mais = uma classificação (e talvez uma busca) a menos
+            metrics.inc("router_messages_coalesced_total", len(messages) - 1)
+        try:
+            self._emit(combined)
+        except Exception as e:
+            print(f"⚠️ Debounce: falha ao entregar mensagem do chat {combined['chat'].get('id')}: {e}")
@@ -0,0 +1,356 @@
+"""
+METRICS.PY - SalesMachine
+Subsistema de métricas embutido (compartilhado por todos os agentes)
+
+Responsabilidades:
+- Contadores, gauges e histogramas thread-safe em memória
+- Endpoint HTTP opcional /metrics (formato texto do Prometheus) por processo
+- Instrumentação do callback do Pub/Sub (throughput, duração, idade da mensagem, ack/nack)
+- Instrumentação do `requests` (latência por provedor/host)
+
+Uso:
+    import metrics
+    metrics.inc("leads_published_total", stage="agent_1")
+    with metrics.timer("gemini_call_seconds", agent="agent_0"):
+        ...
+    metrics.start_http_server_from_env("agent_2")  # só sobe se METRICS_PORT estiver setado
+"""
+
+import os
+import time
+import threading
+import datetime
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Buckets padrão (segundos) - cobrem desde Firestore (ms) até Perplexity/Agente 3 (minutos)
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Hosts conhecidos -> nome do provedor (evita explosão de cardinalidade com sites de leads)
+PROVIDER_HOSTS = {
+    "api.telegram.org": "telegram",
+    "api.perplexity.ai": "perplexity",
+    "api.crustdata.com": "crustdata",
+    "api.apollo.io": "apollo",
+    "api.lusha.com": "lusha",
+    "google.serper.dev": "serper",
+    "api.datastone.com.br": "datastone",
+    "docs.datastone.com.br": "datastone",
+    "brasilapi.com.br": "brasilapi",
+    "generativelanguage.googleapis.com": "gemini",
+}
+
+_lock = threading.Lock()
+_registry = {}
+_server = None
+
+
+# ==============================================================================
+# 📊 TIPOS DE MÉTRICA
+# ==============================================================================
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + (extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, doc=""):
+        self.name = name
+        self.doc = doc
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(_label_key(labels), 0)
+
+    def render(self):
+        return [f"{self.name}{_format_labels(k)} {v}" for k, v in self.values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self.values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, doc="", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}  # key -> [counts por bucket, soma, total]
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with _lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = [[0] * len(self.buckets), 0.0, 0]
+                self.values[key] = entry
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def summary(self, **labels):
+        """Retorna (count, soma) - útil para relatórios simples"""
+        entry = self.values.get(_label_key(labels))
+        return (entry[2], entry[1]) if entry else (0, 0.0)
+
+    def render(self):
+        lines = []
+        for key, (counts, total, count) in self.values.items():
+            for bound, c in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {c}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+def _get_or_create(cls, name, doc="", **kwargs):
+    metric = _registry.get(name)
+    if metric is None:
+        with _lock:
+            metric = _registry.get(name)
+            if metric is None:
+                metric = cls(name, doc, **kwargs)
+                _registry[name] = metric
+    return metric
+
+
+def counter(name, doc=""):
+    return _get_or_create(Counter, name, doc)
+
+
+def gauge(name, doc=""):
+    return _get_or_create(Gauge, name, doc)
+
+
+def histogram(name, doc="", buckets=DEFAULT_BUCKETS):
+    return _get_or_create(Histogram, name, doc, buckets=buckets)
+
+
+# --- Atalhos ---
+
+def inc(name, amount=1, **labels):
+    counter(name).inc(amount, **labels)
+
+
+def set_gauge(name, value, **labels):
+    gauge(name).set(value, **labels)
+
+
+def observe(name, value, **labels):
+    histogram(name).observe(value, **labels)
+
+
+@contextmanager
+def timer(name, **labels):
+    """Mede a duração do bloco. Adiciona outcome=ok/error automaticamente."""
+    start = time.monotonic()
+    outcome = "ok"
+    try:
+        yield
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        histogram(name).observe(time.monotonic() - start, outcome=outcome, **labels)
+
+
+def render_text():
+    """Renderiza todas as métricas no formato texto do Prometheus"""
+    lines = []
+    for name in sorted(_registry):
+        metric = _registry[name]
+        if metric.doc:
+            lines.append(f"# HELP {name} {metric.doc}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        with _lock:
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ==============================================================================
+# 📨 INSTRUMENTAÇÃO DO PUB/SUB
+# ==============================================================================
+
+class _InstrumentedMessage:
+    """Proxy da mensagem do Pub/Sub que registra ack/nack"""
+
+    def __init__(self, message):
+        self._message = message
+        self.outcome = None
+
+    def ack(self):
+        if self.outcome is None:
+            self.outcome = "ack"
+        self._message.ack()
+
+    def nack(self):
+        if self.outcome is None:
+            self.outcome = "nack"
+        self._message.nack()
+
+    def __getattr__(self, item):
+        return getattr(self._message, item)
+
+
+def _message_age_seconds(message):
+    publish_time = getattr(message, "publish_time", None)
+    if not publish_time:
+        return None
+    try:
+        if publish_time.tzinfo is None:
+            publish_time = publish_time.replace(tzinfo=datetime.timezone.utc)
+        return max(0.0, (datetime.datetime.now(datetime.timezone.utc) - publish_time).total_seconds())
+    except Exception:
+        return None
+
+
+def instrument_callback(stage, callback):
+    """Envolve o callback do Pub/Sub com métricas de throughput, lag e duração"""
+    def wrapper(message):
+        age = _message_age_seconds(message)
+        if age is not None:
+            observe("pubsub_message_age_seconds", age, stage=stage)
+
+        proxy = _InstrumentedMessage(message)
+        gauge("pubsub_inflight_messages", "Callbacks em execução").inc(stage=stage)
+        start = time.monotonic()
+        try:
+            callback(proxy)
+        except Exception:
+            proxy.outcome = proxy.outcome or "exception"
+            raise
+        finally:
+            gauge("pubsub_inflight_messages").dec(stage=stage)
+            observe("pubsub_callback_seconds", time.monotonic() - start, stage=stage)
+            inc("pubsub_messages_processed_total", stage=stage, outcome=proxy.outcome or "none")
+    return wrapper
+
+
+# ==============================================================================
+# 🌐 INSTRUMENTAÇÃO HTTP (requests)
+# ==============================================================================
+
+_requests_patched = False
+
+
+def provider_for_host(host):
+    host = (host or "").lower()
+    if host in PROVIDER_HOSTS:
+        return PROVIDER_HOSTS[host]
+    for known, provider in PROVIDER_HOSTS.items():
+        if host.endswith("." + known):
+            return provider
+    return "site"
+
+
+def instrument_requests():
+    """Mede latência de TODAS as chamadas feitas via `requests` (por provedor)"""
+    global _requests_patched
+    if _requests_patched:
+        return
+    try:
+        import requests
+    except ImportError:
+        return
+
+    original = requests.sessions.Session.request
+
+    def timed_request(self, method, url, *args, **kwargs):
+        provider = provider_for_host(urlparse(str(url)).hostname)
+        start = time.monotonic()
+        status = "error"
+        try:
+            resp = original(self, method, url, *args, **kwargs)
+            status = f"{resp.status_code // 100}xx"
+            return resp
+        finally:
+            observe("http_request_seconds", time.monotonic() - start, provider=provider, status=status)
+            inc("http_requests_total", provider=provider, status=status)
+
+    requests.sessions.Session.request = timed_request
+    _requests_patched = True
+
+
+# ==============================================================================
+# 🚀 SERVIDOR HTTP /metrics
+# ==============================================================================
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body = render_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        elif self.path == "/healthz":
+            body = b"ok\n"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+        else:
+            body = b"not found\n"
+            self.send_response(404)
+            self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Silencia o log de acesso
+
+
+def start_http_server(port, host="0.0.0.0"):
+    """Sobe o endpoint /metrics em uma thread daemon"""
+    global _server
+    if _server:
+        return _server
+    _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"📈 Métricas expostas em http://{host}:{port}/metrics")
+    return _server
+
+
+def start_http_server_from_env(agent_name):
+    """
+    Sobe o /metrics se METRICS_PORT_<AGENTE> ou METRICS_PORT estiver configurado.
+    Ex: METRICS_PORT_AGENT_2=9102
+    """
+    port = os.getenv(f"METRICS_PORT_{agent_name.upper()}") or os.getenv("METRICS_PORT")
+    set_gauge("agent_start_time_seconds", time.time(), agent=agent_name)
+    if not port:
+        return None
+    try:
+        return start_http_server(port)
+    except Exception as e:
+        print(f"⚠️ Não foi possível subir /metrics na porta {port}: {e}")
+        return None
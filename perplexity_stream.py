@@ -0,0 +1,147 @@
+"""
+PERPLEXITY_STREAM.PY - SalesMachine
+Streaming do Perplexity (SSE) com emissão incremental de empresas (Agente 1)
+
+Responsabilidades:
+- Ler o stream SSE do /chat/completions ("stream": true) e juntar os deltas de texto
+- Parser JSON incremental: acha o array "companies" e entrega cada objeto assim que
+  ele fecha, sem esperar o fim da geração
+- Tolerante a texto antes/depois do JSON (```json, explicações) e a strings com chaves/aspas
+
+Ativação (Agente 1): PERPLEXITY_STREAMING=1
+"""
+
+import os
+import json
+
+from dotenv import load_dotenv
+
+import requests
+
+load_dotenv()
+
+PERPLEXITY_STREAMING = os.getenv("PERPLEXITY_STREAMING", "1") == "1"
+
+
+class CompanyStreamParser:
+    """feed(texto) -> lista de objetos do array "companies" que fecharam neste pedaço"""
+
+    def __init__(self, key="companies"):
+        self._marker = f'"{key}"'
+        self._buf = ""
+        self._pos = 0            # próximo caractere a examinar
+        self._in_array = False
+        self._done = False
+        self._depth = 0          # profundidade dentro do array (0 = entre objetos)
+        self._in_string = False
+        self._escape = False
+        self._obj_start = None
+        self.emitted = 0
+
+    @property
+    def done(self):
+        return self._done
+
+    def feed(self, text):
+        if self._done or not text:
+            return []
+        self._buf += text
+        if not self._in_array and not self._find_array():
+            return []
+        return self._scan()
+
+    def _find_array(self):
+        idx = self._buf.find(self._marker)
+        if idx == -1:
+            # Guarda só o rabo (o marcador pode estar partido entre dois deltas)
+            keep = len(self._marker)
+            if len(self._buf) > keep:
+                self._buf = self._buf[-keep:]
+            return False
+        colon = self._buf.find(":", idx + len(self._marker))
+        if colon == -1:
+            return False
+        bracket = colon + 1
+        while bracket < len(self._buf) and self._buf[bracket].isspace():
+            bracket += 1
+        if bracket >= len(self._buf):
+            return False
+        if self._buf[bracket] != "[":
+            # "companies" apareceu em outro contexto: continua procurando depois dele
+            self._buf = self._buf[idx + len(self._marker):]
+            return self._find_array()
+        self._buf = self._buf[bracket + 1:]
+        self._pos = 0
+        self._in_array = True
+        return True
+
+    def _scan(self):
+        out = []
+        buf = self._buf
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0 and ch == "{":
+                    self._obj_start = i
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0 and ch == "]":
+                    self._done = True
+                    break
+                self._depth -= 1
+                if self._depth == 0 and ch == "}" and self._obj_start is not None:
+                    try:
+                        out.append(json.loads(buf[self._obj_start:i + 1]))
+                        self.emitted += 1
+                    except ValueError:
+                        pass
+                    self._obj_start = None
+            i += 1
+
+        # Descarta o que já foi consumido (mantém só o objeto em aberto)
+        cut = self._obj_start if self._obj_start is not None else i
+        self._buf = buf[cut:]
+        self._pos = i - cut
+        if self._obj_start is not None:
+            self._obj_start = 0
+        return out
+
+
+def stream_chat(url, payload, headers, on_text, timeout=60):
+    """
+    POST com "stream": true; on_text(delta) para cada pedaço de texto.
+    on_text devolvendo False interrompe a leitura. Retorna o texto completo.
+    """
+    parts = []
+    body = dict(payload, stream=True)
+    with requests.post(url, json=body, headers=headers, timeout=timeout, stream=True) as resp:
+        if resp.status_code != 200:
+            raise RuntimeError(f"Status {resp.status_code}")
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            try:
+                event = json.loads(data)
+            except ValueError:
+                continue
+            choices = event.get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content") or ""
+            if not delta:
+                continue
+            parts.append(delta)
+            if on_text(delta) is False:
+                break
+    return "".join(parts)
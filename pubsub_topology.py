@@ -0,0 +1,377 @@
+"""
+PUBSUB_TOPOLOGY.PY - SalesMachine
+Topologia declarativa do Pub/Sub (fonte única da verdade)
+
+Responsabilidades:
+- Declarar TODOS os tópicos e assinaturas da esteira (Agentes 0 → 4)
+- Ack deadline, retenção, dead-letter, retry policy e exactly-once por assinatura
+- `diff`: compara o declarado com o que existe no projeto (ou no emulador)
+- `apply`: cria/atualiza de forma idempotente
+
+Uso:
+    python pubsub_topology.py show
+    python pubsub_topology.py diff
+    python pubsub_topology.py apply [--recreate]
+
+Funciona contra o emulador automaticamente quando PUBSUB_EMULATOR_HOST está setado.
+"""
+
+import os
+import sys
+import argparse
+import datetime
+from google.cloud import pubsub_v1
+from google.api_core.exceptions import AlreadyExists, NotFound
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import sharding
+
+PROJECT_ID = os.getenv("GCP_PROJECT_ID")
+EMULATOR_HOST = os.getenv("PUBSUB_EMULATOR_HOST")
+
+# Campos que o emulador aceita mas não devolve no get_subscription (evita diff eterno)
+EMULATOR_IGNORED_FIELDS = {"enable_exactly_once_delivery", "dead_letter_policy", "retry_policy"}
+
+# Campos imutáveis: mudar exige apagar e recriar a assinatura (perde o backlog!)
+IMMUTABLE_FIELDS = {"topic", "filter"}
+
+DEAD_LETTER_TOPIC = "topic-dead-letter"
+
+# ==============================================================================
+# 📐 TOPOLOGIA DECLARADA
+# ==============================================================================
+
+TOPICS = [
+    "topic-discovery-input",   # Agente 0 -> Agente 1 (busca)
+    "topic-tech-filter",       # Agente 1 -> Agente 2 (novo domínio)
+    "topic-enricher",          # Agente 2 -> Agente 3 (Parte 1 - lote)
+    "topic-enricher-priority", # Agente 0 -> Agente 3 (clique ENRICH - interativo)
+    "topic-copy-generator",    # Agente 3 -> Agente 4
+    "topic-closer-hubspot",    # Agente 3 -> HubSpot (consumidor futuro)
+    DEAD_LETTER_TOPIC,         # Mensagens que estouraram max_delivery_attempts
+]
+
+# Defaults aplicados a toda assinatura (podem ser sobrescritos abaixo)
+SUBSCRIPTION_DEFAULTS = {
+    "ack_deadline_seconds": 60,
+    "message_retention_seconds": 24 * 3600,
+    "dead_letter": {"topic": DEAD_LETTER_TOPIC, "max_delivery_attempts": 5},
+    "retry": {"minimum_backoff_seconds": 10, "maximum_backoff_seconds": 300},
+    "exactly_once": False,
+    "filter": "",
+}
+
+SUBSCRIPTIONS = {
+    # Agente 1: Perplexity pode levar 60s por tentativa (+ retries)
+    "sub-telegram-input": {
+        "topic": "topic-discovery-input",
+        "ack_deadline_seconds": 300,
+    },
+    # Agente 2: fetch do site + páginas adicionais + Wappalyzer
+    "sub-tech-checker": {
+        "topic": "topic-tech-filter",
+        "ack_deadline_seconds": 120,
+        "message_retention_seconds": 3 * 24 * 3600,
+    },
+    # Agente 3: Parte 2 (CrustData + Lusha + Apollo + Serper + DataStone) passa fácil de minutos.
+    # Exactly-once evita pagar enriquecimento duas vezes por redelivery.
+    "sub-enricher-worker": {
+        "topic": "topic-enricher",
+        "ack_deadline_seconds": 600,
+        "message_retention_seconds": 3 * 24 * 3600,
+        "exactly_once": True,
+    },
+    # Agente 3 (faixa prioritária): cliques FETCH_PEOPLE, consumidos com workers reservados
+    "sub-enricher-priority": {
+        "topic": "topic-enricher-priority",
+        "ack_deadline_seconds": 600,
+        "exactly_once": True,
+    },
+    # Agente 4: até 5 contatos x 3 canais de Gemini
+    "sub-copy-generator": {
+        "topic": "topic-copy-generator",
+        "ack_deadline_seconds": 300,
+    },
+    # Dead-letter: só inspeção manual (queue_ops / console), sem DLQ própria
+    "sub-dead-letter": {
+        "topic": DEAD_LETTER_TOPIC,
+        "message_retention_seconds": 7 * 24 * 3600,
+        "dead_letter": None,
+        "retry": None,
+    },
+}
+
+# Agente 2 com TECH_SHARDS > 1: uma assinatura filtrada por shard no lugar da única
+# (a antiga 'sub-tech-checker' aparece como "fora da spec" no diff - apague após drenar)
+if sharding.TECH_SHARDS > 1:
+    _tech_spec = SUBSCRIPTIONS.pop(sharding.TECH_SUBSCRIPTION_BASE)
+    for _i in range(sharding.TECH_SHARDS):
+        SUBSCRIPTIONS[sharding.shard_subscription_name(_i)] = dict(_tech_spec, filter=sharding.shard_filter(_i))
+
+
+def subscription_spec(name):
+    """Retorna a spec completa (defaults + overrides) de uma assinatura"""
+    spec = dict(SUBSCRIPTION_DEFAULTS)
+    spec.update(SUBSCRIPTIONS[name])
+    return spec
+
+
+# ==============================================================================
+# 🔧 CONVERSÃO SPEC <-> API
+# ==============================================================================
+
+publisher = pubsub_v1.PublisherClient()
+subscriber = pubsub_v1.SubscriberClient()
+
+
+def _seconds(value):
+    """Normaliza Duration/timedelta/dict para segundos inteiros"""
+    if value is None:
+        return 0
+    if isinstance(value, datetime.timedelta):
+        return int(value.total_seconds())
+    if isinstance(value, dict):
+        return int(value.get("seconds", 0))
+    return int(getattr(value, "seconds", 0) or 0)
+
+
+def desired_state(name):
+    """Estado desejado de uma assinatura, no mesmo formato de `current_state`"""
+    spec = subscription_spec(name)
+    dead_letter = spec.get("dead_letter")
+    retry = spec.get("retry")
+    return {
+        "topic": publisher.topic_path(PROJECT_ID, spec["topic"]),
+        "ack_deadline_seconds": spec["ack_deadline_seconds"],
+        "message_retention_duration": spec["message_retention_seconds"],
+        "dead_letter_policy": (
+            (publisher.topic_path(PROJECT_ID, dead_letter["topic"]), dead_letter["max_delivery_attempts"])
+            if dead_letter else None
+        ),
+        "retry_policy": (
+            (retry["minimum_backoff_seconds"], retry["maximum_backoff_seconds"]) if retry else None
+        ),
+        "enable_exactly_once_delivery": bool(spec.get("exactly_once")),
+        "filter": spec.get("filter") or "",
+    }
+
+
+def current_state(sub):
+    """Converte a Subscription retornada pela API para o formato comparável"""
+    dlp = sub.dead_letter_policy
+    rp = sub.retry_policy
+    has_dlp = bool(dlp and dlp.dead_letter_topic)
+    has_rp = bool(rp and (_seconds(rp.minimum_backoff) or _seconds(rp.maximum_backoff)))
+    return {
+        "topic": sub.topic,
+        "ack_deadline_seconds": sub.ack_deadline_seconds,
+        "message_retention_duration": _seconds(sub.message_retention_duration),
+        "dead_letter_policy": (dlp.dead_letter_topic, dlp.max_delivery_attempts) if has_dlp else None,
+        "retry_policy": (_seconds(rp.minimum_backoff), _seconds(rp.maximum_backoff)) if has_rp else None,
+        "enable_exactly_once_delivery": bool(sub.enable_exactly_once_delivery),
+        "filter": sub.filter or "",
+    }
+
+
+def _request_fields(state):
+    """Converte o estado desejado para os campos do request da API"""
+    fields = {
+        "topic": state["topic"],
+        "ack_deadline_seconds": state["ack_deadline_seconds"],
+        "message_retention_duration": {"seconds": state["message_retention_duration"]},
+        "enable_exactly_once_delivery": state["enable_exactly_once_delivery"],
+    }
+    if state["filter"]:
+        fields["filter"] = state["filter"]
+    if state["dead_letter_policy"]:
+        topic, attempts = state["dead_letter_policy"]
+        fields["dead_letter_policy"] = {"dead_letter_topic": topic, "max_delivery_attempts": attempts}
+    else:
+        fields["dead_letter_policy"] = None
+    if state["retry_policy"]:
+        min_b, max_b = state["retry_policy"]
+        fields["retry_policy"] = {"minimum_backoff": {"seconds": min_b}, "maximum_backoff": {"seconds": max_b}}
+    else:
+        fields["retry_policy"] = None
+    return fields
+
+
+# ==============================================================================
+# 🔍 DIFF
+# ==============================================================================
+
+def diff_topics(names=None):
+    """Retorna lista de tópicos declarados que não existem"""
+    missing = []
+    for topic in names or TOPICS:
+        try:
+            publisher.get_topic(request={"topic": publisher.topic_path(PROJECT_ID, topic)})
+        except NotFound:
+            missing.append(topic)
+    return missing
+
+
+def diff_subscription(name):
+    """
+    Compara uma assinatura com a spec.
+    Retorna (status, mudanças) onde status é OK, MISSING, UPDATE ou RECREATE
+    e mudanças é {campo: (atual, desejado)}.
+    """
+    desired = desired_state(name)
+    try:
+        sub = subscriber.get_subscription(request={"subscription": subscriber.subscription_path(PROJECT_ID, name)})
+    except NotFound:
+        return "MISSING", {k: (None, v) for k, v in desired.items()}
+
+    current = current_state(sub)
+    changes = {}
+    for field, want in desired.items():
+        if EMULATOR_HOST and field in EMULATOR_IGNORED_FIELDS:
+            continue
+        if current[field] != want:
+            changes[field] = (current[field], want)
+
+    if not changes:
+        return "OK", {}
+    if IMMUTABLE_FIELDS & set(changes):
+        return "RECREATE", changes
+    return "UPDATE", changes
+
+
+def extra_subscriptions():
+    """Assinaturas existentes nos tópicos declarados que não estão na spec"""
+    extras = []
+    for topic in TOPICS:
+        try:
+            subs = publisher.list_topic_subscriptions(request={"topic": publisher.topic_path(PROJECT_ID, topic)})
+        except NotFound:
+            continue
+        for path in subs:
+            short = path.split("/")[-1]
+            if short not in SUBSCRIPTIONS:
+                extras.append((topic, short))
+    return extras
+
+
+def print_diff(names=None):
+    """Imprime o diff e retorna True se estiver tudo sincronizado"""
+    in_sync = True
+    for topic in diff_topics():
+        in_sync = False
+        print(f"➕ Tópico ausente: {topic}")
+
+    for name in names or SUBSCRIPTIONS:
+        status, changes = diff_subscription(name)
+        if status == "OK":
+            print(f"✅ {name}: sincronizada")
+            continue
+        in_sync = False
+        icon = {"MISSING": "➕", "UPDATE": "✏️", "RECREATE": "♻️"}[status]
+        print(f"{icon} {name}: {status}")
+        if status != "MISSING":
+            for field, (have, want) in changes.items():
+                print(f"      {field}: {have} -> {want}")
+
+    for topic, short in extra_subscriptions():
+        print(f"❓ Assinatura fora da spec: {short} (tópico {topic})")
+    return in_sync
+
+
+# ==============================================================================
+# 🚀 APPLY
+# ==============================================================================
+
+def ensure_topic(name):
+    try:
+        publisher.create_topic(request={"name": publisher.topic_path(PROJECT_ID, name)})
+        print(f"✅ Tópico criado: {name}")
+    except AlreadyExists:
+        pass
+
+
+def apply(names=None, recreate=False):
+    """
+    Aplica a topologia de forma idempotente.
+    `names` limita às assinaturas informadas.
+    `recreate` autoriza apagar/recriar quando campos imutáveis mudaram.
+    """
+    # Tópicos são baratos e idempotentes: garante todos (inclusive a DLQ)
+    for topic in TOPICS:
+        ensure_topic(topic)
+
+    for name in names or SUBSCRIPTIONS:
+        sub_path = subscriber.subscription_path(PROJECT_ID, name)
+        status, changes = diff_subscription(name)
+        fields = _request_fields(desired_state(name))
+
+        if status == "OK":
+            print(f"✅ {name}: nada a fazer")
+
+        elif status == "MISSING":
+            request = {"name": sub_path}
+            request.update({k: v for k, v in fields.items() if v is not None})
+            subscriber.create_subscription(request=request)
+            print(f"✅ Assinatura criada: {name} (conectada a {subscription_spec(name)['topic']})")
+
+        elif status == "UPDATE":
+            body = {"name": sub_path}
+            body.update({k: fields[k] for k in changes})
+            subscriber.update_subscription(request={
+                "subscription": body,
+                "update_mask": {"paths": list(changes)}
+            })
+            print(f"✏️ Assinatura atualizada: {name} ({', '.join(changes)})")
+
+        elif status == "RECREATE":
+            if not recreate:
+                print(f"⚠️ {name}: {', '.join(IMMUTABLE_FIELDS & set(changes))} mudou. Rode com --recreate (perde o backlog).")
+                continue
+            subscriber.delete_subscription(request={"subscription": sub_path})
+            request = {"name": sub_path}
+            request.update({k: v for k, v in fields.items() if v is not None})
+            subscriber.create_subscription(request=request)
+            print(f"♻️ Assinatura recriada: {name}")
+
+    if not EMULATOR_HOST:
+        print("ℹ️ Dead-letter exige que a service account do Pub/Sub tenha publisher no "
+              f"'{DEAD_LETTER_TOPIC}' e subscriber nas assinaturas de origem.")
+
+
+def show():
+    for topic in TOPICS:
+        print(f"📮 {topic}")
+        for name in SUBSCRIPTIONS:
+            spec = subscription_spec(name)
+            if spec["topic"] != topic:
+                continue
+            dl = spec.get("dead_letter")
+            print(f"   └─ {name}: ack={spec['ack_deadline_seconds']}s | "
+                  f"retenção={spec['message_retention_seconds'] // 3600}h | "
+                  f"DLQ={'%s x%d' % (dl['topic'], dl['max_delivery_attempts']) if dl else '-'} | "
+                  f"exactly-once={'sim' if spec.get('exactly_once') else 'não'}"
+                  f"{' | filtro=' + spec['filter'] if spec.get('filter') else ''}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Topologia declarativa do Pub/Sub")
+    parser.add_argument("command", choices=["show", "diff", "apply"])
+    parser.add_argument("--subscription", "-s", action="append", help="Limita a uma ou mais assinaturas")
+    parser.add_argument("--recreate", action="store_true", help="Recria assinaturas com topic/filter alterado")
+    args = parser.parse_args()
+
+    if not PROJECT_ID:
+        print("❌ Erro: GCP_PROJECT_ID não encontrado no .env.")
+        sys.exit(1)
+
+    target = f"emulador {EMULATOR_HOST}" if EMULATOR_HOST else "GCP"
+    print(f"👷 Projeto: {PROJECT_ID} ({target})")
+
+    if args.command == "show":
+        show()
+    elif args.command == "diff":
+        sys.exit(0 if print_diff(args.subscription) else 2)
+    else:
+        apply(args.subscription, recreate=args.recreate)
+        print("🎉 Infraestrutura Pub/Sub pronta!")
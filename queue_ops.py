@@ -0,0 +1,361 @@
+"""
+QUEUE_OPS.PY - SalesMachine
+CLI de operação das filas Pub/Sub (substitui o antigo clean_queues.py)
+
+Responsabilidades:
+- purge: zera o backlog INTEIRO (seek-to-now, com fallback para pull+ack paralelo)
+- peek: mostra mensagens com payload decodificado (sem consumir - devolve para a fila)
+- stats: backlog e idade da mensagem mais antiga por assinatura
+
+Uso:
+    python queue_ops.py stats
+    python queue_ops.py peek sub-enricher-worker -n 5
+    python queue_ops.py peek sub-tech-checker --sample 5 --scan 500
+    python queue_ops.py purge --all
+    python queue_ops.py purge sub-tech-checker --method pull --workers 8
+
+Funciona contra o emulador quando PUBSUB_EMULATOR_HOST está setado
+(stats usa Cloud Monitoring em produção e varredura por pull no emulador).
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
+from google.cloud import pubsub_v1
+from google.api_core import exceptions as gapi_exceptions
+from dotenv import load_dotenv
+
+import pubsub_topology
+
+load_dotenv()
+
+PROJECT_ID = os.getenv("GCP_PROJECT_ID")
+EMULATOR_HOST = os.getenv("PUBSUB_EMULATOR_HOST")
+
+PULL_BATCH = 1000          # Máximo por pull
+ACK_CHUNK = 1000           # ack_ids por request de ack/modify
+PULL_TIMEOUT = 5           # segundos por pull
+SCAN_ACK_DEADLINE = 60     # segura as mensagens durante a varredura e devolve no final
+
+subscriber = pubsub_v1.SubscriberClient()
+
+try:
+    from google.cloud import monitoring_v3
+except ImportError:
+    monitoring_v3 = None
+
+
+def _sub_path(name):
+    return subscriber.subscription_path(PROJECT_ID, name)
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# Erros de configuração (assinatura errada/inexistente, sem permissão) nunca viram "fila vazia"
+FATAL_ERRORS = (gapi_exceptions.NotFound, gapi_exceptions.PermissionDenied)
+
+
+def _pull(sub_path, max_messages=PULL_BATCH):
+    try:
+        response = subscriber.pull(
+            request={"subscription": sub_path, "max_messages": max_messages},
+            timeout=PULL_TIMEOUT
+        )
+        return list(response.received_messages)
+    except (gapi_exceptions.DeadlineExceeded, gapi_exceptions.RetryError):
+        # DeadlineExceeded = fila vazia no emulador
+        return []
+
+
+def _release(sub_path, ack_ids):
+    """Devolve mensagens para a fila imediatamente (equivale a nack)"""
+    for chunk in _chunks(ack_ids, ACK_CHUNK):
+        subscriber.modify_ack_deadline(
+            request={"subscription": sub_path, "ack_ids": chunk, "ack_deadline_seconds": 0}
+        )
+
+
+def _ack(sub_path, ack_ids):
+    for chunk in _chunks(ack_ids, ACK_CHUNK):
+        subscriber.acknowledge(request={"subscription": sub_path, "ack_ids": chunk})
+
+
+# ==============================================================================
+# 📦 DECODIFICAÇÃO
+# ==============================================================================
+
+# Campos grandes que só poluem a visualização
+ELIDED_FIELDS = {"html_compressed", "original_text_context", "command"}
+
+
+def decode_message(received):
+    """Converte ReceivedMessage em dict legível"""
+    msg = received.message
+    raw = msg.data.decode("utf-8", errors="replace")
+    try:
+        payload = json.loads(raw)
+        if isinstance(payload, dict):
+            payload = {
+                k: (f"<{len(str(v))} chars>" if k in ELIDED_FIELDS and v else v)
+                for k, v in payload.items()
+            }
+    except json.JSONDecodeError:
+        payload = raw[:500]
+    return {
+        "message_id": msg.message_id,
+        "publish_time": msg.publish_time.isoformat() if msg.publish_time else None,
+        "delivery_attempt": received.delivery_attempt or None,
+        "attributes": dict(msg.attributes),
+        "payload": payload,
+    }
+
+
+def _age_seconds(publish_time):
+    if not publish_time:
+        return None
+    if publish_time.tzinfo is None:
+        publish_time = publish_time.replace(tzinfo=timezone.utc)
+    return (datetime.datetime.now(timezone.utc) - publish_time).total_seconds()
+
+
+# ==============================================================================
+# 🔍 SCAN / PEEK
+# ==============================================================================
+
+def scan(sub_name, max_messages=5000):
+    """
+    Puxa até `max_messages` (sem ack), coleta e devolve tudo para a fila.
+    Os consumidores ficam sem essas mensagens só durante a varredura.
+    """
+    sub_path = _sub_path(sub_name)
+    collected = []
+    ack_ids = []
+    try:
+        while len(collected) < max_messages:
+            batch = _pull(sub_path, min(PULL_BATCH, max_messages - len(collected)))
+            if not batch:
+                break
+            ack_ids.extend(r.ack_id for r in batch)
+            subscriber.modify_ack_deadline(request={
+                "subscription": sub_path,
+                "ack_ids": [r.ack_id for r in batch],
+                "ack_deadline_seconds": SCAN_ACK_DEADLINE
+            })
+            collected.extend(batch)
+    finally:
+        if ack_ids:
+            _release(sub_path, ack_ids)
+    return collected
+
+
+def peek(sub_name, count=10, sample=None, scan_limit=500):
+    if sample:
+        messages = scan(sub_name, scan_limit)
+        messages = random.sample(messages, min(sample, len(messages)))
+    else:
+        messages = scan(sub_name, count)
+
+    if not messages:
+        print(f"✅ {sub_name}: fila vazia.")
+        return []
+
+    decoded = [decode_message(m) for m in messages]
+    for d in decoded:
+        print(json.dumps(d, ensure_ascii=False, indent=2, default=str))
+    print(f"👀 {len(decoded)} mensagens exibidas (devolvidas para a fila).")
+    return decoded
+
+
+# ==============================================================================
+# 📊 STATS
+# ==============================================================================
+
+def _monitoring_value(sub_name, metric_type):
+    """Último ponto de uma métrica de assinatura no Cloud Monitoring"""
+    client = monitoring_v3.MetricServiceClient()
+    now = int(time.time())
+    results = client.list_time_series(request={
+        "name": f"projects/{PROJECT_ID}",
+        "filter": f'metric.type = "{metric_type}" AND resource.labels.subscription_id = "{sub_name}"',
+        "interval": {"end_time": {"seconds": now}, "start_time": {"seconds": now - 600}},
+        "view": monitoring_v3.ListTimeSeriesRequest.TimeSeriesView.FULL,
+    })
+    for series in results:
+        if series.points:
+            return series.points[0].value.int64_value
+    return None
+
+
+def subscription_stats(sub_name, scan_limit=5000):
+    """
+    Retorna {"backlog": int, "oldest_age_seconds": float, "source": str}.
+    Produção: Cloud Monitoring (não mexe na fila). Emulador/sem lib: varredura.
+    """
+    if monitoring_v3 and not EMULATOR_HOST:
+        try:
+            backlog = _monitoring_value(sub_name, "pubsub.googleapis.com/subscription/num_undelivered_messages")
+            oldest = _monitoring_value(sub_name, "pubsub.googleapis.com/subscription/oldest_unacked_message_age")
+            if backlog is not None:
+                return {"backlog": backlog, "oldest_age_seconds": oldest, "source": "monitoring"}
+        except Exception as e:
+            print(f"⚠️ Cloud Monitoring indisponível ({e}). Usando varredura.")
+
+    messages = scan(sub_name, scan_limit)
+    ages = [_age_seconds(m.message.publish_time) for m in messages]
+    ages = [a for a in ages if a is not None]
+    return {
+        "backlog": len(messages),
+        "oldest_age_seconds": max(ages) if ages else None,
+        "source": "scan" + ("+" if len(messages) >= scan_limit else ""),
+    }
+
+
+def _fmt_age(seconds):
+    if seconds is None:
+        return "-"
+    seconds = int(seconds)
+    if seconds < 120:
+        return f"{seconds}s"
+    if seconds < 7200:
+        return f"{seconds // 60}min"
+    return f"{seconds // 3600}h{(seconds % 3600) // 60:02d}"
+
+
+def print_stats(sub_names, scan_limit=5000):
+    print(f"{'ASSINATURA':<28} {'BACKLOG':>8} {'MAIS ANTIGA':>12}  FONTE")
+    for name in sub_names:
+        try:
+            st = subscription_stats(name, scan_limit)
+            print(f"{name:<28} {st['backlog']:>8} {_fmt_age(st['oldest_age_seconds']):>12}  {st['source']}")
+        except Exception as e:
+            print(f"{name:<28} {'?':>8} {'?':>12}  erro: {e}")
+
+
+# ==============================================================================
+# 🧹 PURGE
+# ==============================================================================
+
+def purge_seek(sub_name):
+    """Seek para 'agora': tudo publicado antes vira ack de uma vez (O(1))"""
+    now = datetime.datetime.now(timezone.utc)
+    subscriber.seek(request={"subscription": _sub_path(sub_name), "time": now})
+
+
+def purge_pull(sub_name, workers=8, empty_rounds=2):
+    """Pull + ack em paralelo até a fila ficar vazia por `empty_rounds` rodadas seguidas"""
+    sub_path = _sub_path(sub_name)
+
+    def worker():
+        deleted = 0
+        empties = 0
+        while empties < empty_rounds:
+            batch = _pull(sub_path)
+            if not batch:
+                empties += 1
+                continue
+            empties = 0
+            _ack(sub_path, [r.ack_id for r in batch])
+            deleted += len(batch)
+        return deleted
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(lambda _: worker(), range(workers)))
+
+
+def purge(sub_name, method="seek", workers=8):
+    print(f"🗑️ Limpando fila: {sub_name}...")
+    start = time.monotonic()
+    if method == "seek":
+        try:
+            purge_seek(sub_name)
+            print(f"   🔥 Backlog descartado via seek ({time.monotonic() - start:.1f}s)")
+            return
+        except FATAL_ERRORS:
+            raise
+        except Exception as e:
+            print(f"   ⚠️ Seek falhou ({e}). Usando pull+ack paralelo...")
+    deleted = purge_pull(sub_name, workers=workers)
+    print(f"   🔥 {deleted} mensagens deletadas ({time.monotonic() - start:.1f}s)")
+
+
+# ==============================================================================
+# 🚀 CLI
+# ==============================================================================
+
+def _resolve(names, use_all):
+    if use_all or not names:
+        return list(pubsub_topology.SUBSCRIPTIONS)
+    return names
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Operação das filas Pub/Sub")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_stats = sub.add_parser("stats", help="Backlog e idade da mais antiga")
+    p_stats.add_argument("subscriptions", nargs="*")
+    p_stats.add_argument("--scan", type=int, default=5000, help="Limite da varredura (emulador)")
+
+    p_peek = sub.add_parser("peek", help="Mostra mensagens sem consumir")
+    p_peek.add_argument("subscription")
+    p_peek.add_argument("-n", type=int, default=10)
+    p_peek.add_argument("--sample", type=int, help="Amostra aleatória de K mensagens")
+    p_peek.add_argument("--scan", type=int, default=500, help="Universo da amostra")
+
+    p_purge = sub.add_parser("purge", help="Zera o backlog")
+    p_purge.add_argument("subscriptions", nargs="*")
+    p_purge.add_argument("--all", action="store_true")
+    p_purge.add_argument("--method", choices=["seek", "pull"], default="seek")
+    p_purge.add_argument("--workers", type=int, default=8)
+    p_purge.add_argument("--yes", "-y", action="store_true", help="Não pede confirmação")
+
+    args = parser.parse_args()
+
+    if not PROJECT_ID:
+        print("❌ Erro: GCP_PROJECT_ID não encontrado no .env.")
+        sys.exit(1)
+
+    if args.command == "stats":
+        print_stats(_resolve(args.subscriptions, False), args.scan)
+
+    elif args.command == "peek":
+        try:
+            peek(args.subscription, args.n, args.sample, args.scan)
+        except FATAL_ERRORS as e:
+            print(f"❌ {args.subscription}: {e.message}")
+            sys.exit(1)
+
+    elif args.command == "purge":
+        targets = _resolve(args.subscriptions, args.all)
+        if not args.yes:
+            confirm = input(f"⚠️ Isso apagará TODO o backlog de: {', '.join(targets)}. Tem certeza? (s/n): ")
+            if confirm.lower() != "s":
+                print("Ufa! Operação cancelada.")
+                sys.exit(0)
+        print(f"🧹 INICIANDO FAXINA NO PROJETO: {PROJECT_ID}...\n")
+        failed = []
+        for name in targets:
+            try:
+                purge(name, args.method, args.workers)
+            except gapi_exceptions.NotFound:
+                print(f"   ❌ {name}: assinatura não existe em {PROJECT_ID}.")
+                failed.append(name)
+            except gapi_exceptions.PermissionDenied as e:
+                print(f"   ❌ {name}: sem permissão ({e.message}).")
+                failed.append(name)
+            except Exception as e:
+                print(f"   ⚠️ Falha em {name}: {e}")
+                failed.append(name)
+        if failed:
+            print(f"\n⚠️ Não limpas: {', '.join(failed)}")
+            sys.exit(1)
+        print("\n✨ Tudo limpo!")
@@ -0,0 +1,215 @@
+"""
+QUOTA.PY - SalesMachine
+Orçamento de APIs pagas: token buckets por chat e por provedor
+
+Responsabilidades:
+- Bucket por chat (buscas, enriquecimentos, leads analisados) e por provedor
+  (perplexity, crustdata, apollo, lusha, serper, datastone)
+- Recarga contínua: LIMITE por dia, com rajada de até um dia inteiro de fichas
+- Backend compartilhado entre réplicas (QUOTA_BACKEND=firestore -> transação na coleção `quotas`)
+  ou memória do processo (padrão)
+- Provedores no Firestore: cada processo reserva QUOTA_RESERVE_CHUNK fichas por transação e
+  gasta localmente (o doc do provedor é de todos os agentes; uma transação por chamada paga
+  vira hotspot). Sobra no máximo um lote por réplica parado, e a recarga cobre
+- "Saldo baixo" (< QUOTA_LOW_FRACTION) para os agentes trocarem por caminhos mais baratos
+- Falha do backend = libera (não derruba a esteira por causa do contador)
+
+Limites (por dia, 0 = sem limite):
+    QUOTA_CHAT_SEARCH_PER_DAY=30   QUOTA_CHAT_ENRICH_PER_DAY=40   QUOTA_CHAT_LEAD_PER_DAY=200
+    QUOTA_PROVIDER_CRUSTDATA_PER_DAY=500 ... (ver DEFAULT_LIMITS)
+"""
+
+import os
+import time
+import datetime
+import threading
+from datetime import timezone
+
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+QUOTA_BACKEND = os.getenv("QUOTA_BACKEND", "memory").lower()
+QUOTA_LOW_FRACTION = float(os.getenv("QUOTA_LOW_FRACTION", "0.2"))
+QUOTA_RESERVE_CHUNK = int(os.getenv("QUOTA_RESERVE_CHUNK", "10"))
+RESERVE_MAX_FRACTION = 0.05  # Lote nunca passa de 5% do limite diário (limites pequenos: sem reserva)
+COLLECTION_QUOTAS = "quotas"
+DAY_SECONDS = 86400
+
+DEFAULT_LIMITS = {
+    ("chat", "search"): 30,
+    ("chat", "enrich"): 40,
+    ("chat", "lead"): 200,
+    ("chat", "import_lead"): 1000,
+    ("provider", "perplexity"): 300,
+    ("provider", "crustdata"): 500,
+    ("provider", "apollo"): 300,
+    ("provider", "lusha"): 150,
+    ("provider", "serper"): 1000,
+    ("provider", "datastone"): 200,
+}
+
+
+def limit_for(scope, name):
+    default = DEFAULT_LIMITS.get((scope, name), 0)
+    return float(os.getenv(f"QUOTA_{scope.upper()}_{name.upper()}_PER_DAY", default))
+
+
+def _refill(tokens, updated_at, capacity, now):
+    return min(capacity, tokens + (now - updated_at) * capacity / DAY_SECONDS)
+
+
+# ==============================================================================
+# 💾 BACKENDS
+# ==============================================================================
+
+class MemoryBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, capacity, cost, partial, reserve=0):
+        """Retorna (fichas concedidas, saldo depois). Sem round-trip: `reserve` não se aplica."""
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = _refill(tokens, updated_at, capacity, now)
+            granted = cost if tokens >= cost else (int(tokens) if partial else 0)
+            tokens = min(capacity, tokens - granted)
+            self._buckets[key] = (tokens, now)
+            return granted, tokens
+
+
+class FirestoreBackend:
+    def __init__(self, db):
+        from google.cloud import firestore
+        self._db = db
+        self._transactional = firestore.transactional
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._reserved = {}   # key -> fichas já tiradas do doc e ainda não gastas neste processo
+        self._shared = {}     # key -> saldo do doc na última transação
+
+    def take(self, key, capacity, cost, partial, reserve=0):
+        """
+        Com `reserve` > 0 tira um lote do doc (cost + reserve) e serve as próximas chamadas
+        da sobra local; só volta ao Firestore quando a sobra não cobre o pedido.
+        """
+        reserve = min(reserve, int(capacity * RESERVE_MAX_FRACTION))
+        if reserve <= 0 or cost <= 0:
+            return self._transact(key, capacity, cost, partial)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            held = self._reserved.get(key, 0)
+            if held < cost:
+                got, shared = self._transact(key, capacity, cost - held + reserve, True)
+                held += got
+                self._shared[key] = shared
+                metrics.inc("quota_reservations_total", bucket=key)
+            granted = cost if held >= cost else (int(held) if partial else 0)
+            self._reserved[key] = held - granted
+            return granted, self._shared.get(key, capacity) + self._reserved[key]
+
+    def _transact(self, key, capacity, cost, partial):
+        @self._transactional
+        def _take(transaction, doc_ref):
+            now = time.time()
+            snap = doc_ref.get(transaction=transaction)
+            data = snap.to_dict() if snap.exists else {}
+            tokens = _refill(data.get("tokens", capacity), data.get("updated_at_ts", now), capacity, now)
+            granted = cost if tokens >= cost else (int(tokens) if partial else 0)
+            tokens = min(capacity, tokens - granted)
+            transaction.set(doc_ref, {
+                "tokens": tokens,
+                "capacity": capacity,
+                "updated_at_ts": now,
+                "updated_at": datetime.datetime.now(timezone.utc),
+            })
+            return granted, tokens
+
+        with metrics.timer("firestore_op_seconds", op="transaction", collection=COLLECTION_QUOTAS):
+            return _take(self._db.transaction(), self._db.collection(COLLECTION_QUOTAS).document(key))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_last_ratio = {}   # key -> saldo/limite observado na última consulta (para provider_low sem round-trip)
+
+
+def _get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if QUOTA_BACKEND == "firestore":
+                try:
+                    import database
+                    if database.db is None:
+                        raise RuntimeError("Firestore indisponível")
+                    _backend = FirestoreBackend(database.db)
+                except Exception as e:
+                    print(f"⚠️ Quota: backend Firestore indisponível ({e}). Usando memória.")
+                    _backend = MemoryBackend()
+            else:
+                _backend = MemoryBackend()
+        return _backend
+
+
+# ==============================================================================
+# 🎟️ API
+# ==============================================================================
+
+def consume(scope, name, subject=None, cost=1, partial=False):
+    """
+    Tenta gastar `cost` fichas. Retorna quantas foram concedidas
+    (0 = negado; com partial=True pode conceder menos que o pedido).
+    """
+    capacity = limit_for(scope, name)
+    if capacity <= 0:
+        return cost
+    key = f"{scope}_{name}" + (f"_{subject}" if subject is not None else "")
+    try:
+        # Provedor: doc compartilhado por todos os agentes -> reserva em lote
+        reserve = QUOTA_RESERVE_CHUNK if scope == "provider" else 0
+        granted, tokens = _get_backend().take(key, capacity, cost, partial, reserve)
+    except Exception as e:
+        print(f"⚠️ Quota: contador indisponível ({e}). Liberando.")
+        metrics.inc("quota_errors_total", scope=scope)
+        return cost
+    _last_ratio[key] = tokens / capacity
+    if scope == "provider":
+        metrics.set_gauge("quota_remaining_ratio", tokens / capacity, provider=name)
+    if granted < cost:
+        metrics.inc("quota_denied_total", scope=scope, bucket=name)
+    return granted
+
+
+def allow_chat(chat_id, action, cost=1):
+    """Chat ainda tem orçamento para a ação (search/enrich/lead)?"""
+    return consume("chat", action, subject=chat_id, cost=cost) == cost
+
+
+def grant_chat(chat_id, action, wanted):
+    """Concede até `wanted` unidades (ex: enriquecer top N com saldo para N-2)"""
+    return consume("chat", action, subject=chat_id, cost=wanted, partial=True)
+
+
+def refund_chat(chat_id, action, amount):
+    """Devolve fichas concedidas e não usadas (custo negativo, limitado à capacidade)"""
+    if amount > 0:
+        consume("chat", action, subject=chat_id, cost=-amount)
+
+
+def spend_provider(provider, cost=1):
+    """Gasta uma chamada do provedor. False = orçamento do dia acabou."""
+    return consume("provider", provider, cost=cost) == cost
+
+
+def provider_low(provider):
+    """Saldo do provedor abaixo de QUOTA_LOW_FRACTION (última leitura conhecida)"""
+    if limit_for("provider", provider) <= 0:
+        return False
+    ratio = _last_ratio.get(f"provider_{provider}")
+    return ratio is not None and ratio < QUOTA_LOW_FRACTION
@@ -0,0 +1,320 @@
+"""
+REPLAY.PY - SalesMachine
+Reproduz entradas gravadas (stage_recorder.py) direto no callback do agente
+
+Responsabilidades:
+- Carregar as entradas gravadas de um estágio (filtro por domínio / janela de tempo)
+- Chamar `agent_N.callback` com uma mensagem local (sem Pub/Sub)
+- Concorrência controlada para benchmark com o formato real do tráfego
+- Por padrão NÃO publica para o próximo estágio e NÃO manda Telegram (chat_id removido)
+- Por padrão NÃO grava no Firestore: escritas do database.py viram no-op (e o lead
+  conta como novo, senão o replay do Agente 1 daria "Já existe" em tudo), os clients
+  próprios dos agentes (`db_firestore`) e o `database.db` viram somente-leitura e a
+  quota roda em memória (nada de transação nos docs de `quotas`)
+- Estágios com API paga (Perplexity, CrustData/Apollo/Lusha, Gemini) só rodam com --live
+
+Uso:
+    python replay.py agent_2 --limit 20 --concurrency 4
+    python replay.py agent_3 --domain empresa.com.br --live --publish   # gasta créditos!
+    python replay.py agent_1 --since-hours 6 --live --chat-id -100123  # resultados num chat de debug
+    python replay.py agent_2 --limit 5 --write-db                       # grava de verdade
+"""
+
+import sys
+import json
+import time
+import argparse
+import datetime
+import importlib
+import threading
+from datetime import timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import quota
+import stage_recorder
+
+STAGE_MODULES = {
+    "agent_1": "agent_1_discovery",
+    "agent_2": "agent_2_tech",
+    "agent_3": "agent_3_premium",
+    "agent_3_priority": "agent_3_premium",
+    "agent_4": "agent_4_copywriter",
+}
+
+# Estágios que chamam APIs pagas a cada mensagem
+PAID_STAGES = {"agent_1", "agent_3", "agent_3_priority", "agent_4"}
+
+# Escritas do database.py -> valor devolvido no replay sem --write-db
+DB_WRITE_STUBS = {
+    "save_cnpj_cache": None,
+    "save_new_lead": None,
+    "update_techs": None,
+    "update_enrichment": None,
+    "update_copies": None,
+    "save_debug_log": None,
+    "bulk_update_leads": 0,
+    "bulk_update_status": 0,
+    "bulk_save_new_leads": 0,
+    "save_queued_lead": None,
+    "claim_queued_lead": False,
+    "save_stage_input": None,
+    "append_digest_entry": None,
+    "set_digest_page_message": None,
+    "claim_digest_page": None,
+    "release_digest_page_claim": None,
+    "update_digest_entries": [],
+    "save_search_cache": None,
+    "save_tombstone": None,
+    "increment_tombstone_avoided": None,
+    "set_chat_last_search": None,
+    # Leituras que dependem do que a execução original gravou
+    "check_lead_exists": False,
+    "existing_leads": set(),
+}
+
+
+class ReplayMessage:
+    """Imita a mensagem do Pub/Sub para o callback"""
+
+    def __init__(self, data, attributes=None, message_id=None, publish_time=None):
+        self.data = data
+        self.attributes = attributes or {}
+        self.message_id = message_id
+        self.publish_time = publish_time
+        self.delivery_attempt = None
+        self.outcome = None
+
+    def ack(self):
+        self.outcome = self.outcome or "ack"
+
+    def nack(self):
+        self.outcome = self.outcome or "nack"
+
+
+class _DoneFuture:
+    def result(self, timeout=None):
+        return "replay"
+
+    def add_done_callback(self, fn):
+        fn(self)
+
+
+class CapturePublisher:
+    """Substitui o publisher do agente: guarda o que seria publicado"""
+
+    def __init__(self):
+        self.published = []
+        self._lock = threading.Lock()
+
+    def publish(self, topic, data, **attrs):
+        with self._lock:
+            self.published.append((topic, data, attrs))
+        return _DoneFuture()
+
+    def topic_path(self, project, topic):
+        return f"projects/{project}/topics/{topic}"
+
+    def stop(self):
+        pass
+
+
+def _stub(value):
+    def stub(*args, **kwargs):
+        return value.copy() if isinstance(value, (list, set)) else value
+    return stub
+
+
+class _ReadOnlyDocument:
+    """DocumentReference que lê do Firestore de verdade e ignora as escritas"""
+
+    def __init__(self, ref):
+        self._ref = ref
+
+    def set(self, *args, **kwargs):
+        return None
+
+    def update(self, *args, **kwargs):
+        return None
+
+    def create(self, *args, **kwargs):
+        return None
+
+    def delete(self, *args, **kwargs):
+        return None
+
+    def collection(self, name):
+        return _ReadOnlyCollection(self._ref.collection(name))
+
+    def __getattr__(self, name):
+        return getattr(self._ref, name)
+
+
+class _ReadOnlyCollection:
+    def __init__(self, ref):
+        self._ref = ref
+
+    def document(self, *args, **kwargs):
+        return _ReadOnlyDocument(self._ref.document(*args, **kwargs))
+
+    def add(self, *args, **kwargs):
+        return None, None
+
+    def __getattr__(self, name):
+        return getattr(self._ref, name)
+
+
+class _NoopBatch:
+    def set(self, *args, **kwargs):
+        return self
+
+    def update(self, *args, **kwargs):
+        return self
+
+    def delete(self, *args, **kwargs):
+        return self
+
+    def commit(self):
+        return []
+
+
+class ReadOnlyFirestore:
+    """Client do Firestore para replay: leituras passam, escritas viram no-op"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def collection(self, name):
+        return _ReadOnlyCollection(self._client.collection(name))
+
+    def document(self, path):
+        return _ReadOnlyDocument(self._client.document(path))
+
+    def get_all(self, refs, *args, **kwargs):
+        refs = [getattr(r, "_ref", r) for r in refs]
+        return self._client.get_all(refs, *args, **kwargs)
+
+    def batch(self):
+        return _NoopBatch()
+
+    def transaction(self, *args, **kwargs):
+        raise RuntimeError("Transação no Firestore desligada no replay (use --write-db)")
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def stub_database_writes():
+    """Troca as escritas do database.py por no-ops (o replay não suja o Firestore)"""
+    for name, value in DB_WRITE_STUBS.items():
+        if hasattr(database, name):
+            setattr(database, name, _stub(value))
+    # Quem usa o client direto (llm_cache, backends) só consegue ler
+    if database.db is not None and not isinstance(database.db, ReadOnlyFirestore):
+        database.db = ReadOnlyFirestore(database.db)
+    # Quota em memória: o backend Firestore faria uma transação por chamada paga
+    with quota._backend_lock:
+        quota._backend = quota.MemoryBackend()
+    print("🧪 Escritas no Firestore desligadas (use --write-db para gravar).")
+
+
+def stub_module_writes(module):
+    """Clients do Firestore próprios do agente (ex: db_firestore do Agente 3/4) só leem"""
+    client = getattr(module, "db_firestore", None)
+    if client is not None and not isinstance(client, ReadOnlyFirestore):
+        module.db_firestore = ReadOnlyFirestore(client)
+
+
+def _prepare_payload(raw, chat_id):
+    """Troca o chat_id (None = sem Telegram) mantendo o resto byte-a-byte"""
+    try:
+        payload = json.loads(raw.decode("utf-8"))
+    except Exception:
+        return raw
+    if isinstance(payload, dict) and "chat_id" in payload:
+        payload["chat_id"] = chat_id
+        return json.dumps(payload).encode("utf-8")
+    return raw
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def replay(stage, records, concurrency=1, publish=False, chat_id=None, write_db=False):
+    module = importlib.import_module(STAGE_MODULES[stage])
+    if not write_db:
+        stub_module_writes(module)
+    capture = None
+    if not publish:
+        capture = CapturePublisher()
+        module.publisher = capture
+
+    def run_one(rec):
+        raw = _prepare_payload(stage_recorder.decode_payload(rec["payload_z"]), chat_id)
+        msg = ReplayMessage(raw, rec.get("attributes"), rec.get("message_id"), rec.get("publish_time"))
+        start = time.monotonic()
+        error = None
+        try:
+            module.callback(msg)
+        except Exception as e:
+            error = str(e)
+        elapsed = time.monotonic() - start
+        outcome = "exception" if error else (msg.outcome or "none")
+        print(f"   {'✅' if outcome == 'ack' else '⚠️'} {rec.get('domain') or rec.get('message_id')}: {outcome} em {elapsed:.2f}s")
+        return elapsed, outcome
+
+    print(f"🎞️ Replay de {len(records)} entradas em {stage} (concorrência {concurrency})...")
+    wall_start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(run_one, records))
+    wall = time.monotonic() - wall_start
+
+    durations = [d for d, _ in results]
+    outcomes = {}
+    for _, o in results:
+        outcomes[o] = outcomes.get(o, 0) + 1
+
+    print("\n📊 Resumo")
+    print(f"   Mensagens: {len(results)} | Tempo total: {wall:.1f}s | Throughput: {len(results) / wall if wall else 0:.2f} msg/s")
+    print(f"   Latência p50: {_percentile(durations, 50):.2f}s | p95: {_percentile(durations, 95):.2f}s | máx: {max(durations or [0]):.2f}s")
+    print(f"   Resultados: {outcomes}")
+    if capture is not None:
+        print(f"   Publicações capturadas (não enviadas): {len(capture.published)}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay de entradas gravadas de um estágio")
+    parser.add_argument("stage", choices=sorted(STAGE_MODULES))
+    parser.add_argument("--domain")
+    parser.add_argument("--since-hours", type=float)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--publish", action="store_true", help="Publica de verdade para o próximo estágio")
+    parser.add_argument("--chat-id", help="Chat para receber as mensagens do replay (padrão: nenhum)")
+    parser.add_argument("--live", action="store_true", help="Permite estágios com API paga (gasta créditos)")
+    parser.add_argument("--write-db", action="store_true", help="Grava no Firestore de verdade")
+    args = parser.parse_args()
+
+    if args.stage in PAID_STAGES and not args.live:
+        print(f"⛔ {args.stage} chama APIs pagas a cada mensagem. Use --live para confirmar o gasto.")
+        sys.exit(1)
+
+    since = None
+    if args.since_hours:
+        since = datetime.datetime.now(timezone.utc) - datetime.timedelta(hours=args.since_hours)
+
+    records = database.list_stage_inputs(args.stage, domain=args.domain, since=since, limit=args.limit)
+    if not records:
+        print("⚠️ Nenhuma entrada gravada encontrada (RECORD_STAGES estava ativo?).")
+        sys.exit(1)
+
+    records.reverse()  # Ordem cronológica, como chegaram
+    if not args.write_db:
+        stub_database_writes()
+    replay(args.stage, records, args.concurrency, args.publish, args.chat_id, args.write_db)
@@ -0,0 +1,115 @@
+"""
+SEARCH_CACHE.PY - SalesMachine
+Cache de buscas repetidas do Agente 1 (mesma consolidated_query minutos ou dias depois)
+
+Responsabilidades:
+- Normalizar a query (sem acento, sem stopwords, ordem das palavras não importa)
+- Guardar candidatos do Perplexity + domínios que viraram lead, com TTL
+- Responder na hora com o que já se sabe e deixar o Agente 1 buscar só o incremental
+  (candidatos conhecidos entram como exclusão já na primeira tentativa)
+
+Configuração:
+    SEARCH_CACHE_TTL_HOURS=72      (depois disso a busca recomeça do zero)
+    SEARCH_CACHE_SKIP_MINUTES=10   (busca idêntica há menos disso: só responde do cache)
+"""
+
+import os
+import re
+import hashlib
+import datetime
+import unicodedata
+from datetime import timezone
+
+from dotenv import load_dotenv
+
+import metrics
+import database
+
+load_dotenv()
+
+SEARCH_CACHE_TTL_HOURS = float(os.getenv("SEARCH_CACHE_TTL_HOURS", "72"))
+SEARCH_CACHE_SKIP_MINUTES = float(os.getenv("SEARCH_CACHE_SKIP_MINUTES", "10"))
+MAX_CACHED_CANDIDATES = 200
+
+_STOPWORDS = {"de", "da", "do", "das", "dos", "em", "no", "na", "nos", "nas", "e", "a", "o", "as", "os", "para", "com"}
+
+
+def normalize_query(query):
+    text = unicodedata.normalize("NFKD", str(query or "")).encode("ascii", "ignore").decode("ascii").lower()
+    words = [w for w in re.findall(r"[a-z0-9]+", text) if w not in _STOPWORDS]
+    return " ".join(sorted(set(words)))
+
+
+def cache_key(query):
+    normalized = normalize_query(query)
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest() if normalized else None
+
+
+def _age(entry):
+    updated_at = entry.get("updated_at")
+    if not updated_at:
+        return None
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return datetime.datetime.now(timezone.utc) - updated_at
+
+
+def lookup(query):
+    """Entrada válida do cache (com `age` em timedelta) ou None"""
+    entry = database.get_search_cache(cache_key(query))
+    if not entry:
+        metrics.inc("search_cache_requests_total", result="miss")
+        return None
+    age = _age(entry)
+    if age is None or age > datetime.timedelta(hours=SEARCH_CACHE_TTL_HOURS):
+        metrics.inc("search_cache_requests_total", result="expired")
+        return None
+    metrics.inc("search_cache_requests_total", result="hit")
+    entry["age"] = age
+    return entry
+
+
+def is_fresh(entry):
+    """Busca idêntica muito recente: não vale chamar o Perplexity de novo"""
+    return bool(entry) and entry["age"] < datetime.timedelta(minutes=SEARCH_CACHE_SKIP_MINUTES)
+
+
+def record(query, candidates, lead_domains, previous=None):
+    """Mescla os candidatos/leads desta execução com o que já estava no cache"""
+    key = cache_key(query)
+    if not key:
+        return
+    merged = {}
+    for comp in (previous or {}).get("candidates", []) + list(candidates):
+        domain = comp.get("domain")
+        if domain and domain not in merged:
+            merged[domain] = comp
+    domains = list(dict.fromkeys((previous or {}).get("lead_domains", []) + list(lead_domains)))
+    now = datetime.datetime.now(timezone.utc)
+    database.save_search_cache(key, {
+        "query": query,
+        "normalized": normalize_query(query),
+        "candidates": list(merged.values())[-MAX_CACHED_CANDIDATES:],
+        "lead_domains": domains[-MAX_CACHED_CANDIDATES:],
+        "created_at": (previous or {}).get("created_at", now),
+        "updated_at": now,
+        "expires_at": now + datetime.timedelta(hours=SEARCH_CACHE_TTL_HOURS),
+    })
+
+
+def format_cached_report(entry):
+    """Resumo imediato: leads que essa busca já gerou e em que pé estão"""
+    domains = entry.get("lead_domains", [])
+    leads = database.get_leads(domains)
+    hours = entry["age"].total_seconds() / 3600
+    when = f"{hours * 60:.0f} min" if hours < 1 else f"{hours:.0f}h"
+    msg = f"⚡ *Já busquei isso há {when}* — {len(domains)} lead(s) dessa busca:\n"
+    for domain in domains[:25]:
+        lead = leads.get(domain, {})
+        name = ((lead.get("crust_company") or {}).get("name") or domain).replace("*", " ").replace("_", " ")
+        score = lead.get("final_score") or lead.get("preliminary_score")
+        status = lead.get("status", "?")
+        msg += f"• {name} ({domain}) — {status}" + (f" | 📊 {score}" if score else "") + "\n"
+    if len(domains) > 25:
+        msg += f"... e mais {len(domains) - 25}.\n"
+    return msg
@@ -0,0 +1,70 @@
+"""
+SHARDING.PY - SalesMachine
+Afinidade por domínio entre réplicas do Agente 2
+
+Responsabilidades:
+- Calcular o shard de um domínio (hash estável, igual em qualquer processo/máquina)
+- Gerar o atributo `shard` publicado pelo Agente 1 em `topic-tech-filter`
+- Nomes/filtros das assinaturas por shard (usados pela topologia e pelo Agente 2)
+
+Com TECH_SHARDS=1 (padrão) tudo continua na assinatura única `sub-tech-checker`.
+Com TECH_SHARDS=N, cada shard tem `sub-tech-checker-s<i>` filtrada por `attributes.shard`,
+e cada réplica do Agente 2 assina só os shards que possui (AGENT2_SHARDS="0,2" ou "all").
+Assim o mesmo domínio sempre cai no mesmo processo (caches quentes).
+"""
+
+import os
+import zlib
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TECH_SHARDS = max(1, int(os.getenv("TECH_SHARDS", "1")))
+TECH_SUBSCRIPTION_BASE = "sub-tech-checker"
+
+
+def shard_for(domain, shards=None):
+    """Shard estável de um domínio (crc32 - não depende do PYTHONHASHSEED)"""
+    shards = shards or TECH_SHARDS
+    key = (domain or "").strip().lower().encode("utf-8")
+    return zlib.crc32(key) % shards
+
+
+def shard_attributes(domain):
+    """Atributos de publicação (sempre enviados - facilitam mudar o nº de shards depois)"""
+    return {"shard": str(shard_for(domain))}
+
+
+def shard_filter(index):
+    return f'attributes.shard = "{index}"'
+
+
+def shard_subscription_name(index):
+    if TECH_SHARDS == 1:
+        return TECH_SUBSCRIPTION_BASE
+    return f"{TECH_SUBSCRIPTION_BASE}-s{index}"
+
+
+def all_subscription_names():
+    return [shard_subscription_name(i) for i in range(TECH_SHARDS)]
+
+
+def owned_shards(spec=None):
+    """
+    Shards desta réplica. AGENT2_SHARDS="all" (padrão) ou lista "0,1,5".
+    Índices fora do intervalo são ignorados com aviso.
+    """
+    spec = (spec if spec is not None else os.getenv("AGENT2_SHARDS", "all")).strip().lower()
+    if spec in ("", "all", "*"):
+        return list(range(TECH_SHARDS))
+    owned = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        idx = int(part)
+        if 0 <= idx < TECH_SHARDS:
+            owned.append(idx)
+        else:
+            print(f"⚠️ Shard {idx} fora do intervalo (TECH_SHARDS={TECH_SHARDS}). Ignorado.")
+    return sorted(set(owned))
@@ -0,0 +1,132 @@
+"""
+STAGE_RECORDER.PY - SalesMachine
+Gravador opt-in das entradas de cada estágio (para reproduzir leads lentos/com erro)
+
+Responsabilidades:
+- Arquivar o payload COMPLETO recebido por um agente (zlib + base64, sem o corte de 2000 chars)
+- TTL via campo expires_at (configure a TTL policy do Firestore na coleção stage_inputs)
+- Gravação em background (não atrasa o callback) com flush no shutdown
+- Decodificação para o replay.py
+
+Ativação:
+    RECORD_STAGES=all              (ou "agent_2,agent_3")
+    RECORD_TTL_DAYS=7
+    RECORD_SAMPLE_RATE=1.0         (fração das mensagens gravadas)
+"""
+
+import os
+import json
+import zlib
+import base64
+import queue
+import random
+import datetime
+import threading
+from datetime import timezone
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+try:
+    import database
+except ImportError:
+    database = None
+
+RECORD_STAGES = {s.strip() for s in os.getenv("RECORD_STAGES", "").split(",") if s.strip()}
+RECORD_TTL_DAYS = int(os.getenv("RECORD_TTL_DAYS", "7"))
+RECORD_SAMPLE_RATE = float(os.getenv("RECORD_SAMPLE_RATE", "1.0"))
+MAX_RECORD_BYTES = 900_000  # Limite de documento do Firestore é 1 MiB
+
+_queue = queue.Queue(maxsize=1000)
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def is_enabled(stage):
+    return bool(RECORD_STAGES) and ("all" in RECORD_STAGES or stage in RECORD_STAGES)
+
+
+def encode_payload(raw_bytes):
+    return base64.b64encode(zlib.compress(raw_bytes, level=6)).decode("ascii")
+
+
+def decode_payload(encoded):
+    return zlib.decompress(base64.b64decode(encoded))
+
+
+def _writer_loop():
+    while True:
+        record = _queue.get()
+        try:
+            if record is None:
+                return
+            database.save_stage_input(record)
+            metrics.inc("stage_inputs_recorded_total", stage=record["stage"])
+        finally:
+            _queue.task_done()
+
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_writer_loop, name="stage-recorder", daemon=True)
+            _worker.start()
+
+
+def record(stage, message):
+    """Enfileira a mensagem recebida para gravação (nunca lança exceção)"""
+    if not database or not is_enabled(stage) or random.random() > RECORD_SAMPLE_RATE:
+        return
+    try:
+        raw = message.data
+        encoded = encode_payload(raw)
+        if len(encoded) > MAX_RECORD_BYTES:
+            metrics.inc("stage_inputs_skipped_total", stage=stage, reason="too_large")
+            return
+
+        domain = None
+        chat_id = None
+        try:
+            payload = json.loads(raw.decode("utf-8"))
+            if isinstance(payload, dict):
+                domain = payload.get("domain")
+                chat_id = payload.get("chat_id")
+        except Exception:
+            pass
+
+        now = datetime.datetime.now(timezone.utc)
+        publish_time = getattr(message, "publish_time", None)
+        _ensure_worker()
+        _queue.put_nowait({
+            "stage": stage,
+            "message_id": getattr(message, "message_id", None) or f"local-{now.timestamp()}",
+            "publish_time": publish_time,
+            "recorded_at": now,
+            "expires_at": now + datetime.timedelta(days=RECORD_TTL_DAYS),
+            "attributes": dict(getattr(message, "attributes", {}) or {}),
+            "domain": domain,
+            "chat_id": chat_id,
+            "size_bytes": len(raw),
+            "payload_z": encoded,
+        })
+    except queue.Full:
+        metrics.inc("stage_inputs_skipped_total", stage=stage, reason="queue_full")
+    except Exception as e:
+        print(f"⚠️ Recorder: falha ao gravar entrada ({e})")
+
+
+def flush(timeout=10):
+    """Espera a fila de gravação esvaziar (chamado no shutdown)"""
+    if _worker is None:
+        return
+    done = threading.Event()
+
+    def _join():
+        _queue.join()
+        done.set()
+
+    threading.Thread(target=_join, daemon=True).start()
+    done.wait(timeout)
@@ -0,0 +1,320 @@
+"""
+TELEGRAM_CLIENT.PY - SalesMachine
+Cliente único da API do Telegram (usado pelos Agentes 0-4)
+
+Responsabilidades:
+- Sessão HTTP keep-alive (sem novo handshake TLS a cada mensagem)
+- Token buckets: global (~30 msg/s do bot) e por chat (1 msg/s privado, 20/min grupo)
+- 429: respeita `retry_after` (pausa o chat ou o bot inteiro) e tenta de novo
+- Markdown quebrado: reenvia sem parse_mode
+- Fila de saída por chat com senders em background para avisos "dispara e esquece":
+  o sender só pega chats com ficha disponível, então um grupo travado (20/min, 429)
+  não segura os avisos dos outros chats (flush no shutdown via worker_lifecycle)
+
+Uso:
+    import telegram_client
+    msg_id = telegram_client.send_message(chat_id, "texto", reply_markup=kb)   # síncrono
+    telegram_client.send_message(chat_id, "aviso", wait=False)                  # fila
+    telegram_client.edit_message(chat_id, msg_id, "novo texto")
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from dotenv import load_dotenv
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+load_dotenv()
+
+TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+TELEGRAM_TIMEOUT = int(os.getenv("TELEGRAM_TIMEOUT", "10"))
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))      # msg/s do bot todo
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))           # msg/s por chat privado
+TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", str(20 / 60)))  # msg/s por grupo
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+TELEGRAM_QUEUE_SIZE = int(os.getenv("TELEGRAM_QUEUE_SIZE", "1000"))
+TELEGRAM_SENDERS = int(os.getenv("TELEGRAM_SENDERS", "4"))                 # threads da fila de saída
+
+CHAT_BURST = 3
+MAX_CHAT_BUCKETS = 5000
+# Métodos que não contam no limite de envio por chat
+UNTHROTTLED_METHODS = {"answerCallbackQuery", "getUpdates", "setWebhook", "deleteWebhook"}
+
+
+# ==============================================================================
+# 🪣 RATE LIMIT
+# ==============================================================================
+
+class TokenBucket:
+    """Balde clássico: `rate` fichas/s, até `capacity` acumuladas. acquire() bloqueia."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds):
+        """429 com retry_after: nenhuma ficha até passar o prazo"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+    def ready_in(self):
+        """Segundos até ter uma ficha (0 = já tem). Não consome."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def acquire(self):
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return waited
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class TelegramClient:
+    def __init__(self, token=None):
+        self.token = token or TELEGRAM_TOKEN
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+        self.session.mount("https://", adapter)
+        self._global = TokenBucket(TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_RATE)
+        self._chats = OrderedDict()
+        self._chats_lock = threading.Lock()
+        # Fila de saída: uma fila por chat (ordem preservada dentro do chat)
+        self._outbox = OrderedDict()
+        self._outbox_cond = threading.Condition()
+        self._outbox_size = 0
+        self._busy = set()           # chats com envio em andamento (um por vez por chat)
+        self._inflight = 0
+        self._senders = []
+        self._sender_lock = threading.Lock()
+
+    def _chat_bucket(self, chat_id):
+        with self._chats_lock:
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                # chat_id negativo = grupo/canal (limite bem menor)
+                rate = TELEGRAM_GROUP_RATE if str(chat_id).startswith("-") else TELEGRAM_CHAT_RATE
+                bucket = TokenBucket(rate, CHAT_BURST)
+                self._chats[chat_id] = bucket
+                while len(self._chats) > MAX_CHAT_BUCKETS:
+                    self._chats.popitem(last=False)
+            else:
+                self._chats.move_to_end(chat_id)
+            return bucket
+
+    # ==========================================================================
+    # 🌐 CHAMADA À API
+    # ==========================================================================
+
+    def call(self, method, payload):
+        """
+        Chama a API respeitando os limites. Retorna o `result` ou None.
+        Markdown inválido (400 "can't parse entities") -> reenvia em texto puro.
+        """
+        if not self.token:
+            return None
+        chat_id = payload.get("chat_id")
+        chat_bucket = self._chat_bucket(chat_id) if chat_id is not None and method not in UNTHROTTLED_METHODS else None
+        url = f"https://api.telegram.org/bot{self.token}/{method}"
+        payload = dict(payload)
+
+        for attempt in range(TELEGRAM_MAX_RETRIES + 1):
+            waited = self._global.acquire()
+            if chat_bucket:
+                waited += chat_bucket.acquire()
+            if waited > 0.05:
+                metrics.observe("telegram_throttle_wait_seconds", waited, method=method)
+            try:
+                resp = self.session.post(url, json=payload, timeout=TELEGRAM_TIMEOUT)
+            except Exception as e:
+                metrics.inc("telegram_api_calls_total", method=method, status="error")
+                print(f"⚠️ Telegram {method}: {e}")
+                if attempt < TELEGRAM_MAX_RETRIES:
+                    time.sleep(2 ** attempt)
+                    continue
+                return None
+
+            metrics.inc("telegram_api_calls_total", method=method, status=str(resp.status_code))
+            try:
+                data = resp.json()
+            except ValueError:
+                data = {}
+
+            if resp.status_code == 200 and data.get("ok"):
+                return data.get("result")
+
+            if resp.status_code == 429:
+                retry_after = float((data.get("parameters") or {}).get("retry_after", 1))
+                metrics.inc("telegram_rate_limited_total", method=method)
+                print(f"   🐢 Telegram 429 em {method}: aguardando {retry_after:.0f}s")
+                # Limite de chat pausa só o chat; sem chat pausa o bot todo
+                (chat_bucket or self._global).pause(retry_after)
+                continue
+
+            description = str(data.get("description", ""))
+            if resp.status_code == 400 and payload.get("parse_mode") and "parse" in description.lower():
+                payload.pop("parse_mode", None)
+                continue
+            if "message is not modified" in description:
+                return True
+            print(f"⚠️ Telegram {method} falhou ({resp.status_code}): {description[:200]}")
+            return None
+        return None
+
+    # ==========================================================================
+    # 📤 FILA DE SAÍDA
+    # ==========================================================================
+
+    def _next_ready(self):
+        """
+        (chat, chamada) do primeiro chat livre e com ficha, em rodízio; ou (None, espera)
+        com quanto falta para o próximo chat ficar pronto. Chamar com _outbox_cond.
+        """
+        min_wait = None
+        for chat_id, pending in self._outbox.items():
+            if chat_id in self._busy:
+                continue
+            method = pending[0][0]
+            throttled = chat_id is not None and method not in UNTHROTTLED_METHODS
+            wait = self._chat_bucket(chat_id).ready_in() if throttled else 0.0
+            if wait <= 0:
+                item = pending.popleft()
+                if pending:
+                    self._outbox.move_to_end(chat_id)
+                else:
+                    del self._outbox[chat_id]
+                self._busy.add(chat_id)
+                self._outbox_size -= 1
+                self._inflight += 1
+                return (chat_id, item), None
+            min_wait = wait if min_wait is None else min(min_wait, wait)
+        return None, min_wait
+
+    def _sender_loop(self):
+        while True:
+            with self._outbox_cond:
+                picked, wait = self._next_ready()
+                while picked is None:
+                    self._outbox_cond.wait(wait)
+                    picked, wait = self._next_ready()
+            chat_id, (method, payload) = picked
+            try:
+                self.call(method, payload)
+            except Exception as e:
+                print(f"⚠️ Telegram sender: {e}")
+            finally:
+                with self._outbox_cond:
+                    self._busy.discard(chat_id)
+                    self._inflight -= 1
+                    metrics.set_gauge("telegram_outbound_queue", self._outbox_size)
+                    self._outbox_cond.notify_all()
+
+    def enqueue(self, method, payload):
+        """Agenda a chamada nos senders em background (não bloqueia o callback)"""
+        with self._sender_lock:
+            self._senders = [t for t in self._senders if t.is_alive()]
+            while len(self._senders) < max(1, TELEGRAM_SENDERS):
+                t = threading.Thread(target=self._sender_loop, name=f"telegram-sender-{len(self._senders)}", daemon=True)
+                t.start()
+                self._senders.append(t)
+        with self._outbox_cond:
+            if self._outbox_size >= TELEGRAM_QUEUE_SIZE:
+                metrics.inc("telegram_outbound_dropped_total", method=method)
+                print(f"⚠️ Fila do Telegram cheia. {method} descartado.")
+                return
+            self._outbox.setdefault(payload.get("chat_id"), deque()).append((method, payload))
+            self._outbox_size += 1
+            metrics.set_gauge("telegram_outbound_queue", self._outbox_size)
+            self._outbox_cond.notify()
+
+    def flush(self, timeout=15):
+        """Espera a fila de saída esvaziar (shutdown)"""
+        if not self._senders:
+            return
+        with self._outbox_cond:
+            self._outbox_cond.wait_for(lambda: not self._outbox_size and not self._inflight, timeout)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = TelegramClient()
+        return _client
+
+
+# ==============================================================================
+# 🧰 ATALHOS
+# ==============================================================================
+
+def _dispatch(method, payload, wait):
+    if wait:
+        return get_client().call(method, payload)
+    get_client().enqueue(method, payload)
+    return None
+
+
+def send_message(chat_id, text, reply_markup=None, parse_mode="Markdown", wait=True):
+    """Envia mensagem. Síncrono retorna o message_id (ou None)."""
+    if not chat_id:
+        return None
+    payload = {"chat_id": chat_id, "text": str(text), "disable_web_page_preview": True}
+    if parse_mode:
+        payload["parse_mode"] = parse_mode
+    if reply_markup:
+        payload["reply_markup"] = reply_markup
+    result = _dispatch("sendMessage", payload, wait)
+    return result.get("message_id") if isinstance(result, dict) else None
+
+
+def edit_message(chat_id, message_id, text, reply_markup=None, parse_mode="Markdown", wait=True):
+    """Edita o texto de uma mensagem. Retorna True se o Telegram aceitou."""
+    if not chat_id or not message_id:
+        return False
+    payload = {"chat_id": chat_id, "message_id": message_id, "text": str(text), "disable_web_page_preview": True}
+    if parse_mode:
+        payload["parse_mode"] = parse_mode
+    if reply_markup:
+        payload["reply_markup"] = reply_markup
+    return bool(_dispatch("editMessageText", payload, wait))
+
+
+def answer_callback(callback_query_id, text=None):
+    """Para o 'loading' do botão (sempre síncrono e fora do limite por chat)"""
+    payload = {"callback_query_id": callback_query_id}
+    if text:
+        payload["text"] = text
+    return bool(get_client().call("answerCallbackQuery", payload))
+
+
+def flush(timeout=15):
+    if _client is not None:
+        _client.flush(timeout)
@@ -0,0 +1,190 @@
+"""
+TELEGRAM_WEBHOOK.PY - SalesMachine
+Recebimento de updates do Telegram via webhook (alternativa ao long-polling)
+
+Responsabilidades:
+- Servidor HTTP embutido que recebe os updates (POST no WEBHOOK_PATH)
+- Validação do header X-Telegram-Bot-Api-Secret-Token (WEBHOOK_SECRET obrigatório:
+  sem ele qualquer um que alcance a porta injeta updates)
+- Deduplicação por update_id (Telegram reenvia se não recebeu 200 a tempo)
+  - memória (padrão) ou Firestore (WEBHOOK_DEDUPE=firestore) para várias réplicas
+- Registrar / remover o webhook na API do Telegram (setWebhook / deleteWebhook)
+
+Com webhook várias réplicas do Agente 0 podem ficar atrás do mesmo load balancer:
+o Telegram distribui os updates entre as conexões (WEBHOOK_MAX_CONNECTIONS).
+"""
+
+import os
+import hmac
+import json
+import threading
+import datetime
+from collections import OrderedDict
+from datetime import timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+import requests
+
+import metrics
+
+load_dotenv()
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")           # Ex: https://router.exemplo.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT") or os.getenv("PORT") or "8080")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+WEBHOOK_DEDUPE = os.getenv("WEBHOOK_DEDUPE", "memory").lower()   # memory | firestore
+
+ALLOWED_UPDATES = ["message", "callback_query"]
+COLLECTION_SEEN_UPDATES = "telegram_updates_seen"
+SEEN_UPDATES_TTL_HOURS = 24
+MAX_BODY_BYTES = 1_000_000
+
+
+# ==============================================================================
+# 🔁 DEDUPLICAÇÃO
+# ==============================================================================
+
+class UpdateDeduper:
+    """Lembra os últimos update_id processados (LRU em memória + Firestore opcional)"""
+
+    def __init__(self, max_size=5000, db=None):
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._max = max_size
+        self._db = db if WEBHOOK_DEDUPE == "firestore" else None
+
+    def first_time(self, update_id):
+        """True se o update ainda não foi visto (e marca como visto)"""
+        if update_id is None:
+            return True
+        with self._lock:
+            if update_id in self._seen:
+                return False
+            self._seen[update_id] = True
+            if len(self._seen) > self._max:
+                self._seen.popitem(last=False)
+
+        if self._db is None:
+            return True
+        # create() falha se o doc já existe: só uma réplica processa o update
+        now = datetime.datetime.now(timezone.utc)
+        try:
+            with metrics.timer("firestore_op_seconds", op="create", collection=COLLECTION_SEEN_UPDATES):
+                self._db.collection(COLLECTION_SEEN_UPDATES).document(str(update_id)).create({
+                    "seen_at": now,
+                    "expires_at": now + datetime.timedelta(hours=SEEN_UPDATES_TTL_HOURS),
+                })
+            return True
+        except Exception as e:
+            if type(e).__name__ in ("AlreadyExists", "Conflict"):
+                return False
+            print(f"⚠️ Dedupe Firestore falhou ({e}). Processando mesmo assim.")
+            return True
+
+
+# ==============================================================================
+# 🌐 API DO TELEGRAM
+# ==============================================================================
+
+def set_webhook(token, url=None, secret=None):
+    """Registra o webhook. Retorna True se o Telegram aceitou."""
+    full_url = (url or WEBHOOK_URL).rstrip("/") + WEBHOOK_PATH
+    payload = {
+        "url": full_url,
+        "allowed_updates": ALLOWED_UPDATES,
+        "max_connections": WEBHOOK_MAX_CONNECTIONS,
+    }
+    if secret or WEBHOOK_SECRET:
+        payload["secret_token"] = secret or WEBHOOK_SECRET
+    try:
+        resp = requests.post(f"https://api.telegram.org/bot{token}/setWebhook", json=payload, timeout=15)
+        data = resp.json()
+        if data.get("ok"):
+            print(f"🔗 Webhook registrado: {full_url}")
+            return True
+        print(f"⚠️ setWebhook recusado: {data.get('description')}")
+    except Exception as e:
+        print(f"⚠️ setWebhook falhou: {e}")
+    return False
+
+
+def delete_webhook(token):
+    """Remove o webhook (o getUpdates não funciona com webhook ativo)"""
+    try:
+        requests.post(f"https://api.telegram.org/bot{token}/deleteWebhook", json={"drop_pending_updates": False}, timeout=15)
+    except Exception as e:
+        print(f"⚠️ deleteWebhook falhou: {e}")
+
+
+# ==============================================================================
+# 🖥️ SERVIDOR
+# ==============================================================================
+
+def _make_handler(process_update, deduper):
+    class _WebhookHandler(BaseHTTPRequestHandler):
+        def _reply(self, status, body=b"ok"):
+            self.send_response(status)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path == "/healthz":
+                self._reply(200)
+            else:
+                self._reply(404, b"not found")
+
+        def do_POST(self):
+            if self.path.split("?", 1)[0] != WEBHOOK_PATH:
+                self._reply(404, b"not found")
+                return
+            received = self.headers.get("X-Telegram-Bot-Api-Secret-Token") or ""
+            # Comparação em tempo constante (!= vaza o prefixo certo pelo tempo de resposta)
+            if not WEBHOOK_SECRET or not hmac.compare_digest(received.encode("utf-8"), WEBHOOK_SECRET.encode("utf-8")):
+                metrics.inc("webhook_requests_total", outcome="forbidden")
+                self._reply(403, b"forbidden")
+                return
+
+            length = int(self.headers.get("Content-Length") or 0)
+            if length <= 0 or length > MAX_BODY_BYTES:
+                metrics.inc("webhook_requests_total", outcome="bad_request")
+                self._reply(400, b"bad request")
+                return
+            try:
+                update = json.loads(self.rfile.read(length).decode("utf-8"))
+            except Exception:
+                metrics.inc("webhook_requests_total", outcome="bad_request")
+                self._reply(400, b"bad request")
+                return
+
+            # Responde antes de processar: o Telegram não espera o Gemini
+            self._reply(200)
+            if not deduper.first_time(update.get("update_id")):
+                metrics.inc("webhook_requests_total", outcome="duplicate")
+                return
+            metrics.inc("webhook_requests_total", outcome="accepted")
+            try:
+                process_update(update)
+            except Exception as e:
+                print(f"⚠️ Erro processando update {update.get('update_id')}: {e}")
+
+        def log_message(self, format, *args):
+            pass
+
+    return _WebhookHandler
+
+
+def serve(process_update, deduper=None, port=None, host="0.0.0.0"):
+    """Sobe o servidor do webhook e bloqueia (cada request roda na sua thread)"""
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET não configurado: webhook sem autenticação recusado")
+    deduper = deduper or UpdateDeduper()
+    server = ThreadingHTTPServer((host, port or WEBHOOK_PORT), _make_handler(process_update, deduper))
+    server.daemon_threads = True
+    print(f"📬 Webhook ouvindo em http://{host}:{port or WEBHOOK_PORT}{WEBHOOK_PATH}")
+    server.serve_forever()
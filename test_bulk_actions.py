@@ -0,0 +1,142 @@
+"""
+TEST_BULK_ACTIONS.PY - SalesMachine
+Descartar resto precisa pegar também os leads segurados na fila de espera do Agente 1 (QUEUED)
+
+Roda sem credenciais: Firestore e digest são trocados por versões em memória.
+    python -m unittest test_bulk_actions
+"""
+
+import sys
+import types
+import unittest
+
+
+# ==============================================================================
+# 🧪 FIRESTORE EM MEMÓRIA (só o que database.py usa aqui)
+# ==============================================================================
+
+class FakeDoc:
+    def __init__(self, store, doc_id):
+        self.store = store
+        self.id = doc_id
+
+    def set(self, data, merge=False):
+        current = self.store.get(self.id, {}) if merge else {}
+        current.update(data)
+        self.store[self.id] = current
+
+    def update(self, data):
+        self.store[self.id].update(data)
+
+    def to_dict(self):
+        return dict(self.store[self.id])
+
+
+class FakeQuery:
+    def __init__(self, store, field, value):
+        self.store = store
+        self.field = field
+        self.value = value
+
+    def stream(self):
+        return [FakeDoc(self.store, k) for k, v in self.store.items() if v.get(self.field) == self.value]
+
+
+class FakeCollection:
+    def __init__(self, store):
+        self.store = store
+
+    def document(self, doc_id):
+        return FakeDoc(self.store, doc_id)
+
+    def where(self, field, op, value):
+        return FakeQuery(self.store, field, value)
+
+
+class FakeBatch:
+    def __init__(self):
+        self.ops = []
+
+    def update(self, ref, data):
+        self.ops.append((ref, data))
+
+    def commit(self):
+        for ref, data in self.ops:
+            ref.update(data)
+
+
+class FakeDB:
+    def __init__(self):
+        self.collections = {}
+
+    def collection(self, name):
+        return FakeCollection(self.collections.setdefault(name, {}))
+
+    def batch(self):
+        return FakeBatch()
+
+
+def _install_fakes():
+    """google-cloud-firestore e dotenv podem não estar instalados no ambiente de teste"""
+    if "google.cloud.firestore" not in sys.modules:
+        try:
+            from google.cloud import firestore  # noqa: F401
+        except ImportError:
+            firestore = types.ModuleType("google.cloud.firestore")
+            firestore.Client = lambda project=None: None
+            google = sys.modules.setdefault("google", types.ModuleType("google"))
+            cloud = sys.modules.setdefault("google.cloud", types.ModuleType("google.cloud"))
+            google.cloud = cloud
+            cloud.firestore = firestore
+            sys.modules["google.cloud.firestore"] = firestore
+    try:
+        import dotenv  # noqa: F401
+    except ImportError:
+        dotenv = types.ModuleType("dotenv")
+        dotenv.load_dotenv = lambda *a, **k: None
+        sys.modules["dotenv"] = dotenv
+
+    digest = types.ModuleType("digest")
+    digest.marked = []
+    digest.mark_leads = lambda search_id, states, immediate=False: digest.marked.append((search_id, states))
+    sys.modules["digest"] = digest
+    return digest
+
+
+digest = _install_fakes()
+import database  # noqa: E402
+import bulk_actions  # noqa: E402
+
+
+class DiscardRestTest(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeDB()
+        database.db = self.db
+        digest.marked.clear()
+
+    def leads(self):
+        return self.db.collections[database.COLLECTION_NAME]
+
+    def test_discard_rest_marks_queued_leads(self):
+        database.save_new_lead("decidir.com.br", "crm", search_id="s1")
+        self.leads()["decidir.com.br"]["status"] = "WAITING_DECISION"
+        database.save_queued_lead("fila.com.br", "crm", {"domain": "fila.com.br", "search_id": "s1", "chat_id": 42})
+        database.save_queued_lead("outra.com.br", "crm", {"domain": "outra.com.br", "search_id": "s2", "chat_id": 42})
+
+        self.assertEqual(bulk_actions.discard_rest("s1"), 2)
+
+        self.assertEqual(self.leads()["fila.com.br"]["status"], "DISCARDED_BY_USER")
+        self.assertEqual(self.leads()["decidir.com.br"]["status"], "DISCARDED_BY_USER")
+        self.assertEqual(self.leads()["outra.com.br"]["status"], "QUEUED")
+        self.assertEqual(digest.marked, [("s1", {"decidir.com.br": "discarded", "fila.com.br": "discarded"})])
+
+    def test_queued_lead_keeps_search_and_chat_at_top_level(self):
+        database.save_queued_lead("fila.com.br", "crm", {"domain": "fila.com.br", "search_id": "s1", "chat_id": 42})
+
+        doc = self.leads()["fila.com.br"]
+        self.assertEqual((doc["search_id"], doc["chat_id"]), ("s1", 42))
+        self.assertEqual(database.get_leads_by_search("s1", {"QUEUED"})[0]["domain"], "fila.com.br")
+
+
+if __name__ == "__main__":
+    unittest.main()
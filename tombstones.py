@@ -0,0 +1,130 @@
+"""
+TOMBSTONES.PY - SalesMachine
+Cancelamento de buscas (/cancel) respeitado por todos os agentes
+
+Responsabilidades:
+- Gravar a lápide da busca (`search_tombstones/<search_id>`, com TTL via expires_at)
+- Consulta barata antes de cada etapa cara: cancelada = cache local para sempre;
+  "não cancelada" = cache local por TOMBSTONE_CACHE_SECONDS
+- Contabilizar o trabalho evitado por etapa (métrica + avoided.<etapa> na lápide)
+- Resumo do que o cancelamento poupou
+
+Uso nos agentes:
+    if tombstones.check(data.get("search_id"), "agent_2_fetch"):
+        message.ack()   # ack-drop: nada de retry para trabalho cancelado
+        return
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+import metrics
+import database
+
+load_dotenv()
+
+TOMBSTONE_CACHE_SECONDS = float(os.getenv("TOMBSTONE_CACHE_SECONDS", "15"))
+TOMBSTONE_TTL_HOURS = float(os.getenv("TOMBSTONE_TTL_HOURS", "72"))
+MAX_CACHED_SEARCHES = 2000
+
+# Nome amigável de cada contador no resumo do /cancel
+STAGE_LABELS = {
+    "pending_leads": "leads pendentes descartados",
+    "agent_1_search": "buscas no Perplexity",
+    "agent_1_publish": "leads não enviados à esteira",
+    "agent_2_fetch": "sites não analisados",
+    "agent_3_enrich": "enriquecimentos pagos",
+    "agent_4_copies": "gerações de copy",
+}
+
+# Resultado de cancel()
+CANCELLED = "cancelled"
+ALREADY_CANCELLED = "already_cancelled"
+CANCEL_FAILED = "failed"
+
+_lock = threading.Lock()
+_cancelled = set()
+_not_cancelled = OrderedDict()   # search_id -> instante da última consulta negativa
+
+
+def cancel(search_id, chat_id):
+    """
+    Grava a lápide. Retorna CANCELLED, ALREADY_CANCELLED ou CANCEL_FAILED
+    (gravação falhou: só este processo para, as outras réplicas seguem com a busca).
+    """
+    with _lock:
+        _cancelled.add(search_id)
+        _not_cancelled.pop(search_id, None)
+    created = database.save_tombstone(search_id, chat_id, TOMBSTONE_TTL_HOURS)
+    if created is None:
+        metrics.inc("searches_cancel_failed_total")
+        return CANCEL_FAILED
+    if created:
+        metrics.inc("searches_cancelled_total")
+        return CANCELLED
+    return ALREADY_CANCELLED
+
+
+def owned_by(search_id, chat_id):
+    """A busca é deste chat? (última busca do chat ou dono do digest)"""
+    last_search_id, _ = database.get_chat_last_search(chat_id)
+    if last_search_id == search_id:
+        return True
+    owner = (database.get_digest(search_id) or {}).get("chat_id")
+    return owner is not None and str(owner) == str(chat_id)
+
+
+def is_cancelled(search_id):
+    """Busca foi cancelada? (no máximo 1 leitura no Firestore a cada TOMBSTONE_CACHE_SECONDS)"""
+    if not search_id:
+        return False
+    now = time.monotonic()
+    with _lock:
+        if search_id in _cancelled:
+            return True
+        checked_at = _not_cancelled.get(search_id)
+        if checked_at is not None and now - checked_at < TOMBSTONE_CACHE_SECONDS:
+            return False
+
+    cancelled = database.get_tombstone(search_id) is not None
+    with _lock:
+        if cancelled:
+            _cancelled.add(search_id)
+            _not_cancelled.pop(search_id, None)
+        else:
+            _not_cancelled[search_id] = now
+            _not_cancelled.move_to_end(search_id)
+            while len(_not_cancelled) > MAX_CACHED_SEARCHES:
+                _not_cancelled.popitem(last=False)
+    return cancelled
+
+
+def record_avoided(search_id, stage, amount=1):
+    """Soma trabalho que deixou de ser feito por causa do cancelamento"""
+    if amount <= 0:
+        return
+    metrics.inc("cancelled_work_avoided_total", amount, stage=stage)
+    database.increment_tombstone_avoided(search_id, stage, amount)
+
+
+def check(search_id, stage, amount=1):
+    """is_cancelled + record_avoided: True = descartar o trabalho"""
+    if not is_cancelled(search_id):
+        return False
+    print(f"   🛑 Busca {search_id} cancelada. Pulando ({stage}).")
+    record_avoided(search_id, stage, amount)
+    return True
+
+
+def avoided_report(search_id):
+    """Texto com o trabalho evitado até agora"""
+    tombstone = database.get_tombstone(search_id) or {}
+    avoided = {k: v for k, v in (tombstone.get("avoided") or {}).items() if v}
+    if not avoided:
+        return "Nenhuma etapa precisou ser interrompida ainda."
+    lines = [f"• {STAGE_LABELS.get(stage, stage)}: {count}" for stage, count in sorted(avoided.items())]
+    return "Trabalho evitado:\n" + "\n".join(lines)
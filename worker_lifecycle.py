@@ -0,0 +1,219 @@
+"""
+WORKER_LIFECYCLE.PY - SalesMachine
+Ciclo de vida compartilhado dos agentes assinantes (Agentes 1-4)
+
+Responsabilidades:
+- Subir uma ou mais "faixas" (assinaturas) no mesmo processo
+- SIGTERM/SIGINT: para de puxar na hora. Faixas comuns: cancel() com
+  await_callbacks_on_shutdown=True fecha o stream mas mantém o dispatcher vivo até os
+  callbacks em andamento terminarem (o ack deles chega ao servidor). Faixas com fila justa:
+  o scheduler pausa e segura o que chega sem nack; com o flow control cheio o client para
+  de puxar, e o stream só fecha depois da drenagem
+- Espera os callbacks em andamento até DRAIN_TIMEOUT_SECONDS
+- Grava a entrada de cada mensagem quando RECORD_STAGES está ativo (stage_recorder.py)
+- Dá nack uma única vez no que sobrou (o Pub/Sub reentrega, em geral para outra réplica),
+  fecha os streams e só então roda os flushers (publishes pendentes, gravações, Telegram...)
+- Sai com código limpo (0 = drenou tudo, 1 = teve nack forçado)
+
+Uso:
+    exit_code = worker_lifecycle.run("agent_2", subscriber, [
+        {"subscription": subscription_path, "callback": callback, "flow_control": flow_control},
+    ], flushers=[publisher.stop])
+    sys.exit(exit_code)
+"""
+
+import os
+import sys
+import signal
+import threading
+import time
+from dotenv import load_dotenv
+
+import metrics
+import stage_recorder
+import telegram_client
+
+load_dotenv()
+
+DRAIN_TIMEOUT_SECONDS = float(os.getenv("DRAIN_TIMEOUT_SECONDS", "25"))
+
+EXIT_CLEAN = 0
+EXIT_FORCED_NACK = 1
+
+
+class InflightTracker:
+    """Rastreia mensagens em processamento para drenar no shutdown"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._messages = {}
+        self._idle = threading.Condition(self._lock)
+        self.draining = threading.Event()
+
+    def wrap(self, callback):
+        def wrapper(message):
+            if self.draining.is_set():
+                # Já estava na fila do executor quando o stream fechou: devolve (uma vez só)
+                message.nack()
+                return
+            key = id(message)
+            with self._lock:
+                self._messages[key] = message
+            try:
+                callback(message)
+            finally:
+                with self._lock:
+                    self._messages.pop(key, None)
+                    if not self._messages:
+                        self._idle.notify_all()
+        return wrapper
+
+    def count(self):
+        with self._lock:
+            return len(self._messages)
+
+    def wait_idle(self, timeout):
+        """Espera zerar os callbacks em andamento. Retorna True se zerou a tempo."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._messages:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def nack_remaining(self):
+        with self._lock:
+            pending = list(self._messages.values())
+            self._messages.clear()
+        for message in pending:
+            try:
+                message.nack()
+            except Exception:
+                pass
+        return len(pending)
+
+
+def _recording(stage, callback):
+    """Grava a entrada do estágio (opt-in via RECORD_STAGES) antes de processar"""
+    if not stage_recorder.is_enabled(stage):
+        return callback
+
+    def wrapper(message):
+        stage_recorder.record(stage, message)
+        callback(message)
+    return wrapper
+
+
+def run(agent_name, subscriber, lanes, flushers=(), drain_timeout=None, on_drain=()):
+    """
+    Roda as faixas até receber SIGTERM/SIGINT e então drena.
+    Retorna EXIT_CLEAN; se precisar dar nack forçado, encerra o processo com EXIT_FORCED_NACK.
+
+    lanes: lista de dicts com subscription, callback e opcionalmente
+           flow_control, scheduler, stage (label das métricas) e fair
+           (fair_scheduler.FairScheduler: fila justa por tenant antes do callback).
+    flushers: funções chamadas depois da drenagem (ex: publisher.stop).
+    on_drain: funções chamadas assim que a drenagem começa (ex: soltar filas internas).
+    """
+    drain_timeout = DRAIN_TIMEOUT_SECONDS if drain_timeout is None else drain_timeout
+    tracker = InflightTracker()
+    stop_requested = threading.Event()
+
+    def request_stop(signum, frame):
+        if not stop_requested.is_set():
+            print(f"\n🛑 [{agent_name}] Sinal {signal.Signals(signum).name} recebido. Drenando...")
+        stop_requested.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    futures = []
+    fair_futures = []
+    fair_schedulers = []
+    for lane in lanes:
+        stage = lane.get("stage", agent_name)
+        handler = tracker.wrap(_recording(stage, metrics.instrument_callback(stage, lane["callback"])))
+        fair = lane.get("fair")
+        if fair is not None:
+            # O Pub/Sub só enfileira; os workers do scheduler rodam o handler (e o tracker os vê)
+            fair.start(handler)
+            if fair not in fair_schedulers:
+                fair_schedulers.append(fair)
+            handler = fair.submit
+        # cancel() espera os callbacks antes de desligar dispatcher/leaser
+        kwargs = {"callback": handler, "await_callbacks_on_shutdown": True}
+        if lane.get("flow_control") is not None:
+            kwargs["flow_control"] = lane["flow_control"]
+        if lane.get("scheduler") is not None:
+            kwargs["scheduler"] = lane["scheduler"]
+        future = subscriber.subscribe(lane["subscription"], **kwargs)
+        futures.append(future)
+        if fair is not None:
+            fair_futures.append(future)
+
+    # Espera sinal ou queda de algum stream (erro fatal de pull)
+    while not stop_requested.wait(1):
+        failed = [f for f in futures if f.done()]
+        if failed:
+            try:
+                failed[0].result()
+            except Exception as e:
+                print(f"🔥 [{agent_name}] Stream de pull caiu: {e}")
+            stop_requested.set()
+
+    # 1. Para de puxar. Faixa comum: cancel() fecha o stream já; o shutdown do client espera
+    #    os callbacks em andamento com o dispatcher vivo. Faixa justa: o callback do Pub/Sub
+    #    só enfileira, então o stream fica aberto (dispatcher vivo para os workers) e o
+    #    scheduler segura o que chega sem nack até o fim.
+    tracker.draining.set()
+    for f in futures:
+        if f not in fair_futures:
+            f.cancel()
+    for hook in [f.pause for f in fair_schedulers] + list(on_drain):
+        try:
+            hook()
+        except Exception as e:
+            print(f"⚠️ [{agent_name}] Erro no on_drain: {e}")
+
+    # 2. Espera os callbacks em andamento
+    inflight = tracker.count()
+    if inflight:
+        print(f"⏳ [{agent_name}] Aguardando {inflight} callback(s) em andamento (até {drain_timeout:.0f}s)...")
+    drained = tracker.wait_idle(drain_timeout)
+
+    # 3. Nack no que sobrou, com o dispatcher ainda vivo (uma vez só, stream já parado)
+    forced = 0 if drained else tracker.nack_remaining()
+    for fair in fair_schedulers:
+        fair.release()
+
+    # 4. Fecha os streams das faixas justas: cancel() + result() esperam o envio dos acks/nacks
+    for f in fair_futures:
+        f.cancel()
+    for f in futures:
+        try:
+            f.result(timeout=5 if forced else drain_timeout)
+        except Exception:
+            pass
+    try:
+        subscriber.close()
+    except Exception:
+        pass
+
+    # 5. Flush de publishes / gravações pendentes
+    for flush in list(flushers) + [stage_recorder.flush, telegram_client.flush]:
+        try:
+            flush()
+        except Exception as e:
+            print(f"⚠️ [{agent_name}] Erro no flush: {e}")
+
+    if forced:
+        metrics.inc("shutdown_forced_nacks_total", forced, agent=agent_name)
+        print(f"⚠️ [{agent_name}] {forced} mensagem(ns) devolvida(s) com nack. Saindo.")
+        # Threads do executor do Pub/Sub ainda rodando seguram o sys.exit (join no atexit):
+        # sai na hora, as mensagens já foram devolvidas.
+        sys.stdout.flush()
+        os._exit(EXIT_FORCED_NACK)
+    print(f"👋 [{agent_name}] Drenado com sucesso. Saindo.")
+    return EXIT_CLEAN